@@ -1,25 +1,36 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import os
 import shutil
-import json
+import threading
 import asyncio
+import hashlib
+import uuid
 import pandas as pd
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 from fastapi.responses import StreamingResponse
 
 from .services.parser import IBKRParser
 from .services.merger import DataMerger
 from .services.engine import PortfolioEngine
 from .services.store import StoreService
-from .services.market import MarketDataService
+from .services.market import get_market_service
+from .services.forex import get_forex_service
 from .services.options import OptionsService
 from .services.activity_parser import ActivityParser
-from .models import MetadataUpdate, WatchlistAdd, OptionTrade, OptionUpdate
+from .services.refresher import PriceRefresher
+from .services.nav import NAVHistory
+from .services.risk import RiskService
+from .services.projection import LeverageProjection
+from .services.whatif import WhatIfSimulator
+from .services.stress import StressTester
+from .responses import FastJSONResponse, dumps
+from .models import MetadataUpdate, WatchlistAdd, OptionTrade, OptionUpdate, WhatIfRequest, StressRequest
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # 1. CORS Setup
 app.add_middleware(
@@ -28,66 +39,283 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified"],
 )
 
 # Services (Global Instances)
+# Market & FX data layer is shared process-wide and injected into the engine
+market = get_market_service()
+forex = get_forex_service()
 parser = IBKRParser()
 merger = DataMerger()
-engine = PortfolioEngine() 
+engine = PortfolioEngine(market_data=market, forex=forex)
 store = StoreService()
-market = MarketDataService()
 options_service = OptionsService()
 # Determine absolute path to backend/data
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 data_dir = os.path.join(base_dir, "data")
 activity_parser = ActivityParser(data_dir)
+# Daily NAV series (persisted in data/nav/)
+nav = NAVHistory(engine, os.path.join(data_dir, "nav"))
+risk = RiskService(market, forex)
+projection = LeverageProjection(risk, engine.margin)
+whatif = WhatIfSimulator(engine, market)
+stress = StressTester(engine, market, forex)
 
-@app.get("/api/performance")
-async def get_performance():
-    """Get aggregated performance data from Activity Statements."""
-    try:
-        data = activity_parser.parse_all()
-        return data
-    except Exception as e:
-        print(f"Error parsing activity: {e}")
-        return {"trades": [], "interest": [], "error": str(e)}
+# Parsed statements are re-used while the CSV files are unchanged
+_statements = {"hash": None, "merged": None}
+_statements_lock = threading.Lock()  # The refresher loads statements from an executor thread
 
-@app.get("/api/portfolio")
-async def get_portfolio():
-    # 1. Setup Data Paths
-    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    data_dir = os.path.join(base_dir, "backend", "data")
+def _files_fingerprint():
+    """CSVs in data/ and a stable digest of their filename + mtime + size (survives restarts). Returns (files, "") if none."""
     if not os.path.exists(data_dir): os.makedirs(data_dir)
-
-    # 2. Parse CSVs
     found_files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.endswith('.csv')]
     if not found_files:
-        return {"kpi": {"net_liquidity_usd": 0, "net_liquidity_czk": 0, "cash_balance_usd": 0}, "positions": [], "status": "empty"}
+        return found_files, ""
 
-    # Generate File Hash (for caching)
-    # Concatenate filename + mtime + size
     file_stats = []
     for f in sorted(found_files):
         stats = os.stat(f)
         file_stats.append(f"{f}_{stats.st_mtime}_{stats.st_size}")
-    files_hash = str(hash("".join(file_stats)))
+    return found_files, hashlib.sha1("".join(file_stats).encode()).hexdigest()
 
-    parsed_data = []
-    for fpath in found_files:
+def _load_statements():
+    """Parses and merges all CSVs in data/. Returns (merged, files_hash) or (None, "") if none."""
+    found_files, files_hash = _files_fingerprint()
+    if not found_files:
+        return None, ""
+    with _statements_lock:
+        if files_hash == _statements["hash"]:
+            return _statements["merged"], files_hash
+
+        parsed_data = []
+        for fpath in found_files:
+            try:
+                parsed_data.append(parser.parse_csv(fpath))
+            except Exception as e:
+                print(f"Error parsing {fpath}: {e}")
+
+        if not parsed_data:
+            return None, files_hash
+
+        merged = merger.merge(parsed_data)
+        _statements.update({"hash": files_hash, "merged": merged})
+        return merged, files_hash
+
+def _tracked_symbols() -> List[str]:
+    """Symbols kept warm by the background refresher: Open Positions, watchlist and FX pairs. Blocking (runs in an executor)."""
+    symbols = []
+    currencies = set(engine.DEFAULT_CURRENCIES)
+    merged, _ = _load_statements()
+    if merged:
+        df_open_pos = merged.get('Open Positions', pd.DataFrame())
+        if not df_open_pos.empty:
+            symbols.extend(df_open_pos['Symbol'].dropna().unique().tolist())
+            currencies.update(str(c).strip() for c in df_open_pos.get('Currency', pd.Series(dtype=str)).dropna())
+    symbols.extend(store.get_watchlist())
+    symbols.extend(market.fx_symbol(c) for c in currencies if c and c != 'CZK')
+    return symbols
+
+refresher = PriceRefresher(market, _tracked_symbols)
+
+# Conditional GET: ETags are derived from the inputs a response is computed from, so an
+# unchanged poll is answered 304 without running the engine. The boot id keeps ETags from
+# a previous process (whose generation counters also started at 0) from matching.
+_BOOT_ID = uuid.uuid4().hex
+_last_modified: Dict[str, tuple] = {}  # {route: (etag, http date the etag was first served)}
+
+def _validators(route: str, *inputs) -> Dict[str, str]:
+    """ETag / Last-Modified / Cache-Control headers for a response computed from `inputs`."""
+    etag = '"' + hashlib.sha1(repr((_BOOT_ID, route, inputs)).encode()).hexdigest()[:24] + '"'
+    seen = _last_modified.get(route)
+    if seen is None or seen[0] != etag:
+        seen = _last_modified[route] = (etag, formatdate(usegmt=True))
+    # no-cache: clients may keep the body but must revalidate on every request
+    return {"ETag": etag, "Last-Modified": seen[1], "Cache-Control": "no-cache"}
+
+def _not_modified(request: Request, headers: Dict[str, str]) -> Optional[Response]:
+    """A 304 response if the client's copy is current (If-None-Match wins over If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        fresh = headers["ETag"] in tags or "*" in tags
+    else:
         try:
-            parsed_data.append(parser.parse_csv(fpath))
-        except Exception as e:
-            print(f"Error parsing {fpath}: {e}")
-    
-    if not parsed_data:
-         return {"kpi": {"net_liquidity_usd": 0, "net_liquidity_czk": 0, "cash_balance_usd": 0}, "positions": [], "status": "empty"}
+            since = request.headers.get("if-modified-since")
+            fresh = since is not None and parsedate_to_datetime(since) >= parsedate_to_datetime(headers["Last-Modified"])
+        except (TypeError, ValueError):
+            fresh = False
+    return Response(status_code=304, headers=headers) if fresh else None
 
-    # 3. Process
-    merged = merger.merge(parsed_data)
+def _portfolio_validators() -> Dict[str, str]:
+    _, files_hash = _files_fingerprint()
+    store.load()  # picks up on-disk metadata edits, so store.version is current
+    today = datetime.now().strftime("%Y-%m-%d")  # FX fallbacks and option time decay are per day
+    # Only valuation inputs: quote updates for other symbols and FX fetched elsewhere don't change the body
+    return _validators("portfolio", files_hash, store.version, engine.valuation_inputs(), today)
+
+@app.on_event("startup")
+async def start_refresher():
+    refresher.start()
+
+@app.on_event("shutdown")
+async def stop_refresher():
+    await refresher.stop()
+    # Write pending cache segments
+    market.cache.close()
+    market.failures.close()
+    market.instruments.close()
+    market.quote_reference.close()
+    engine.option_pricer.close()
+    engine.locations.close()
+    forex.cache.close()
+
+@app.get("/api/performance")
+async def get_performance(request: Request):
+    """Get aggregated performance data from Activity Statements."""
+    headers = _validators("performance", _files_fingerprint()[1])
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    try:
+        data = activity_parser.parse_all()
+        return FastJSONResponse(data, headers=headers)
+    except Exception as e:
+        print(f"Error parsing activity: {e}")
+        return {"trades": [], "interest": [], "error": str(e)}
+
+async def _compute_portfolio() -> Dict[str, Any]:
+    # 1. Parse CSVs (cached by file hash)
+    merged, files_hash = _load_statements()
+    if not merged:
+        return {"kpi": {"net_liquidity_usd": 0, "net_liquidity_czk": 0, "cash_balance_usd": 0}, "positions": [], "status": "empty"}
+
+    # 2. Process
     metadata = store.load()
-    result = await engine.process(merged, metadata, files_hash=files_hash)
+    result = await engine.process(merged, metadata, files_hash=files_hash, metadata_version=store.version)
     return result
 
+@app.get("/api/portfolio")
+async def get_portfolio(request: Request):
+    # Validators are taken before computing: if an input moves mid-computation,
+    # the next poll sees a new ETag and recomputes rather than keeping a stale body
+    headers = _portfolio_validators()
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    return FastJSONResponse(await _compute_portfolio(), headers=headers)
+
+@app.get("/api/nav")
+async def get_nav(request: Request, range: str = "max"):
+    """Daily NAV (CZK/USD), positions/cash split and net deposits; columnar like the OHLCV endpoint."""
+    merged, files_hash = _load_statements()
+    if not merged:
+        return {"dates": [], "nav_czk": [], "nav_usd": [], "status": "empty"}
+    series = await nav.history(merged, files_hash)
+    headers = _validators(f"nav:{range}", files_hash, series['updated_at'])
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    return FastJSONResponse(nav.window(series, range), headers=headers)
+
+@app.get("/api/risk")
+async def get_risk(benchmark: str = "SPY", period: str = "1y"):
+    """Volatility, beta, VaR/CVaR, risk contributions and correlations of the current holdings."""
+    _, files_hash = _load_statements()
+    portfolio = await _compute_portfolio()
+    if not portfolio.get("positions"):
+        return {"status": "empty"}
+    return FastJSONResponse(await risk.analyze(portfolio["positions"], files_hash, benchmark.upper(), period))
+
+@app.get("/api/projection")
+async def get_projection(horizon: int = 250, paths: int = 10_000, method: str = "bootstrap", period: str = "1y",
+                         thresholds: str = "1.5,2", seed: Optional[int] = None):
+    """Monte Carlo NAV/leverage fan charts and probabilities of crossing leverage thresholds (comma-separated)."""
+    # Memory grows with paths x horizon: refuse oversized runs before doing any work
+    if max(paths, 100) * max(horizon, 1) > projection.MAX_CELLS:
+        return FastJSONResponse({"status": "error", "message": f"paths x horizon must be at most {projection.MAX_CELLS:,}"},
+                                status_code=400)
+    portfolio = await _compute_portfolio()
+    if not portfolio.get("positions"):
+        return {"status": "empty"}
+    try:
+        levels = [float(t) for t in thresholds.split(",") if t.strip()]
+    except ValueError:
+        return {"status": "error", "message": "thresholds must be comma-separated numbers"}
+    return FastJSONResponse(await projection.simulate(portfolio, horizon, paths, method, period, levels, seed))
+
+# Live portfolio stream: keep-alive comment interval (seconds)
+PORTFOLIO_KEEPALIVE = 30.0
+
+# Stream state shared by all clients: the portfolio is computed once per (quote generation, upload count)
+# and each delta is encoded once per (previous, current) pair, then fanned out
+_stream = {"uploads": 0, "key": None, "task": None, "events": {}}
+_uploaded = asyncio.Condition()
+
+def _stream_key() -> tuple:
+    return market.generation, _stream["uploads"]
+
+async def _shared_portfolio(key: tuple) -> Dict[str, Any]:
+    task = _stream["task"]
+    if _stream["key"] != key or task is None or (task.done() and task.exception() is not None):
+        task = asyncio.ensure_future(_compute_portfolio())
+        _stream.update({"key": key, "task": task, "events": {}})
+    # One client disconnecting must not cancel the computation the others are waiting on
+    return await asyncio.shield(task)
+
+async def _wait_for_upload(uploads: int, timeout: float):
+    async with _uploaded:
+        try:
+            await asyncio.wait_for(_uploaded.wait_for(lambda: _stream["uploads"] > uploads), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+async def _wait_for_change(key: tuple, timeout: float) -> tuple:
+    """Waits until quotes update or statements are uploaded (or timeout). Returns the current key."""
+    waiters = [asyncio.ensure_future(market.wait_for_update(key[0], timeout)),
+               asyncio.ensure_future(_wait_for_upload(key[1], timeout))]
+    try:
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+    return _stream_key()
+
+@app.get("/api/portfolio/stream")
+async def stream_portfolio():
+    """
+    SSE: one full 'snapshot' event, then 'delta' events (changed position fields by row,
+    new row order, KPIs and FX rates) whenever the price cache updates; a new snapshot after an upload.
+    Payloads go through the same encoder as /api/portfolio (NaN -> null).
+    """
+    async def event_generator():
+        key = _stream_key()
+        snapshot = await _shared_portfolio(key)
+        yield f"event: snapshot\ndata: {dumps(snapshot).decode()}\n\n"
+
+        while True:
+            latest = await _wait_for_change(key, PORTFOLIO_KEEPALIVE)
+            if latest == key:
+                yield ": keepalive\n\n"
+                continue
+
+            current = await _shared_portfolio(latest)
+            events = _stream["events"] if _stream["key"] == latest else {}
+            event = events.get(key)
+            if event is None:
+                delta = engine.diff(snapshot, current)
+                if delta is None:
+                    event = f"event: snapshot\ndata: {dumps(current).decode()}\n\n"
+                elif delta["kpi"] or delta["positions"] or delta["fx_rates"] or delta["order"]:
+                    event = f"event: delta\ndata: {dumps(delta).decode()}\n\n"
+                else:
+                    event = ""
+                events[key] = event
+            if event:
+                yield event
+            key, snapshot = latest, current
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
 @app.post("/api/upload")
 async def upload_csv(files: List[UploadFile] = File(...)):
     base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -100,6 +328,11 @@ async def upload_csv(files: List[UploadFile] = File(...)):
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         saved_files.append(file.filename)
+
+    # Wake live streams: they push a fresh snapshot (or delta) of the new statements
+    async with _uploaded:
+        _stream["uploads"] += 1
+        _uploaded.notify_all()
     return {"status": "success", "files": saved_files}
 
 @app.get("/api/quote")
@@ -112,20 +345,44 @@ async def get_quote(symbol: str):
     if not data:
         return {"symbol": symbol, "price": 0.0, "currency": "USD", "found": False}
         
-    # Basic currency inference (could be moved to MarketDataService)
-    currency = "USD"
-    if ".DE" in symbol or ".PA" in symbol: currency = "EUR"
-    elif ".ST" in symbol: currency = "SEK"
-    elif ".L" in symbol: currency = "GBP"
-        
     return {
         "symbol": symbol,
         "price": data.get('price'),
         "name": data.get('name'),
-        "currency": currency,
+        "currency": data.get('currency', "USD"),
+        "stale": data.get('stale', False),
+        "age_seconds": data.get('age_seconds'),
         "found": True
     }
 
+@app.post("/api/whatif")
+async def post_whatif(request: WhatIfRequest):
+    """Leverage, NAV, cash, weights and margin interest for many hypothetical trade sets at once (columnar per scenario)."""
+    portfolio = await _compute_portfolio()
+    return FastJSONResponse(await whatif.evaluate(
+        portfolio,
+        [t.dict() for t in request.base],
+        [[t.dict() for t in s] for s in request.scenarios],
+        [g.dict() for g in request.grid],
+    ))
+
+@app.get("/api/stress")
+async def get_stress(max_leverage: float = 1.5):
+    """Predefined shock scenarios and historical replays: post-shock NAV, leverage and cash requirement."""
+    portfolio = await _compute_portfolio()
+    if not portfolio.get("positions"):
+        return {"status": "empty"}
+    return FastJSONResponse(await stress.run(portfolio, stress.presets(), max_leverage))
+
+@app.post("/api/stress")
+async def post_stress(request: StressRequest):
+    """Custom shock vectors / replay windows (plus the presets unless presets=false)."""
+    portfolio = await _compute_portfolio()
+    if not portfolio.get("positions"):
+        return {"status": "empty"}
+    scenarios = (stress.presets() if request.presets else []) + [s.dict() for s in request.scenarios]
+    return FastJSONResponse(await stress.run(portfolio, scenarios, request.max_leverage))
+
 @app.post("/api/metadata")
 def update_metadata(update: MetadataUpdate):
     data = update.dict(exclude_unset=True)
@@ -150,8 +407,27 @@ def remove_from_watchlist(symbol: str):
     return store.remove_from_watchlist(symbol.upper())
 
 @app.get("/api/market-data/{symbol}/ohlcv")
-async def get_ohlcv(symbol: str, range: str = "1y"):
-    return await market.get_ohlcv(symbol.upper(), range)
+async def get_ohlcv(symbol: str, range: str = "1y", format: str = "rows"):
+    return FastJSONResponse(await market.get_ohlcv(symbol.upper(), range, format))
+
+@app.get("/api/market-data/cache-stats")
+def get_cache_stats():
+    return market.cache_stats()
+
+@app.get("/api/market-data/failures")
+def get_suppressed_symbols():
+    """Symbols currently in failure backoff (not fetched until retry_at)."""
+    return market.failures.suppressed()
+
+@app.delete("/api/market-data/failures/{symbol}")
+def reset_symbol_failures(symbol: str):
+    if market.failures.clear(symbol.upper()):
+        return {"status": "success"}
+    return {"status": "error", "message": "Symbol not suppressed"}
+
+# Watchlist stream: parallel fetches and per-symbol timeout (seconds)
+WATCHLIST_CONCURRENCY = 8
+WATCHLIST_TIMEOUT = 15.0
 
 @app.get("/api/watchlist/stream")
 async def stream_watchlist(range: str = "1m"):
@@ -160,21 +436,44 @@ async def stream_watchlist(range: str = "1m"):
         if not watchlist:
              yield f"event: DONE\ndata: \n\n"
              return
-        
-        # Parallel fetch
-        tasks = [market.get_watchlist_data(symbol, range) for symbol in watchlist]
-        results = await asyncio.gather(*tasks)
-        
-        for data in results:
-            yield f"data: {json.dumps(data)}\n\n"
-            
+
+        # 1. Cached symbols first (served from the OHLCV store, no network)
+        cached = [s for s in watchlist if market.has_fresh_series(s, range)]
+        for symbol in cached:
+            data = await market.get_watchlist_data(symbol, range)
+            yield f"data: {dumps(data).decode()}\n\n"
+
+        # 2. Remaining symbols, emitted as each one resolves (bounded pool + per-symbol timeout)
+        semaphore = asyncio.Semaphore(WATCHLIST_CONCURRENCY)
+
+        async def fetch(symbol: str):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(market.get_watchlist_data(symbol, range), WATCHLIST_TIMEOUT)
+                except asyncio.TimeoutError:
+                    return {"symbol": symbol, "error": "Timeout"}
+
+        tasks = [asyncio.create_task(fetch(s)) for s in watchlist if s not in cached]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                data = await next_done
+                yield f"data: {dumps(data).decode()}\n\n"
+        finally:
+            # Client went away - don't keep fetching for nobody
+            for task in tasks:
+                task.cancel()
+
         yield f"event: DONE\ndata: \n\n"
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 # Options Endpoints
 @app.get("/api/options")
-def get_options():
-    return options_service.get_all_trades()
+def get_options(request: Request):
+    headers = _validators("options", options_service.version)
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    return FastJSONResponse(options_service.get_all_trades(), headers=headers)
 
 @app.post("/api/options")
 def create_option(trade: OptionTrade):
@@ -195,8 +494,13 @@ def delete_option(trade_id: str):
     return {"status": "error", "message": "Trade not found"}
 
 @app.get("/api/options/stats")
-def get_options_stats():
-    return options_service.get_stats()
+def get_options_stats(request: Request):
+    # Yearly premium depends on the current year
+    headers = _validators("options-stats", options_service.version, datetime.now().year)
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    return FastJSONResponse(options_service.get_stats(), headers=headers)
 
 @app.post("/api/options/import")
 def import_options():
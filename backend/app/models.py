@@ -30,3 +30,42 @@ class OptionTrade(BaseModel):
 class OptionUpdate(BaseModel):
     status: Optional[str] = None
     notes: Optional[str] = None
+
+# 3. What-If Models
+class WhatIfTrade(BaseModel):
+    symbol: str
+    quantity: float # Negative = sell / short
+    price: Optional[float] = None # Fill price; None = live quote
+    multiplier: float = 1.0
+
+class WhatIfGrid(BaseModel):
+    symbol: str
+    quantities: List[float]
+    price: Optional[float] = None
+    multiplier: float = 1.0
+
+class WhatIfRequest(BaseModel):
+    base: List[WhatIfTrade] = [] # Applied in every scenario
+    scenarios: List[List[WhatIfTrade]] = []
+    grid: List[WhatIfGrid] = [] # One scenario per (symbol, quantity)
+
+# 4. Stress Test Models
+class StressShock(BaseModel):
+    # Match fields (all given must match; none = whole book). Country: ISO code, e.g. "CN"
+    symbol: Optional[str] = None
+    region: Optional[str] = None
+    country: Optional[str] = None
+    currency: Optional[str] = None
+    shock: Optional[float] = None # Price return, e.g. -0.2
+    fx: Optional[float] = None # Currency vs CZK return
+
+class StressScenario(BaseModel):
+    name: str
+    shocks: List[StressShock] = []
+    start: Optional[str] = None # YYYY-MM-DD; start + end = historical replay
+    end: Optional[str] = None
+
+class StressRequest(BaseModel):
+    scenarios: List[StressScenario] = []
+    presets: bool = True # Also run the predefined shocks and replays
+    max_leverage: float = 1.5
@@ -0,0 +1,36 @@
+from typing import Any
+import numpy as np
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(obj: Any) -> Any:
+    """Types orjson doesn't handle natively: numpy values it can't serialize, pandas Timestamps, sets."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encodes a response body in one pass: NaN/inf become null, numpy arrays and
+    scalars are encoded directly, datetimes as ISO strings.
+    """
+    return orjson.dumps(content, default=_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with dumps(). Returning it from an endpoint also skips
+    FastAPI's jsonable_encoder pass over the whole payload.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,225 +1,85 @@
 import pandas as pd
+import numpy as np
 import asyncio
 import math
+import os
 from datetime import datetime
-from typing import Dict, Any, List, Optional
-from .forex import ForexService
+from typing import Dict, Any, List, Optional, Tuple
+from .forex import ForexService, get_forex_service
 from .reconstructor import PortfolioReconstructor
-from .market import MarketDataService
+from .market import MarketDataService, get_market_service
 from .margin import MarginService
+from .option_pricing import OptionPricer
+from .locations import LocationIndex
 
 class PortfolioEngine:
-    def __init__(self):
-        self.market_data = MarketDataService()
-        self.forex = ForexService()
-        self.reconstructor = PortfolioReconstructor()
+    def __init__(self, market_data: Optional[MarketDataService] = None, forex: Optional[ForexService] = None,
+                 option_pricer: Optional[OptionPricer] = None, locations: Optional[LocationIndex] = None):
+        # Shared data layer (defaults to the process-wide instances)
+        self.market_data = market_data or get_market_service()
+        self.forex = forex or get_forex_service()
+        self.reconstructor = PortfolioReconstructor(forex=self.forex)
         self.margin = MarginService()
+        # Model marks for options without a Yahoo quote (implied vols persisted next to the market cache)
+        self.option_pricer = option_pricer or OptionPricer(
+            os.path.join(os.path.dirname(self.market_data.cache_file), "option_iv"))
+        # Country/region classification (memo persisted next to the market cache)
+        self.locations = locations or LocationIndex(
+            os.path.join(os.path.dirname(self.market_data.cache_file), "locations"),
+            mapping=getattr(self.market_data, 'MAPPING', None))
         
         # Caching
         self.cache_files_hash = ""
-        self.cached_result = None
         self.cached_reconstructed = None
+        self.cached_static = None  # Price-independent state (see _static_state)
+        # What the last valuation priced with (see valuation_inputs)
+        self.valuation_symbols: List[str] = []
+        self.valuation_fx_missing: List[str] = []
 
-    # Region Mappings
-    REGIONS = {
-        "North America": ["US", "CA"],
-        "Europe": ["DE", "GB", "FR", "IT", "ES", "NL", "CH", "SE", "NO", "DK", "FI", "IE", "AT", "BE", "PT", "CZ", "PL"],
-        "Asia": ["CN", "JP", "KR", "TW", "HK", "IN", "SG", "ID", "MY", "TH", "VN"],
-        "South America": ["BR", "AR", "CL", "CO", "PE", "MX"],
-        "Pacific": ["AU", "NZ"],
-        "Emerging": ["ZA", "SA", "TR", "AE"]
-    }
-    
-    # Suffix to Country
-    SUFFIX_MAP = {
-        ".DE": "DE", ".F": "DE", ".MU": "DE", ".BE": "DE", ".HA": "DE", ".DU": "DE",
-        ".L": "GB", ".AS": "NL", ".PA": "FR", ".MI": "IT", ".MC": "ES",
-        ".ST": "SE", ".OL": "NO", ".CO": "DK", ".HE": "FI",
-        ".HK": "HK", ".T": "JP", ".KS": "KR", ".SS": "CN", ".SZ": "CN",
-        ".AX": "AU", ".TO": "CA", ".SW": "CH",
-        ".PR": "CZ"
-    }
-
-    COUNTRY_NAME_MAP = {
-        "United States": "US", "USA": "US",
-        "China": "CN", "Hong Kong": "HK",
-        "Germany": "DE", "United Kingdom": "GB", "Great Britain": "GB", "UK": "GB",
-        "France": "FR", "Italy": "IT", "Spain": "ES", "Netherlands": "NL",
-        "Sweden": "SE", "Norway": "NO", "Denmark": "DK", "Finland": "FI",
-        "Switzerland": "CH", "Canada": "CA", "Australia": "AU", "Japan": "JP",
-        "South Korea": "KR", "Taiwan": "TW", "India": "IN", "Singapore": "SG",
-        "Brazil": "BR", "Mexico": "MX", "South Africa": "ZA",
-        "Cayman Islands": "CN" # Tax haven, usually Chinese tech (BABA, JD, BIDU)
-    }
-
-    # Manual Overrides for specific tickers (when ISIN/Live data fails or is misleading)
-    TICKER_OVERRIDE = {
-        "BABA": "CN", "9988.HK": "CN",
-        "JD": "CN", "BIDU": "CN",
-        "PDD": "CN", "TCEHY": "CN",
-        "TSM": "TW", 
-        "NIO": "CN", "XPEV": "CN", "LI": "CN",
-        "BYDDY": "CN"
-    }
-
-    ENABLE_CACHE = True
-
-    def _detect_country(self, symbol: str, isin: str = "", live_country_name: str = None, metadata_override: str = None) -> str:
-        # 1. Metadata Override (Highest Priority - User Defined)
-        if metadata_override and len(metadata_override) == 2:
-            return metadata_override.upper()
-
-        # 2. Manual System Override (Known ADRs/Exceptions)
-        clean_symbol = symbol.split('.')[0]
-        if symbol in self.TICKER_OVERRIDE:
-             return self.TICKER_OVERRIDE[symbol]
-        if clean_symbol in self.TICKER_OVERRIDE:
-             return self.TICKER_OVERRIDE[clean_symbol]
-
-        # 3. Live Data Name (Economic Reality - HQ)
-        if live_country_name:
-            iso = self.COUNTRY_NAME_MAP.get(live_country_name)
-            if iso: return iso
-
-        # 4. ISIN (Legal Domicile Fallback)
-        if isin and len(isin) >= 2:
-            return isin[:2].upper()
-            
-        # 5. Ticker Suffix Fallback (Exchange Location)
-        for suffix, country in self.SUFFIX_MAP.items():
-            if symbol.endswith(suffix):
-                return country
-        
-        # 6. Legacy Market Mapping
-        if hasattr(self, 'market_data') and hasattr(self.market_data, 'MAPPING'):
-            mapped = self.market_data.MAPPING.get(symbol)
-            if mapped:
-                for suffix, country in self.SUFFIX_MAP.items():
-                    if mapped.endswith(suffix):
-                        return country
-                        
-        return "Unknown"
-
-    def _detect_region(self, country: str) -> str:
-        for region, countries in self.REGIONS.items():
-            if country in countries:
-                return region
-        return "Other"
-
-    def _get_files_hash(self, merged_data: Dict[str, pd.DataFrame]) -> str:
-        """
-        Generates a simple hash based on the content length of DataFrames.
-        In a real scenario, we might check file mtimes before parsing, 
-        but here we receive already parsed data.
-        Optimization: The Controller should ideally check mtimes BEFORE parsing.
-        However, since we are inside Engine, let's optimize the Reconstruction step.
-        To do this effectively without re-parsing, we need to know if the inputs changed.
-        The `parser` provides fresh DFs every time currently. 
-        
-        Let's rely on a simpler mechanic: The caller (main.py) should ideally handle file changes.
-        But sticking to the plan: We caching the result of RECONSTRUCTION.
-        We can hash the input DataFrames or check if they are identical.
-        Hashing DFs can be slow. 
-        
-        Alternative: main.py passes `file_signature` (hash of mtimes).
-        Let's assume for now we don't have that signature yet, so we'll implement
-        a lightweight check or we modify main.py to pass it.
-        
-        Actually, let's modify `process` to accept `files_hash` optional argument.
-        """
-        # For now, simplistic length check + head check as proxy for hash
-        s = ""
-        if 'Trades' in merged_data:
-            df = merged_data['Trades']
-            s += f"T:{len(df)}"
-        return s
-
-    async def process(self, merged_data: Dict[str, pd.DataFrame], metadata: Dict[str, Any], files_hash: str = "") -> Dict[str, Any]:
-        """
-        Main entry point for portfolio calculation.
-        """
-    async def process(self, merged_data: Dict[str, pd.DataFrame], metadata: Dict[str, Any], files_hash: str = "") -> Dict[str, Any]:
+    # Currencies always quoted live (FX pairs) and shown in the FX panel
+    DEFAULT_CURRENCIES = ["USD", "EUR", "GBP", "HKD", "SEK", "PLN", "AUD", "CAD", "JPY", "CHF", "CNY", "SGD"]
+
+    async def process(self, merged_data: Dict[str, pd.DataFrame], metadata: Dict[str, Any], files_hash: str = "",
+                      metadata_version: Optional[str] = None) -> Dict[str, Any]:
         """
         Main entry point for portfolio calculation.
+        Statement- and metadata-derived state is cached per (files_hash, metadata_version);
+        a warm call only applies the latest prices and FX to it.
         """
-        # 1. Setup Data
-        df_trades = merged_data.get('Trades', pd.DataFrame())
-        df_fin_info = merged_data.get('Financial Instrument Information', pd.DataFrame())
-        df_open_pos = merged_data.get('Open Positions', pd.DataFrame())
-        
-        # 2. Reconstruct Portfolio (Cached)
-        # If files_hash is provided and matches, we skip reconstruction
-        if files_hash and files_hash == self.cache_files_hash and self.cached_reconstructed is not None:
-             reconstructed = self.cached_reconstructed
-        else:
-             reconstructed = self.reconstructor.reconstruct(df_trades, df_fin_info)
-             # Update Cache
-             if files_hash:
-                 self.cache_files_hash = files_hash
-                 self.cached_reconstructed = reconstructed
+        # 1-3. Static state (positions frame, ledger, report date, cash, accruals)
+        static = self._static_state(merged_data, metadata, files_hash, metadata_version)
+        report_date = static['report_date']
         
-        # 3. Determine Report Date for FX
-        report_date = self._get_report_date(merged_data.get('Statement', pd.DataFrame()))
-        
-        # 4. Fetch Live Market Data
-        all_symbols = df_open_pos['Symbol'].dropna().unique().tolist() if not df_open_pos.empty else []
-        live_data = await self.market_data.get_live_prices(all_symbols)
+        # 4. Fetch Live Market Data (option underlyings ride along in the same batch)
+        underlyings = static['underlyings']
+        quoted = list(dict.fromkeys(static['all_symbols'] + list(underlyings.values())))
+        live_data = await self.market_data.get_live_prices(quoted)
+        self._mark_options(live_data, underlyings)
 
-        
         # 5. Pre-fetch FX Rates (Hybrid: Live Yahoo + Historical CNB)
         today = datetime.now().strftime("%Y-%m-%d")
         fx_keys_hist = []
         fx_tasks_hist = []
         
         # Identify currencies needed
-        currencies_live = set(["USD", "EUR", "GBP", "HKD", "SEK", "PLN", "AUD", "CAD", "JPY", "CHF", "CNY", "SGD"]) # Defaults
+        currencies_live = set(self.DEFAULT_CURRENCIES) # Defaults
         
         # Scan positions
-        if not df_open_pos.empty:
-            for _, row in df_open_pos.iterrows():
-                symbol = row.get('Symbol')
-                cur = str(row.get('Currency', 'USD')).strip()
-                if not cur: continue
-                
-                # Check if we have live price for this symbol
-                if symbol in live_data:
-                    currencies_live.add(cur)
-                else:
-                    # Need historical rate for report_date
-                    if cur != 'CZK':
-                         fx_keys_hist.append((cur, report_date, 'CZK'))
-                    if cur != 'USD':
-                         fx_keys_hist.append((cur, report_date, 'USD'))
-
-        # Scan forex (Always Live for Cash)
-        df_forex = merged_data.get('Forex Balances', pd.DataFrame())
-        if not df_forex.empty:
-             for _, row in df_forex.iterrows():
-                 if 'Forex' in str(row.get('Asset Category', '')):
-                     cur = str(row.get('Description', '')).strip()
-                     if cur: currencies_live.add(cur)
-
-        # A) Fetch Live Rates (Yahoo)
-        live_fx_map = await self.market_data.get_live_fx_rates(list(currencies_live), "CZK")
-        
-        # Fallback for missing Live Rates (Yahoo often fails for CZK pairs like HKDCZK=X)
-        missing_live = [c for c in currencies_live if c not in live_fx_map and c != 'CZK']
-        if missing_live:
-            # We fetch 'today' rate from ForexService (ForexService handles the direct fallback to Frankfurter)
-            fallback_tasks = [self.forex.get_rate_async(c, today, 'CZK') for c in missing_live]
-            fallback_results = await asyncio.gather(*fallback_tasks)
-            for i, cur in enumerate(missing_live):
-                if fallback_results[i] > 0:
-                    live_fx_map[cur] = fallback_results[i]
-
-        fx_map = {} 
-        usd_rate = live_fx_map.get('USD') or 22.0
-        
-        # Populate Map for Today
-        for cur, rate_czk in live_fx_map.items():
-            fx_map[(cur, today, 'CZK')] = rate_czk
-            if usd_rate > 0:
-                fx_map[(cur, today, 'USD')] = rate_czk / usd_rate
+        pos_symbols, pos_currency = static['fx_scan']
+        has_live = np.array([s in live_data for s in pos_symbols], dtype=bool)
+        # Live price -> live FX; report price -> historical rate for report_date
+        currencies_live.update(pos_currency[has_live])
+        for cur in pd.unique(pos_currency[~has_live]):
+            if cur != 'CZK':
+                 fx_keys_hist.append((cur, report_date, 'CZK'))
+            if cur != 'USD':
+                 fx_keys_hist.append((cur, report_date, 'USD'))
+
+        # Cash (Always Live)
+        currencies_live.update(static['cash']['currency'])
+
+        # A) Live Rates for today
+        fx_map = await self.live_fx_map(currencies_live)
         
         # B) Fetch Historical Rates (CNB)
         fx_keys_hist = list(set(fx_keys_hist))
@@ -230,28 +90,26 @@ class PortfolioEngine:
             hist_results = await asyncio.gather(*fx_tasks_hist)
             for i, key in enumerate(fx_keys_hist):
                 fx_map[key] = hist_results[i]
+
+        self.valuation_symbols = quoted + [self.market_data.fx_symbol(c) for c in currencies_live if c != 'CZK']
+        self.valuation_fx_missing = [f"{c}_CZK_{today}" for c in currencies_live
+                                     if c != 'CZK' and not fx_map.get((c, today, 'CZK'))]
+        self.valuation_fx_missing += [f"{c}_{target}_{date}" for (c, date, target) in fx_keys_hist
+                                      if not fx_map.get((c, date, target))]
             
-        # 6. Process Positions
-        positions = self._process_positions(df_open_pos, reconstructed, live_data, metadata, report_date, fx_map)
-        
-        # 7. Calculate KPIs
-        cash_balances = self._get_cash_balances(df_forex, fx_map)
-        
-        # 7b. Extract Accruals (from Net Asset Value)
-        # We look for "Interest Accruals" and "Dividend Accruals" in Statement section or NAV section
-        # Parser seems to separate "Net Asset Value" into its own section? 
-        # Parser output keys: 'Statement', 'Account Information', 'Net Asset Value', ...
-        df_nav = merged_data.get('Net Asset Value', pd.DataFrame())
-        accruals_usd = self._get_accruals_total(df_nav)
+        # 6. Value Positions & Cash
+        positions = self._value_positions(static['positions'], live_data, report_date, fx_map)
+        cash_balances = self._value_cash(static['cash'], fx_map)
+        accruals_usd = static['accruals_usd']
 
+        # 7. Calculate KPIs
         kpis = self._calculate_kpis(positions, cash_balances, report_date, fx_map, accruals_usd)
 
         kpis['cash_balances'] = cash_balances # Pass breakdown to frontend
         
         # 8. Fetch Current FX Rates (Display Only - Cached)
-        display_currencies = ["USD", "EUR", "GBP", "HKD", "SEK", "PLN", "AUD", "CAD", "JPY", "CHF", "CNY", "SGD"]
         fx_rates = {}
-        for curr in display_currencies:
+        for curr in self.DEFAULT_CURRENCIES:
             fx_rates[curr] = fx_map.get((curr, today, "CZK"), 1.0)
 
         # 8. Final Response Formatting
@@ -268,7 +126,147 @@ class PortfolioEngine:
             for p in response["positions"]:
                 p["pct_portfolio"] = (p["market_value_czk"] / net_liq_czk) * 100
 
-        return self._sanitize(response)
+        # NaN/inf are left in place; the response encoder (app.responses.dumps) writes them as null
+        return response
+
+    def valuation_inputs(self) -> Tuple:
+        """
+        Cheap fingerprint of what a valuation would price with now: the cached quotes (with their
+        fetch time, which the body reports as price_as_of) of the symbols the last valuation used,
+        and which of the FX rates it lacked have arrived since.
+        Cached FX rates are final, so FX fetched for other requests doesn't change it.
+        """
+        quotes = self.market_data.cache
+        return (tuple(repr(quotes.get(s)) for s in self.valuation_symbols),
+                tuple(key in self.forex.cache for key in self.valuation_fx_missing))
+
+    def _static_state(self, merged_data: Dict[str, pd.DataFrame], metadata: Dict[str, Any],
+                      files_hash: str, metadata_version: Optional[str]) -> Dict[str, Any]:
+        """
+        Everything process() needs that doesn't depend on prices or FX.
+        Cached per (files_hash, metadata_version) when both are given.
+        """
+        key = (files_hash, metadata_version)
+        if files_hash and metadata_version is not None and self.cached_static is not None \
+                and self.cached_static['key'] == key:
+            return self.cached_static
+
+        df_trades = merged_data.get('Trades', pd.DataFrame())
+        df_fin_info = merged_data.get('Financial Instrument Information', pd.DataFrame())
+        df_open_pos = merged_data.get('Open Positions', pd.DataFrame())
+        
+        # 2. Reconstruct Portfolio (Cached)
+        # If files_hash is provided and matches, we skip reconstruction
+        if files_hash and files_hash == self.cache_files_hash and self.cached_reconstructed is not None:
+             reconstructed = self.cached_reconstructed
+        else:
+             reconstructed = self.reconstructor.reconstruct(df_trades, df_fin_info)
+             # Update Cache
+             if files_hash:
+                 self.cache_files_hash = files_hash
+                 self.cached_reconstructed = reconstructed
+
+        # FX pre-scan uses the statement currency of every row
+        if df_open_pos.empty:
+            fx_scan = ([], np.array([], dtype=object))
+        else:
+            pos_currency = self._text_column(df_open_pos, 'Currency', 'USD').str.strip()
+            has_currency = (pos_currency != '').to_numpy()
+            fx_scan = (df_open_pos['Symbol'][has_currency].tolist(), pos_currency[has_currency].to_numpy(dtype=object))
+
+        static = {
+            'key': key,
+            # 3. Determine Report Date for FX
+            'report_date': self._get_report_date(merged_data.get('Statement', pd.DataFrame())),
+            'all_symbols': df_open_pos['Symbol'].dropna().unique().tolist() if not df_open_pos.empty else [],
+            'underlyings': self._option_underlyings(df_open_pos),
+            'positions': self._position_frame(df_open_pos, reconstructed, metadata),
+            'fx_scan': fx_scan,
+            'cash': self._cash_frame(merged_data.get('Forex Balances', pd.DataFrame())),
+            # Accruals (from Net Asset Value: "Interest Accruals" and "Dividend Accruals")
+            'accruals_usd': self._get_accruals_total(merged_data.get('Net Asset Value', pd.DataFrame())),
+        }
+        if files_hash and metadata_version is not None:
+            self.cached_static = static
+        return static
+
+    # Position fields that move with prices/FX (sent as live deltas)
+    DELTA_FIELDS = [
+        "current_price", "market_value_native", "market_value_czk", "market_value_usd",
+        "unrealized_pnl_czk", "unrealized_pnl_native", "pnl_percent", "pct_portfolio",
+        "price_source", "instruction", "pct_to_buy", "pct_to_sell", "year_high", "year_low"
+    ]
+
+    def diff(self, previous: Dict[str, Any], current: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Price-driven changes between two process() results:
+        { kpi: {changed keys}, positions: {index in previous: {changed fields}}, fx_rates: {changed},
+          order: [index in previous of each current row] or None if the order is unchanged }.
+        Rows are matched by their position frame row, so duplicate symbols (one line per account)
+        stay apart and a price move that swaps ranks only reorders them.
+        Returns None if the set of rows changed (caller should send a full snapshot).
+        """
+        prev_positions = previous.get('positions', [])
+        curr_positions = current.get('positions', [])
+        prev_keys = [(p['row'], p['symbol']) for p in prev_positions]
+        curr_keys = [(p['row'], p['symbol']) for p in curr_positions]
+        if sorted(prev_keys) != sorted(curr_keys) or previous.get('status') != current.get('status'):
+            return None
+
+        prev_index = {key: i for i, key in enumerate(prev_keys)}
+        order = [prev_index[key] for key in curr_keys]
+        positions = {}
+        for i, pos in zip(order, curr_positions):
+            old = prev_positions[i]
+            changed = {f: pos.get(f) for f in self.DELTA_FIELDS if not self._same(pos.get(f), old.get(f))}
+            if changed:
+                positions[str(i)] = changed
+
+        prev_kpi, curr_kpi = previous.get('kpi', {}), current.get('kpi', {})
+        kpi = {k: v for k, v in curr_kpi.items() if not self._same(prev_kpi.get(k), v)}
+
+        prev_fx, curr_fx = previous.get('fx_rates', {}), current.get('fx_rates', {})
+        fx_rates = {k: v for k, v in curr_fx.items() if not self._same(prev_fx.get(k), v)}
+
+        return {"kpi": kpi, "positions": positions, "fx_rates": fx_rates,
+                "order": None if order == list(range(len(order))) else order}
+
+    def _option_underlyings(self, df_open_pos: pd.DataFrame) -> Dict[str, str]:
+        """{option symbol: underlying symbol} for option positions with a parseable contract."""
+        if df_open_pos.empty or 'Asset Category' not in df_open_pos:
+            return {}
+        is_option = df_open_pos['Asset Category'].astype(str).str.contains('Option')
+        underlyings = {}
+        for symbol in df_open_pos.loc[is_option, 'Symbol'].dropna().unique():
+            contract = self.option_pricer.parse(symbol)
+            if contract:
+                underlyings[symbol] = contract[0]
+        return underlyings
+
+    def _mark_options(self, live_data: Dict[str, Dict[str, Any]], underlyings: Dict[str, str]):
+        """
+        Fills in model marks for options with no quote (or a stale one while the underlying is fresh),
+        and records implied vols from fresh option quotes. Uses only already fetched quotes.
+        """
+        quoted, unquoted = [], []
+        for symbol, underlying in underlyings.items():
+            spot = live_data.get(underlying)
+            if not spot or not spot.get('price'):
+                continue
+            quote = live_data.get(symbol)
+            if quote and not quote.get('stale'):
+                quoted.append((symbol, quote['price'], spot['price']))
+            elif not quote or not spot.get('stale'):
+                unquoted.append((symbol, spot['price']))
+
+        self.option_pricer.record_quotes(quoted)
+        for symbol, mark in self.option_pricer.price(unquoted).items():
+            spot = live_data[underlyings[symbol]]
+            live_data[symbol] = {
+                'price': mark['price'], 'name': symbol, 'country': "N/A",
+                'source': "Model", 'implied_vol': mark['implied_vol'],
+                'age_seconds': spot.get('age_seconds'), 'stale': spot.get('stale', False), 'as_of': spot.get('as_of'),
+            }
 
     def _get_report_date(self, df_stmt: pd.DataFrame) -> str:
         """Extracts the end date of the report for consistent FX conversion."""
@@ -288,188 +286,171 @@ class PortfolioEngine:
                         except: pass
         return datetime.now().strftime("%Y-%m-%d")
 
-    def _process_positions(self, df_open_pos: pd.DataFrame, reconstructed: Dict, 
-                          live_data: Dict, metadata: Dict, report_date: str, fx_map: Dict) -> List[Dict]:
-        positions = []
-        today = datetime.now().strftime("%Y-%m-%d")
-
+    def _text_column(self, df: pd.DataFrame, name: str, default: Any) -> pd.Series:
+        """Column as str (like str(row.get(name, default))); missing columns give the default."""
+        if name in df:
+            return df[name].astype(str)
+        return pd.Series(str(default), index=df.index, dtype=object)
+
+    def _float_column(self, df: pd.DataFrame, name: str, default: Any = None) -> np.ndarray:
+        """Floats of a column (thousands separators stripped, "nan" -> NaN, anything else unparseable -> 0.0)."""
+        text = self._text_column(df, name, default).str.replace(',', '', regex=False)
+        values = pd.to_numeric(text, errors='coerce')
+        # A literal 'nan' stays NaN (as float() parses it); anything else unparseable is 0.0
+        is_nan_literal = text.str.strip().str.lower().isin(['nan', '+nan', '-nan'])
+        return values.mask(values.isna() & ~is_nan_literal, 0.0).to_numpy(dtype=np.float64)
+
+    def _fx_rates(self, currencies: np.ndarray, dates: np.ndarray, target: str,
+                  fx_map: Dict, default: float) -> np.ndarray:
+        """Rate per row from fx_map, looked up once per distinct (currency, date)."""
+        keys = list(zip(currencies.tolist(), dates.tolist()))
+        rates = {(cur, date): 1.0 if cur == target else fx_map.get((cur, date, target), default)
+                 for cur, date in set(keys)}
+        return np.fromiter((rates[k] for k in keys), dtype=np.float64, count=len(keys))
+
+    def _position_frame(self, df_open_pos: pd.DataFrame, reconstructed: Dict, metadata: Dict) -> Dict[str, Any]:
+        """
+        Price-independent columns of the open positions: quantities, multipliers, report prices,
+        cost basis, ledger join, currency and metadata. Rows without a symbol or quantity are dropped.
+        """
+        frame = {'symbols': [], 'locations': {}}
         if df_open_pos.empty:
+            return frame
+
+        # 1. Rows with a symbol and non-zero quantity
+        df = df_open_pos[df_open_pos['Symbol'].notna() & (df_open_pos['Symbol'].astype(str) != '')]
+        qty = self._float_column(df, 'Quantity')
+        df, qty = df[qty != 0], qty[qty != 0]
+        if df.empty:
+            return frame
+        symbols = df['Symbol'].astype(str)
+        symbol_list = symbols.tolist()
+
+        # 2. Join the reconstructed ledger
+        recon_entries = [reconstructed.get(s) for s in symbol_list]
+        has_recon = np.array([bool(e) for e in recon_entries], dtype=bool)
+        recon_qty = np.array([e['quantity'] if e else np.nan for e in recon_entries], dtype=np.float64)
+        recon_cost_czk = np.array([e['cost_basis_czk'] if e else np.nan for e in recon_entries], dtype=np.float64)
+        csv_currency = self._text_column(df, 'Currency', 'USD').str.strip().tolist()
+        currency = np.array([e['currency'] if e else c for e, c in zip(recon_entries, csv_currency)], dtype=object)
+
+        # Options: market value sign is inverted (see _value_positions)
+        is_option = (self._text_column(df, 'Asset Category', None).str.contains('Option', regex=False)
+                     | ((symbols.str.endswith('-P') | symbols.str.endswith('-C')) & (symbols.str.len() > 15))).to_numpy()
+        mult = self._float_column(df, 'Mult', 1)
+        mult[mult == 0] = 1.0  # Fallback
+
+        cost_basis_native = self._float_column(df, 'Cost Basis')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # CZK cost basis from the Shadow Ledger (rows without a ledger entry use today's FX later)
+            recon_cost = np.where(np.abs(recon_qty) > 0.000001, qty * (recon_cost_czk / recon_qty), 0.0)
+            average_buy_price = cost_basis_native / qty
+
+        # 3. Metadata (normalize IBKR suffixes like BOSSd, EVOs, then exchange suffix)
+        stripped = symbols.str.strip()
+        potential = stripped.str[:-1]
+        strip_suffix = (stripped.str.len() > 1) & stripped.str[-1].isin(['d', 's']) & (potential != potential.str.lower())
+        norm_symbols = stripped.where(~strip_suffix, potential)
+        base_symbols = norm_symbols.str.split('.').str[0]
+        metas = [metadata.get(s, {}) or metadata.get(n, {}) or metadata.get(b, {})
+                 for s, n, b in zip(symbol_list, norm_symbols.tolist(), base_symbols.tolist())]
+
+        isin_raw = df['ISIN'].tolist() if 'ISIN' in df else [None] * len(df)
+        isins = ['' if isinstance(i, float) and math.isnan(i) else i for i in isin_raw]
+
+        frame.update({
+            'symbols': symbol_list, 'qty': qty, 'mult': mult, 'is_option': is_option,
+            'report_price': self._float_column(df, 'Close Price'),
+            'currency': currency, 'has_recon': has_recon, 'recon_cost_czk': recon_cost,
+            'cost_basis_native': cost_basis_native, 'average_buy_price': average_buy_price,
+            'metas': metas, 'isins': isins,
+        })
+        return frame
+
+    def _value_positions(self, frame: Dict[str, Any], live_data: Dict, report_date: str, fx_map: Dict) -> List[Dict]:
+        """
+        Applies live prices and FX to a position frame: valuation is vectorized over all rows
+        and the row dicts are only built at the end.
+        """
+        symbol_list = frame['symbols']
+        if not symbol_list:
             return []
-
-        for _, row in df_open_pos.iterrows():
-            symbol = row.get('Symbol')
-            if not symbol: continue
-            
-            # ... (Rest of loop setup)
-            cost_basis_czk = None
-            cost_basis_native = None
-            qty = self._parse_float(row.get('Quantity'))
-            if qty == 0: continue
-            
-            currency = str(row.get('Currency', 'USD')).strip()
-            recon_entry = reconstructed.get(symbol)
-            
-            live_entry = live_data.get(symbol)
-            if live_entry:
-                price = live_entry.get('price', 0.0)
-                price_source = "Live"
-                fx_date = today
-                name = live_entry.get('name', symbol)
-            else:
-                price = self._parse_float(row.get('Close Price'))
-                price_source = "Report"
-                fx_date = report_date
-                name = symbol
-
-            if recon_entry:
-                currency = recon_entry['currency']
-                recon_qty = recon_entry['quantity']
-                if abs(recon_qty) > 0.000001:
-                    avg_cost_czk = recon_entry['cost_basis_czk'] / recon_qty
-                    cost_basis_czk = qty * avg_cost_czk
-                else: cost_basis_czk = 0.0
-            else:
-                raw_cost = self._parse_float(row.get('Cost Basis'))
-                cost_basis_native = raw_cost
-            
-            # Market Val & FX (Use Map)
-            # Default to 1.0 if not found (or 0.0 + error log?)
-            # If same currency, logic returns 1.0? 
-            # Our pre-fetcher didn't add tasks for same currency.
-            # So we handle identity here.
-            
-            if currency == 'CZK': fx_czk = 1.0
-            else: fx_czk = fx_map.get((currency, fx_date, 'CZK'), 0.0)
-            
-            if currency == 'USD': fx_usd = 1.0
-            else: fx_usd = fx_map.get((currency, fx_date, 'USD'), 0.0)
-            
-            # If rate is 0 because of error, fallback to sync? No, that defeats point.
-            # If 0, try fetching sync? Dangerous. Assume strict pre-fetch.
-            # If pre-fetch failed, it's 0.
-
-            # Detect if this is an option
-            is_option = 'Option' in str(row.get('Asset Category', '')) or \
-                        ((symbol.endswith('-P') or symbol.endswith('-C')) and len(symbol) > 15)
-            
-            # Get multiplier (for options: 100, for stocks: 1)
-            mult = self._parse_float(row.get('Mult', 1))
-            if mult == 0: mult = 1.0  # Fallback
-            
-            # Calculate market value
-            # For options: invert sign because qty represents position direction
-            # - Long option (qty > 0): You paid premium → negative value
-            # - Short option (qty < 0): You received premium → negative value (liability)
-            if is_option:
-                market_val_native = -(qty * price * mult)
-            else:
-                market_val_native = qty * price * mult
-                
+        today = datetime.now().strftime("%Y-%m-%d")
+        qty, mult, currency = frame['qty'], frame['mult'], frame['currency']
+        cost_basis_native, metas = frame['cost_basis_native'], frame['metas']
+
+        # 1. Join live quotes (report price + report-date FX otherwise)
+        live_entries = [live_data.get(s) for s in symbol_list]
+        has_live = np.array([bool(e) for e in live_entries], dtype=bool)
+        live_price = np.array([e.get('price', 0.0) if e else np.nan for e in live_entries], dtype=np.float64)
+        price = np.where(has_live, live_price, frame['report_price'])
+        fx_date = np.where(has_live, today, report_date)
+
+        # 2. FX (0.0 if the pre-fetch failed)
+        fx_czk = self._fx_rates(currency, fx_date, 'CZK', fx_map, 0.0)
+        fx_usd = self._fx_rates(currency, fx_date, 'USD', fx_map, 0.0)
+
+        # 3. Valuation
+        # Options: invert sign because qty represents position direction
+        # - Long option (qty > 0): You paid premium → negative value
+        # - Short option (qty < 0): You received premium → negative value (liability)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gross_native = qty * price * mult
+            market_val_native = np.where(frame['is_option'], -gross_native, gross_native)
             market_val_czk = market_val_native * fx_czk
             market_val_usd = market_val_native * fx_usd
+            cost_basis_czk = np.where(frame['has_recon'], frame['recon_cost_czk'], cost_basis_native * fx_czk)
 
-            # Debug logging removed
-            
-            # Convert Cost Basis if it came from Native
-            if cost_basis_czk is None:
-                 # If we didn't get it from Reconstructor (Shadow Ledger)
-                 cost_basis_czk = cost_basis_native * fx_czk 
-            else:
-                 # If we got CZK basis from recon, we back-calculate native for % calc consistency
-                 # Or we should store native basis in recon too? For now, approximation:
-                 # Actually, if we have recon, we don't always have native basis stored.
-                 # Let's trust the 'Cost Basis' from CSV as 'cost_basis_native' fallback for % calc if recon fails?
-                 # Better: derived native cost basis = cost_basis_czk / fx_rate_at_buy_time ... hard.
-                 # SIMPLE FIX: If we have row['Cost Basis'], use it as native_basis.
-                 pass
-
-            if not cost_basis_native and qty != 0:
-                 # Try to infer from CSV
-                 cost_basis_native = self._parse_float(row.get('Cost Basis', 0))
-
-            # P&L
+            # P&L (NATIVE values for % return to exclude FX impact)
             unrealized_pnl_czk = market_val_czk - cost_basis_czk
-            
-            # Use NATIVE values for % return to exclude FX impact
-            # This matches "Price vs Avg Price" expectation
             native_pnl = market_val_native - cost_basis_native
-            pnl_percent = (native_pnl / cost_basis_native * 100) if cost_basis_native and cost_basis_native != 0 else 0
-            
-            if 'P911' in symbol or 'BOSS' in symbol:
-                pass 
-                # print(f"DEBUG {symbol}: Qty={qty} Price={price} FX={fx_czk}")
-
-            
-            # Metadata & Instructions
-            # Normalize symbol for lookup (strip suffixes like d, s used in some IBKR reports)
-            norm_symbol = symbol.strip()
-            # If it ends with lowercase d or s, strip it (for BOSSd, EVOs, P911d, etc.)
-            if len(norm_symbol) > 1 and norm_symbol[-1] in ('d', 's'):
-                potential = norm_symbol[:-1]
-                # Check if the rest looks like a ticker (mostly uppercase/digits)
-                if any(c.isupper() for c in potential):
-                    norm_symbol = potential
-            
-            # Also handle common exchange suffixes if metadata is generic
-            base_symbol = norm_symbol.split('.')[0]
-            
-            meta = metadata.get(symbol, {})
-            if not meta: meta = metadata.get(norm_symbol, {})
-            if not meta: meta = metadata.get(base_symbol, {})
-            
-            
-            instr_data = self._get_instruction(price, meta)
-            
-            # Assets Exclusion (User wants to see all options)
-            is_excluded = False
-            # Country & Region
-            raw_isin = row.get('ISIN')
-            if isinstance(raw_isin, float) and math.isnan(raw_isin):
-                raw_isin = ''
+            has_cost = cost_basis_native != 0
+            pnl_percent = np.where(has_cost, native_pnl / cost_basis_native * 100, 0.0)
+
+        instructions = self._get_instructions(price, metas)
+
+        # 4. Country & Region (memoized on the frame per distinct input, and across restarts by LocationIndex)
+        regions = frame['locations']
+        locations = []
+        for symbol, option, raw_isin, live_entry, meta, cur in zip(symbol_list, frame['is_option'], frame['isins'],
+                                                                     live_entries, metas, currency):
+            if option:
+                locations.append(("N/A", "Derivatives"))
+                continue
             isin = str(raw_isin) if raw_isin else (live_entry.get('isin', '') if live_entry else '')
-            
-            # Options Handling
-            if 'Option' in str(row.get('Asset Category', '')) or ((symbol.endswith('-P') or symbol.endswith('-C')) and len(symbol) > 15):
-                country = "N/A"
-                region = "Derivatives" 
-            else:
-                live_country = live_entry.get('country') if live_entry else None
-                meta_override = meta.get('country_override')
-                country = self._detect_country(symbol, isin, live_country, meta_override)
-                
-                # Currency Fallbacks if Country Unknown
-                if country == "Unknown":
-                    if currency == "USD": country = "US"
-                    elif currency == "GBP": country = "GB"
-                    elif currency == "EUR": country = "DE" # Generic Eurozone
-                    elif currency == "CZK": country = "CZ"
-                    elif currency == "HKD": country = "HK"
-                    elif currency == "SEK": country = "SE"
-                    elif currency == "PLN": country = "PL"
-                    elif currency == "AUD": country = "AU"
-                    elif currency == "CAD": country = "CA"
-                    elif currency == "JPY": country = "JP"
-                    elif currency == "CHF": country = "CH"
-                    elif currency == "CNY": country = "CN"
-                    elif currency == "SGD": country = "SG"
-                
-                region = self._detect_region(country)
-            
-            # ... existing logic ...
-
+            key = (symbol, isin, live_entry.get('country') if live_entry else None, meta.get('country_override'), cur)
+            if key not in regions:
+                regions[key] = self.locations.classify(*key)
+            locations.append(regions[key])
+
+        # 5. Output rows
+        columns = zip(symbol_list, live_entries, metas, locations, instructions, currency,
+                      qty.tolist(), price.tolist(), market_val_native.tolist(), market_val_czk.tolist(),
+                      market_val_usd.tolist(), cost_basis_czk.tolist(), unrealized_pnl_czk.tolist(),
+                      native_pnl.tolist(), pnl_percent.tolist(), has_cost.tolist(),
+                      frame['average_buy_price'].tolist(), frame['has_recon'].tolist())
+        positions = []
+        for (symbol, live_entry, meta, (country, region), instruction, cur, q, px, mv_native, mv_czk,
+             mv_usd, cb_czk, upnl_czk, upnl_native, pnl_pct, cost_known, avg_price, recon_match) in columns:
             positions.append({
-                "id": symbol, "symbol": symbol, "name": name, "quantity": qty,
-                "current_price": price, "currency": currency,
-                "market_value_native": market_val_native,
-                "market_value_czk": market_val_czk, "market_value_usd": market_val_usd,
-                "cost_basis_czk": cost_basis_czk, "unrealized_pnl_czk": unrealized_pnl_czk,
-                "unrealized_pnl_native": native_pnl,
-                "pnl_percent": pnl_percent, "is_excluded": is_excluded,
-                "average_buy_price": self._parse_float(row.get('Cost Basis', 0)) / qty if qty else 0,
-                "price_source": price_source, "recon_match": bool(recon_entry),
-                **meta, **instr_data,
+                "id": symbol, "symbol": symbol, "name": live_entry.get('name', symbol) if live_entry else symbol,
+                "row": len(positions),  # Position frame row: stable across price updates (see diff)
+                "quantity": q,
+                "current_price": px, "currency": cur,
+                "market_value_native": mv_native,
+                "market_value_czk": mv_czk, "market_value_usd": mv_usd,
+                "cost_basis_czk": cb_czk, "unrealized_pnl_czk": upnl_czk,
+                "unrealized_pnl_native": upnl_native,
+                "pnl_percent": pnl_pct if cost_known else 0, "is_excluded": False,
+                "average_buy_price": avg_price,
+                "price_source": live_entry.get('source', "Live") if live_entry else "Report",
+                "recon_match": recon_match,
+                "price_as_of": live_entry.get('as_of') if live_entry else None,  # Absolute, so the body stays cacheable
+                **meta, **instruction,
                 "year_high": live_entry.get('high52') if live_entry else None,
                 "year_low": live_entry.get('low52') if live_entry else None,
+                "sector": meta.get('sector') or (live_entry.get('sector') if live_entry else None),
+                "industry": meta.get('industry') or (live_entry.get('industry') if live_entry else None),
                 "country": country, "region": region
             })
 
@@ -477,42 +458,36 @@ class PortfolioEngine:
 
     def _get_accruals_total(self, df_nav: pd.DataFrame) -> float:
         """Parse Interest and Dividend Accruals from Net Asset Value section."""
-        total_accruals = 0.0
         if df_nav.empty:
             return 0.0
             
         try:
-            # Clean columns? self.parser cleans them usually.
             # Columns usually: Asset Class, Prior Total, Current Long, Current Short, Current Total, Change
             # We want 'Current Total' where 'Asset Class' is 'Interest Accruals' or 'Dividend Accruals'
-            
-            # Helper to parse float safely
-            def parse_val(val):
-                if isinstance(val, (int, float)): return float(val)
-                if isinstance(val, str): return float(val.replace(',', ''))
-                return 0.0
-
-            for _, row in df_nav.iterrows():
-                asset_class = str(row.get('Asset Class', ''))
-                if 'Interest Accruals' in asset_class or 'Dividend Accruals' in asset_class:
-                     val = parse_val(row.get('Current Total', 0))
-                     total_accruals += val
+            asset_class = self._text_column(df_nav, 'Asset Class', '')
+            is_accrual = asset_class.str.contains('Interest Accruals', regex=False) | \
+                         asset_class.str.contains('Dividend Accruals', regex=False)
+            values = self._float_column(df_nav[is_accrual], 'Current Total', 0)
+            return float(sum(values.tolist()))
         except Exception as e:
             print(f"Error parsing accruals: {e}")
-            
-        return total_accruals
+            return 0.0
 
     def _calculate_kpis(self, positions: List[Dict], cash_balances: List[Dict], report_date: str, fx_map: Dict, accruals_usd: float = 0.0) -> Dict[str, Any]:
-        active = [p for p in positions if not p['is_excluded']]
-        
+        market_czk = np.array([p['market_value_czk'] for p in positions], dtype=np.float64)
+        market_usd = np.array([p['market_value_usd'] for p in positions], dtype=np.float64)
+        cost_czk = np.array([p['cost_basis_czk'] for p in positions], dtype=np.float64)
+        active = ~np.array([bool(p['is_excluded']) for p in positions], dtype=bool)
+
         # Net Market Value (traditional sum, short options reduce value)
-        total_market_czk = sum(p['market_value_czk'] for p in active)
-        total_market_usd = sum(p['market_value_usd'] for p in active)
-        total_cost_czk = sum(p['cost_basis_czk'] for p in active)
+        # (builtin sum over the columns keeps the exact left-to-right totals)
+        total_market_czk = sum(market_czk[active].tolist())
+        total_market_usd = sum(market_usd[active].tolist())
+        total_cost_czk = sum(cost_czk[active].tolist())
         
         # Gross Position Value (absolute sum)
-        gross_position_czk = sum(abs(p['market_value_czk']) for p in positions)
-        gross_position_usd = sum(abs(p['market_value_usd']) for p in positions)
+        gross_position_czk = sum(np.abs(market_czk).tolist())
+        gross_position_usd = sum(np.abs(market_usd).tolist())
         
         # Calculate Total Cash
         today = datetime.now().strftime("%Y-%m-%d")
@@ -572,75 +547,81 @@ class PortfolioEngine:
             "report_date": report_date
         }
 
+    def _cash_frame(self, df_forex: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Currency and amount of each non-trivial cash balance."""
+        if df_forex.empty:
+            return {'currency': np.array([], dtype=object), 'amount': np.zeros(0)}
+            
+        # Rows where Asset Category is Forex
+        # IBKR 'Forex Balances' section:
+        # Description = The Currency code (e.g. 'CZK', 'EUR', 'USD')
+        # Quantity = The Balance amount
+        df = df_forex[self._text_column(df_forex, 'Asset Category', '').str.contains('Forex', regex=False)]
+        currency = self._text_column(df, 'Description', '').str.strip().to_numpy(dtype=object)
+        amount = self._float_column(df, 'Quantity', 0)
 
-    def _get_cash_balances(self, df_forex: pd.DataFrame, fx_map: Dict) -> List[Dict]:
-        """
-        Extracts cash balances from 'Forex Balances' section.
-        Returns: [ { currency: 'EUR', amount: 500, value_czk: 12500, value_usd: 550 } ]
-        """
-        balances = []
+        keep = (currency != '') & ~(np.abs(amount) < 0.01)
+        return {'currency': currency[keep], 'amount': amount[keep]}
+
+    async def live_fx_map(self, currencies) -> Dict[Tuple[str, str, str], float]:
+        """Today's {(currency, date, 'CZK'|'USD'): rate} for currencies: live Yahoo rates, ForexService for the rest."""
         today = datetime.now().strftime("%Y-%m-%d")
+        currencies = list(dict.fromkeys(currencies))
+        live_fx_map = await self.market_data.get_live_fx_rates(currencies, "CZK")
         
-        if df_forex.empty:
-            return []
-            
-        # Iterate rows where Asset Category is Forex
-        # Based on debug: Asset Category, Currency (Base), Description (Actual Curr), Quantity (Amount)
+        # Fallback for missing Live Rates (Yahoo often fails for CZK pairs like HKDCZK=X)
+        missing_live = [c for c in currencies if c not in live_fx_map and c != 'CZK']
+        if missing_live:
+            # We fetch 'today' rate from ForexService (ForexService handles the direct fallback to Frankfurter)
+            fallback_tasks = [self.forex.get_rate_async(c, today, 'CZK') for c in missing_live]
+            fallback_results = await asyncio.gather(*fallback_tasks)
+            for i, cur in enumerate(missing_live):
+                if fallback_results[i] > 0:
+                    live_fx_map[cur] = fallback_results[i]
+
+        fx_map = {} 
+        usd_rate = live_fx_map.get('USD') or 22.0
         
-        for _, row in df_forex.iterrows():
-            cat = str(row.get('Asset Category', ''))
-            if 'Forex' not in cat: continue
-            
-            # IBKR 'Forex Balances' section:
-            # Description = The Currency code (e.g. 'CZK', 'EUR', 'USD')
-            # Quantity = The Balance amount
-            
-            currency = str(row.get('Description', '')).strip()
-            amount = self._parse_float(row.get('Quantity', 0))
-            
-            if not currency or abs(amount) < 0.01: continue
-            
-            # Convert to normalized values
-            if currency == 'CZK': fx_czk = 1.0
-            else: fx_czk = fx_map.get((currency, today, 'CZK'), 1.0)
-            
-            if currency == 'USD': fx_usd = 1.0
-            else: fx_usd = fx_map.get((currency, today, 'USD'), 1.0)
-            
-            balances.append({
-                "currency": currency,
-                "amount": amount,
-                "value_czk": amount * fx_czk,
-                "value_usd": amount * fx_usd
-            })
-            
+        # Populate Map for Today
+        for cur, rate_czk in live_fx_map.items():
+            fx_map[(cur, today, 'CZK')] = rate_czk
+            if usd_rate > 0:
+                fx_map[(cur, today, 'USD')] = rate_czk / usd_rate
+        return fx_map
+
+    def _value_cash(self, cash: Dict[str, np.ndarray], fx_map: Dict) -> List[Dict]:
+        """Cash balances at today's FX (1.0 if a rate is missing), sorted by currency."""
+        currency, amount = cash['currency'], cash['amount']
+        dates = np.full(len(currency), datetime.now().strftime("%Y-%m-%d"), dtype=object)
+        value_czk = amount * self._fx_rates(currency, dates, 'CZK', fx_map, 1.0)
+        value_usd = amount * self._fx_rates(currency, dates, 'USD', fx_map, 1.0)
+
+        balances = [
+            {"currency": c, "amount": a, "value_czk": czk, "value_usd": usd}
+            for c, a, czk, usd in zip(currency, amount.tolist(), value_czk.tolist(), value_usd.tolist())
+        ]
         return sorted(balances, key=lambda x: x['currency'])
 
-    def _get_instruction(self, price: float, meta: Dict) -> Dict:
-        buy_zone = meta.get('buy_zone')
-        sell_zone = meta.get('sell_zone')
-        instr = "Hold"
-        pct_buy, pct_sell = 0.0, 0.0
-
-        if price > 0:
-            if buy_zone:
-                bz = float(buy_zone)
-                pct_buy = (price - bz) / price * 100
-                if price <= bz: instr = "Buy"
-            if sell_zone:
-                sz = float(sell_zone)
-                pct_sell = (sz - price) / price * 100
-                if price >= sz: instr = "Sell"
-        
-        return {"instruction": instr, "pct_to_buy": pct_buy, "pct_to_sell": pct_sell}
-
-    def _parse_float(self, val: Any) -> float:
-        try: return float(str(val).replace(',', ''))
-        except: return 0.0
-
-    def _sanitize(self, obj: Any) -> Any:
-        if isinstance(obj, float):
-            return None if math.isnan(obj) or math.isinf(obj) else obj
-        if isinstance(obj, dict): return {k: self._sanitize(v) for k, v in obj.items()}
-        if isinstance(obj, list): return [self._sanitize(v) for v in obj]
-        return obj
+    def _get_instructions(self, prices: np.ndarray, metas: List[Dict]) -> List[Dict]:
+        """Buy/Sell/Hold per position from the metadata zones (Sell wins when both trigger)."""
+        buy_zone = np.array([float(m['buy_zone']) if m.get('buy_zone') else np.nan for m in metas], dtype=np.float64)
+        sell_zone = np.array([float(m['sell_zone']) if m.get('sell_zone') else np.nan for m in metas], dtype=np.float64)
+        priced = prices > 0
+        has_buy = priced & ~np.isnan(buy_zone)
+        has_sell = priced & ~np.isnan(sell_zone)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct_buy = np.where(has_buy, (prices - buy_zone) / prices * 100, 0.0)
+            pct_sell = np.where(has_sell, (sell_zone - prices) / prices * 100, 0.0)
+        instr = np.where(has_sell & (prices >= sell_zone), "Sell",
+                         np.where(has_buy & (prices <= buy_zone), "Buy", "Hold"))
+
+        return [{"instruction": str(i), "pct_to_buy": b, "pct_to_sell": s}
+                for i, b, s in zip(instr, pct_buy.tolist(), pct_sell.tolist())]
+
+    @staticmethod
+    def _same(a: Any, b: Any) -> bool:
+        """Equality for diff(): NaN (missing price/value) equals NaN."""
+        if a == b:
+            return True
+        return isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b)
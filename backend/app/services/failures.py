@@ -0,0 +1,66 @@
+import time
+from typing import Any, Dict, List, Optional
+from .persistence import WriteBehindCache
+
+class FailureRegistry:
+    """
+    Persisted record of symbols Yahoo failed to resolve, with exponential backoff.
+
+    Failures are classified:
+    - "network": the whole request failed (timeout, rate limit, empty batch) - short backoff
+    - "not_found": the request worked but returned nothing for the symbol - long backoff
+
+    Each consecutive failure of the same kind doubles the backoff up to the kind's cap; a change
+    of kind restarts at that kind's first backoff. Network failures never escalate to "not_found",
+    so an outage can't suppress a symbol for longer than the network cap.
+    A successful fetch clears the entry.
+    """
+
+    # kind -> (first backoff, max backoff) in seconds
+    BACKOFF = {
+        "network": (60, 3600),
+        "not_found": (6 * 3600, 7 * 86400),
+    }
+
+    def __init__(self, directory: str):
+        # One small segment file: {symbol: {kind, count, first_failed, last_failed, retry_at, error}}
+        self.entries = WriteBehindCache(directory, lambda key: "failures")
+
+    def is_suppressed(self, symbol: str, now: Optional[float] = None) -> bool:
+        entry = self.entries.get(symbol)
+        return bool(entry) and (now or time.time()) < entry['retry_at']
+
+    def record(self, symbol: str, kind: str, error: str = "") -> Dict[str, Any]:
+        """Registers a failed fetch and schedules the next retry."""
+        now = time.time()
+        previous = self.entries.get(symbol) or {}
+        count = previous.get('count', 0) + 1 if previous.get('kind') == kind else 1
+
+        base, cap = self.BACKOFF[kind]
+        delay = min(base * 2 ** (count - 1), cap)
+        entry = {
+            'kind': kind,
+            'count': count,
+            'first_failed': previous.get('first_failed', now),
+            'last_failed': now,
+            'retry_at': now + delay,
+            'error': error[:200],
+        }
+        self.entries[symbol] = entry
+        return entry
+
+    def clear(self, symbol: str) -> bool:
+        """Forgets a symbol (fetched successfully or reset by the user)."""
+        if symbol in self.entries:
+            del self.entries[symbol]
+            return True
+        return False
+
+    def suppressed(self) -> List[Dict[str, Any]]:
+        """Currently suppressed symbols, soonest retry first."""
+        now = time.time()
+        items = [{'symbol': s, **e} for s, e in self.entries.items() if now < e['retry_at']]
+        return sorted(items, key=lambda e: e['retry_at'])
+
+    def close(self):
+        self.entries.close()
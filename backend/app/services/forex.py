@@ -1,8 +1,21 @@
 import requests
-import json
 import os
 from datetime import datetime
 import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from .persistence import WriteBehindCache
+
+# Process-wide instance (see get_forex_service)
+_shared_instance: Optional["ForexService"] = None
+
+def get_forex_service() -> "ForexService":
+    """Returns the process-wide ForexService (one rate cache shared by engine and reconstructor)."""
+    global _shared_instance
+    if _shared_instance is None:
+        _shared_instance = ForexService()
+    return _shared_instance
 
 class ForexService:
     def __init__(self, cache_file="backend/data/forex_cache.json"):
@@ -13,25 +26,18 @@ class ForexService:
         else:
             self.cache_file = os.path.join(base_dir or os.getcwd(), cache_file)
             
-        self.cache = self._load_cache()
+        # Write-behind: segments in forex_cache/, flushed in the background
+        self.cache = WriteBehindCache(os.path.splitext(self.cache_file)[0], self._cache_segment,
+                                      legacy_file=self.cache_file)
+        self.generation = 0  # Bumped whenever a newly fetched rate is cached
+        # CNB yearly rate tables: {year: (fetched_at, DataFrame of CZK per unit, dates x currencies)}
+        self._cnb_years: Dict[int, Tuple[float, pd.DataFrame]] = {}
         self.api_url = "https://api.frankfurter.app"
 
-    def _load_cache(self):
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-
-    def _save_cache(self):
-        try:
-            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, 'w') as f:
-                json.dump(self.cache, f, indent=2)
-        except Exception as e:
-            print(f"Warning: Could not save forex cache: {e}")
+    @staticmethod
+    def _cache_segment(key: str) -> str:
+        """Persistence segment: one per currency pair and year (USD_CZK_2024-01-31 -> USD_CZK_2024)."""
+        return key.rsplit('-', 2)[0]
 
     def get_rate(self, currency: str, date_str: str, target_currency: str = "CZK") -> float:
         """
@@ -94,7 +100,7 @@ class ForexService:
              
         if rate > 0:
             self.cache[key] = rate
-            self._save_cache()
+            self.generation += 1
             return rate * factor
             
         return 0.0
@@ -145,6 +151,82 @@ class ForexService:
             return 0.0
         except: return 0.0
 
+    # The current year's table is re-downloaded at most this often (past years are final)
+    CNB_YEAR_TTL = 3600
+
+    def get_rate_history(self, currencies: List[str], start: str, end: str) -> pd.DataFrame:
+        """
+        CZK per unit of each currency on every CNB publication day in [start, end], plus the
+        last one before start (so callers can forward-fill weekends and holidays).
+        One request per calendar year (CNB yearly table) instead of one per day; rates are also
+        written to the cache under the same keys get_rate() uses. Unknown currencies are left out.
+        """
+        currencies = [c.upper().strip() for c in dict.fromkeys(currencies) if c and c.upper().strip() != "CZK"]
+        start_year = int(start[:4])
+        tables = [self._cnb_year(year) for year in range(start_year - 1, int(end[:4]) + 1)]
+        table = pd.concat([t for t in tables if not t.empty]) if any(not t.empty for t in tables) else pd.DataFrame()
+        if table.empty:
+            return pd.DataFrame(columns=currencies, dtype=np.float64)
+
+        table = table[[c for c in currencies if c in table.columns]]
+        before = table.index[table.index < pd.Timestamp(start)]
+        lo = before[-1] if len(before) else pd.Timestamp(start)
+        table = table[(table.index >= lo) & (table.index <= pd.Timestamp(end))]
+
+        added = 0
+        for currency, column in table.items():
+            for date, rate in zip(column.index.strftime("%Y-%m-%d"), column.tolist()):
+                key = f"{currency}_CZK_{date}"
+                if rate > 0 and key not in self.cache:
+                    self.cache[key] = rate
+                    added += 1
+        if added:
+            self.generation += 1
+        return table
+
+    def _cnb_year(self, year: int) -> pd.DataFrame:
+        cached = self._cnb_years.get(year)
+        if cached and (year < datetime.now().year or time.time() - cached[0] < self.CNB_YEAR_TTL):
+            return cached[1]
+        table = self._fetch_cnb_year(year)
+        if not table.empty or cached is None:
+            self._cnb_years[year] = (time.time(), table)
+        return self._cnb_years[year][1]
+
+    def _fetch_cnb_year(self, year: int) -> pd.DataFrame:
+        """
+        Parses the CNB yearly table:
+        Datum|1 AUD|1 BGN|...|100 JPY|...
+        02.01.2024|15,231|12,437|...
+        The header repeats (and may change) when the currency list changes during the year.
+        """
+        try:
+            url = f"https://www.cnb.cz/cs/financni-trhy/devizovy-trh/kurzy-devizoveho-trhu/kurzy-devizoveho-trhu/rok.txt?rok={year}"
+            resp = requests.get(url, timeout=10)
+            if resp.status_code != 200:
+                print(f"CNB API Error {resp.status_code} (year {year})")
+                return pd.DataFrame()
+
+            rows = []
+            header = None
+            for line in resp.text.strip().split('\n'):
+                parts = line.strip().split('|')
+                if parts[0] == 'Datum':
+                    # "100 JPY" -> (100, 'JPY')
+                    header = [(float(q), code) for q, code in (p.split(' ', 1) for p in parts[1:])]
+                    continue
+                if header is None or len(parts) != len(header) + 1:
+                    continue
+                date = datetime.strptime(parts[0], "%d.%m.%Y")
+                rows.append({'date': date, **{code: float(v.replace(',', '.')) / qty
+                                              for (qty, code), v in zip(header, parts[1:]) if v}})
+            if not rows:
+                return pd.DataFrame()
+            return pd.DataFrame(rows).set_index('date').sort_index()
+        except Exception as e:
+            print(f"Error fetching CNB year {year}: {e}")
+            return pd.DataFrame()
+
     async def get_rate_async(self, currency: str, date_str: str, target_currency: str = "CZK") -> float:
         """
         Async version of get_rate.
@@ -0,0 +1,62 @@
+import time
+from typing import Any, Dict, Iterable, List, Optional
+import yfinance as yf
+from .persistence import WriteBehindCache
+
+class InstrumentTable:
+    """
+    Local table of static instrument data keyed by Yahoo symbol:
+    name, country, sector, industry, quote currency and quote type.
+
+    Filled by an enrichment job (MarketDataService.enrich_instruments) that calls the
+    slow t.info once per new symbol, so the live quote path is a dict lookup.
+    Symbols Yahoo can't describe are retried after RETRY_DAYS.
+    """
+
+    RETRY_DAYS = 7
+
+    def __init__(self, directory: str):
+        # {yahoo symbol: {name, country, sector, industry, currency, quote_type, resolved_at[, error]}}
+        self.entries = WriteBehindCache(directory, lambda key: "instruments")
+
+    def get(self, symbol: str) -> Dict[str, Any]:
+        entry = self.entries.get(symbol)
+        return entry if entry and 'error' not in entry else {}
+
+    def missing(self, symbols: Iterable[str]) -> List[str]:
+        """Symbols never resolved, or whose last failed attempt is older than RETRY_DAYS."""
+        cutoff = time.time() - self.RETRY_DAYS * 86400
+        result = []
+        for symbol in dict.fromkeys(symbols):
+            entry = self.entries.get(symbol)
+            if entry is None or ('error' in entry and entry['resolved_at'] < cutoff):
+                result.append(symbol)
+        return result
+
+    def resolve(self, symbol: str) -> Dict[str, Any]:
+        """Fetches and stores one symbol's static data. Blocking - run in an executor."""
+        try:
+            info = yf.Ticker(symbol).info or {}
+        except Exception as e:
+            info, error = {}, str(e)
+        else:
+            error = "no info returned"
+
+        name = info.get('longName') or info.get('shortName')
+        if not name:
+            entry = {'resolved_at': time.time(), 'error': error[:200]}
+        else:
+            entry = {
+                'name': name,
+                'country': info.get('country'),
+                'sector': info.get('sector'),
+                'industry': info.get('industry'),
+                'currency': info.get('currency'),
+                'quote_type': info.get('quoteType'),
+                'resolved_at': time.time(),
+            }
+        self.entries[symbol] = entry
+        return entry
+
+    def close(self):
+        self.entries.close()
@@ -0,0 +1,131 @@
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+from .persistence import WriteBehindCache
+
+class LocationIndex:
+    """
+    Country and region classification of positions.
+
+    The tables below are compiled once into dict lookups (exchange suffix, country -> region,
+    IBKR -> Yahoo mapped symbols), and each symbol's result is memoized with the inputs it was
+    derived from (ISIN, live country, metadata override, currency) and persisted in `directory`.
+    An entry is recomputed only when one of those inputs, or the tables themselves, change.
+    """
+
+    # Region Mappings
+    REGIONS = {
+        "North America": ["US", "CA"],
+        "Europe": ["DE", "GB", "FR", "IT", "ES", "NL", "CH", "SE", "NO", "DK", "FI", "IE", "AT", "BE", "PT", "CZ", "PL"],
+        "Asia": ["CN", "JP", "KR", "TW", "HK", "IN", "SG", "ID", "MY", "TH", "VN"],
+        "South America": ["BR", "AR", "CL", "CO", "PE", "MX"],
+        "Pacific": ["AU", "NZ"],
+        "Emerging": ["ZA", "SA", "TR", "AE"]
+    }
+    
+    # Suffix to Country
+    SUFFIX_MAP = {
+        ".DE": "DE", ".F": "DE", ".MU": "DE", ".BE": "DE", ".HA": "DE", ".DU": "DE",
+        ".L": "GB", ".AS": "NL", ".PA": "FR", ".MI": "IT", ".MC": "ES",
+        ".ST": "SE", ".OL": "NO", ".CO": "DK", ".HE": "FI",
+        ".HK": "HK", ".T": "JP", ".KS": "KR", ".SS": "CN", ".SZ": "CN",
+        ".AX": "AU", ".TO": "CA", ".SW": "CH",
+        ".PR": "CZ"
+    }
+
+    COUNTRY_NAME_MAP = {
+        "United States": "US", "USA": "US",
+        "China": "CN", "Hong Kong": "HK",
+        "Germany": "DE", "United Kingdom": "GB", "Great Britain": "GB", "UK": "GB",
+        "France": "FR", "Italy": "IT", "Spain": "ES", "Netherlands": "NL",
+        "Sweden": "SE", "Norway": "NO", "Denmark": "DK", "Finland": "FI",
+        "Switzerland": "CH", "Canada": "CA", "Australia": "AU", "Japan": "JP",
+        "South Korea": "KR", "Taiwan": "TW", "India": "IN", "Singapore": "SG",
+        "Brazil": "BR", "Mexico": "MX", "South Africa": "ZA",
+        "Ireland": "IE", "Belgium": "BE", "Austria": "AT", "Portugal": "PT",
+        "Poland": "PL", "Czech Republic": "CZ", "Czechia": "CZ", "Luxembourg": "LU",
+        "Argentina": "AR", "Chile": "CL", "Israel": "IL", "Kazakhstan": "KZ", "Uruguay": "UY",
+        "Cayman Islands": "CN" # Tax haven, usually Chinese tech (BABA, JD, BIDU)
+    }
+
+    # Currency fallback when the country can't be detected
+    CURRENCY_COUNTRY = {
+        "USD": "US", "GBP": "GB", "EUR": "DE",  # Generic Eurozone
+        "CZK": "CZ", "HKD": "HK", "SEK": "SE", "PLN": "PL", "AUD": "AU",
+        "CAD": "CA", "JPY": "JP", "CHF": "CH", "CNY": "CN", "SGD": "SG",
+    }
+
+    # Manual Overrides for specific tickers (when ISIN/Live data fails or is misleading)
+    TICKER_OVERRIDE = {
+        "BABA": "CN", "9988.HK": "CN",
+        "JD": "CN", "BIDU": "CN",
+        "PDD": "CN", "TCEHY": "CN",
+        "TSM": "TW", 
+        "NIO": "CN", "XPEV": "CN", "LI": "CN",
+        "BYDDY": "CN"
+    }
+
+    def __init__(self, directory: str, mapping: Optional[Dict[str, str]] = None):
+        # Suffix lookup by the text after the last '.' ('BMW.DE' -> 'DE')
+        self.suffix_country = {suffix[1:]: country for suffix, country in self.SUFFIX_MAP.items()}
+        # First region listing a country wins (same as scanning REGIONS in order)
+        self.country_region: Dict[str, str] = {}
+        for region, countries in self.REGIONS.items():
+            for country in countries:
+                self.country_region.setdefault(country, region)
+        # Legacy IBKR -> Yahoo mapping, resolved to the mapped symbol's exchange country
+        self.mapped_country = {symbol: self._suffix_country(mapped) for symbol, mapped in (mapping or {}).items()
+                               if self._suffix_country(mapped)}
+
+        # Memo entries derived from other tables are ignored
+        tables = (self.REGIONS, self.SUFFIX_MAP, self.COUNTRY_NAME_MAP, self.CURRENCY_COUNTRY,
+                  self.TICKER_OVERRIDE, sorted(self.mapped_country.items()))
+        self.version = hashlib.sha1(repr(tables).encode()).hexdigest()[:12]
+        # {symbol: {'inputs': [isin, live country, override, currency, version], 'country', 'region'}}
+        self.memo = WriteBehindCache(directory, lambda key: "locations")
+
+    def _suffix_country(self, symbol: str) -> Optional[str]:
+        _, dot, suffix = symbol.rpartition('.')
+        return self.suffix_country.get(suffix) if dot else None
+
+    def detect_country(self, symbol: str, isin: str = "", live_country_name: str = None, metadata_override: str = None) -> str:
+        # 1. Metadata Override (Highest Priority - User Defined)
+        if metadata_override and len(metadata_override) == 2:
+            return metadata_override.upper()
+
+        # 2. Manual System Override (Known ADRs/Exceptions)
+        override = self.TICKER_OVERRIDE.get(symbol) or self.TICKER_OVERRIDE.get(symbol.split('.')[0])
+        if override:
+            return override
+
+        # 3. Live Data Name (Economic Reality - HQ)
+        if live_country_name:
+            iso = self.COUNTRY_NAME_MAP.get(live_country_name)
+            if iso: return iso
+
+        # 4. ISIN (Legal Domicile Fallback)
+        if isin and len(isin) >= 2:
+            return isin[:2].upper()
+
+        # 5. Ticker Suffix Fallback (Exchange Location), then 6. Legacy Market Mapping
+        return self._suffix_country(symbol) or self.mapped_country.get(symbol) or "Unknown"
+
+    def region(self, country: str) -> str:
+        return self.country_region.get(country, "Other")
+
+    def classify(self, symbol: str, isin: str = "", live_country_name: str = None,
+                 metadata_override: Any = None, currency: str = "") -> Tuple[str, str]:
+        """(country, region) for a position; falls back to the currency's country when undetectable."""
+        inputs = [isin, live_country_name, metadata_override, currency, self.version]
+        entry = self.memo.get(symbol)
+        if entry is not None and entry['inputs'] == inputs:
+            return entry['country'], entry['region']
+
+        country = self.detect_country(symbol, isin, live_country_name, metadata_override)
+        if country == "Unknown":
+            country = self.CURRENCY_COUNTRY.get(currency, country)
+        region = self.region(country)
+        self.memo[symbol] = {'inputs': inputs, 'country': country, 'region': region}
+        return country, region
+
+    def close(self):
+        self.memo.close()
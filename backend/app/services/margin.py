@@ -3,6 +3,7 @@ from bs4 import BeautifulSoup
 import json
 import os
 import time
+import numpy as np
 from typing import Dict, Optional, Tuple
 
 class MarginRatesFetcher:
@@ -89,3 +90,18 @@ class MarginService:
         effective_rate = (total_annual_cost / debt) * 100.0 if debt > 0 else 0.0
         
         return total_annual_cost, daily_cost, effective_rate
+
+    def calculate_daily_costs(self, currency: str, balances: np.ndarray) -> np.ndarray:
+        """Vectorized calculate_daily_cost: daily interest for an array of balances in one currency."""
+        balances = np.asarray(balances, dtype=np.float64)
+        debt = np.where(balances < -0.01, -balances, 0.0)
+        tiers = self.FALLBACK_TIERS.get(currency, [(float('inf'), 6.0)])
+
+        annual = np.zeros(debt.shape)
+        previous_limit = 0.0
+        for limit, rate in tiers:
+            annual += np.clip(debt - previous_limit, 0.0, limit - previous_limit) * (rate / 100.0)
+            previous_limit = limit
+
+        day_count = 360.0 if currency in ['USD', 'EUR'] else 365.0
+        return annual / day_count
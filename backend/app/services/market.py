@@ -1,15 +1,39 @@
 import yfinance as yf
+import pandas as pd
+import numpy as np
 import asyncio
 import time
 import os
 import json
 import functools
+import hashlib
 import math
-from datetime import datetime, timedelta
+import re
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional, List
+from .persistence import WriteBehindCache
+from .ohlcv_store import OHLCVStore
+from .market_hours import MarketHours
+from .failures import FailureRegistry
+from .instruments import InstrumentTable
+
+# Process-wide instance (see get_market_service)
+_shared_instance: Optional["MarketDataService"] = None
+
+def get_market_service() -> "MarketDataService":
+    """
+    Returns the process-wide MarketDataService.
+    All consumers share one cache, one throttle and one failure registry,
+    so they don't overwrite each other's market_cache.json.
+    """
+    global _shared_instance
+    if _shared_instance is None:
+        _shared_instance = MarketDataService()
+    return _shared_instance
 
 class MarketDataService:
-    def __init__(self, cache_file="backend/data/market_cache.json", cache_expiry_minutes=5):
+    def __init__(self, cache_file="backend/data/market_cache.json", cache_expiry_minutes=5, max_stale_minutes=24 * 60,
+                 max_quotes=5000, quote_retention_days=7, ohlcv_memory_mb=64, ohlcv_disk_mb=512):
         # 1. Setup Cache Path - Go to Project Root (4 levels up from backend/app/services/market.py)
         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
         if os.path.isabs(cache_file):
@@ -20,13 +44,43 @@ class MarketDataService:
         self.metadata_file = os.path.join(base_dir, "backend/data/metadata.json")
             
         self.cache_expiry_minutes = cache_expiry_minutes
+        self.max_stale_minutes = max_stale_minutes  # Hard max age for serving stale quotes
         self.last_request_time: float = 0
         self.MIN_DELAY = 1.0  # Seconds between requests
+        self.BATCH_SIZE = 50  # Symbols per bulk download
+        self.QUOTE_PERIOD = "5d"  # Daily bars per live quote download (last price + previous close)
+        self._throttle_lock = asyncio.Lock()
+        self._revalidating: set = set()  # Symbols with a background refresh in flight
+        self._background_tasks: set = set()
+        self.hours = MarketHours()  # Cache until the next open while a venue is closed
+        self.generation = 0  # Bumped on every quote cache update
+        self._updated = asyncio.Condition()
         
-        # 2. Load Cache
-        self.cache = self._load_cache()
+        # 2. Load Cache (write-behind: segments in market_cache/, flushed in the background)
+        # Bounded: LRU beyond max_quotes, quotes older than the retention window are dropped
+        self.quote_retention_days = quote_retention_days
+        self.cache = WriteBehindCache(os.path.splitext(self.cache_file)[0], self._cache_segment,
+                                      legacy_file=self.cache_file, max_entries=max_quotes,
+                                      is_expired=self._quote_expired)
         self.metadata = self._load_metadata()
 
+        # Persisted failure registry with exponential backoff (replaces the old 1 hour cooldown)
+        self.failures = FailureRegistry(os.path.join(os.path.dirname(self.cache_file), "failures"))
+
+        # Static instrument data (name, country, sector...) filled by enrich_instruments
+        self.instruments = InstrumentTable(os.path.join(os.path.dirname(self.cache_file), "instruments"))
+
+        # Per Yahoo symbol: reported quote currency (resolved once) and the 52-week range (refreshed daily),
+        # so live quote refreshes only download the last few days: {symbol: {currency, high52, low52, day}}
+        self.quote_reference = WriteBehindCache(os.path.join(os.path.dirname(self.cache_file), "quote_reference"),
+                                                lambda key: "quote_reference")
+
+        # Chart bars live in the columnar store next to the cache (legacy ohlcv_* cache entries are dropped)
+        self.ohlcv = OHLCVStore(os.path.join(os.path.dirname(self.cache_file), "ohlcv"),
+                                max_memory_bytes=ohlcv_memory_mb * 2**20, max_disk_bytes=ohlcv_disk_mb * 2**20)
+        for key in [k for k in self.cache if k.startswith('ohlcv_')]:
+            del self.cache[key]
+
         # 3. Ticker Mapping (IBKR -> YFinance)
         self.MAPPING = {
             'ZAL': 'ZAL.DE',
@@ -38,6 +92,15 @@ class MarketDataService:
             'EVO': 'EVO.ST'
         }
 
+    # Exchange Suffix -> Quote Currency (GBp = LSE pence)
+    SUFFIX_CURRENCY = {
+        ".DE": "EUR", ".F": "EUR", ".MU": "EUR", ".BE": "EUR", ".HA": "EUR", ".DU": "EUR",
+        ".AS": "EUR", ".PA": "EUR", ".MI": "EUR", ".MC": "EUR", ".HE": "EUR", ".BR": "EUR",
+        ".L": "GBp", ".ST": "SEK", ".OL": "NOK", ".CO": "DKK", ".SW": "CHF",
+        ".HK": "HKD", ".T": "JPY", ".KS": "KRW", ".SS": "CNY", ".SZ": "CNY",
+        ".AX": "AUD", ".TO": "CAD", ".PR": "CZK", ".WA": "PLN"
+    }
+
     def _load_metadata(self) -> Dict:
         if os.path.exists(self.metadata_file):
             try:
@@ -46,23 +109,30 @@ class MarketDataService:
             except: return {}
         return {}
 
-    def _load_cache(self) -> Dict:
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading cache: {e}")
-                return {}
-        return {}
+    @staticmethod
+    def _cache_segment(key: str) -> str:
+        """
+        Persistence segment: one per OHLCV symbol; quotes are spread over 16 buckets by key hash,
+        so a refresh cycle only rewrites the buckets it touched.
+        """
+        if key.startswith('ohlcv_'):
+            return key.rsplit('_', 1)[0]
+        return 'quotes-' + hashlib.sha1(key.encode()).hexdigest()[0]
 
-    def _save_cache(self):
+    def _quote_expired(self, entry: Any) -> bool:
+        """True for quote cache entries older than the retention window."""
         try:
-            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, 'w') as f:
-                json.dump(self.cache, f, indent=2)
-        except Exception as e:
-            print(f"Warning: Could not save market cache: {e}")
+            fetched = datetime.fromisoformat(entry['timestamp'])
+        except Exception:
+            return False
+        return datetime.now() - fetched > timedelta(days=self.quote_retention_days)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Occupancy of the quote cache and the bar store against their budgets."""
+        return {'quotes': self.cache.stats(), 'bars': self.ohlcv.stats()}
+
+    # IBKR option contract: TICKER DDMMMYY STRIKE C/P
+    OPTION_PATTERN = re.compile(r'^(\w+)\s+(\d{2})([A-Z]{3})(\d{2})\s+([\d\.]+)\s+([CP])$')
 
     def _sanitize_symbol(self, symbol: str) -> str:
         if symbol in self.MAPPING:
@@ -70,8 +140,7 @@ class MarketDataService:
         
         # 1. Try Option Conversion (IBKR to Yahoo)
         # Format: TICKER DDMMMYY STRIKE C/P (e.g. SOFI 20FEB26 26 P)
-        import re
-        opt_match = re.match(r'^(\w+)\s+(\d{2})([A-Z]{3})(\d{2})\s+([\d\.]+)\s+([CP])$', symbol.strip())
+        opt_match = self.OPTION_PATTERN.match(symbol.strip())
         if opt_match:
             ticker, day, mon_str, year, strike, otype = opt_match.groups()
             months = {'JAN':'01','FEB':'02','MAR':'03','APR':'04','MAY':'05','JUN':'06',
@@ -87,278 +156,537 @@ class MarketDataService:
 
         return symbol.replace(' ', '-')
 
-    async def get_live_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+    async def get_live_prices(self, symbols: List[str], force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns quotes for symbols with stale-while-revalidate semantics:
+        - fresh (< cache_expiry_minutes while the venue is open, until the next open while closed): served from cache
+        - stale (< max_stale_minutes): served at once, tagged stale, refreshed in the background
+        - older / missing: fetched inline
+        Every returned quote carries 'age_seconds', 'stale' and 'as_of' (ISO time it was fetched).
+        force=True refetches regardless of cache age (used by the background refresher).
+        """
         results = {}
         to_fetch = []
+        to_revalidate = []
         now = datetime.now()
 
-        # Initialize failure tracking if not present
-        if not hasattr(self, 'failed_symbols'):
-            self.failed_symbols = {} # {symbol: expiry_timestamp}
-
         # 1. Check Cache & Filter failures
         for sym in symbols:
-            # Skip recently failed symbols (1 hour cooldown)
-            fail_expiry = self.failed_symbols.get(sym)
-            if fail_expiry and time.time() < fail_expiry:
-                continue
-
             entry = self.cache.get(sym)
+            age = None
             if entry and 'timestamp' in entry and 'data' in entry:
                 try:
-                    last_updated = datetime.fromisoformat(entry['timestamp'])
-                    if (now - last_updated) < timedelta(minutes=self.cache_expiry_minutes):
-                        results[sym] = entry['data']
-                        continue
+                    age = (now - datetime.fromisoformat(entry['timestamp'])).total_seconds()
                 except: pass
-            to_fetch.append(sym)
 
-        if not to_fetch:
-            return results
+            if age is not None:
+                stale = now.timestamp() >= self.quote_expires_at(sym)
+                if not stale or age < self.max_stale_minutes * 60:
+                    results[sym] = {**entry['data'], 'age_seconds': age, 'stale': stale, 'as_of': entry['timestamp']}
+                    if not force and not stale:
+                        continue
 
-        # 2. Fetch from yfinance
-        loop = asyncio.get_event_loop()
-        sanitized_map = {s: self._sanitize_symbol(s) for s in to_fetch}
-        sanitized_list = list(sanitized_map.values())
-        
+            # Skip symbols in failure backoff - stale value (if any) is still served
+            if self.failures.is_suppressed(sym):
+                continue
+
+            if sym in results and not force:
+                to_revalidate.append(sym)
+            else:
+                to_fetch.append(sym)
+
+        if to_revalidate:
+            self._revalidate(to_revalidate)
+
+        if to_fetch:
+            results.update(await self._fetch_live_prices(to_fetch))
+        return results
+
+    def quote_expires_at(self, symbol: str) -> float:
+        """Unix time when the cached quote for a symbol expires (0 if not cached)."""
+        entry = self.cache.get(symbol)
         try:
-            # Throttle
+            fetched_at = datetime.fromisoformat(entry['timestamp']).timestamp()
+        except Exception:
+            return 0.0
+        return self.hours.expires_at(self._sanitize_symbol(symbol), fetched_at, self.cache_expiry_minutes * 60)
+
+    def expiring(self, symbols: List[str], within: float) -> List[str]:
+        """Symbols whose cached quote is missing or expires within `within` seconds."""
+        horizon = time.time() + within
+        return [s for s in symbols if self.quote_expires_at(s) <= horizon]
+
+    async def _throttle(self):
+        """Shared request spacing: waits until MIN_DELAY has passed since the last upstream request."""
+        async with self._throttle_lock:
             elapsed = time.time() - self.last_request_time
             if elapsed < self.MIN_DELAY:
                 await asyncio.sleep(self.MIN_DELAY - elapsed)
-
-            # Tickers batch fetch (fast_info is available on the Tickers object)
-            tickers_obj = await loop.run_in_executor(None, lambda: yf.Tickers(" ".join(sanitized_list)))
-            
-            # We will process each ticker with a task to fetch details if needed
-            async def process_ticker(orig, san):
-                try:
-                    t = tickers_obj.tickers.get(san)
-                    if not t: return None
-                    
-                    data = {}
-                    is_option = len(san) > 15 and any(c in san for c in ['C', 'P'])
-                    is_forex = san.endswith('=X')
-
-                    # 1. Try fast_info (Price & Basic Info)
-                    try:
-                        fi = t.fast_info
-                        data['price'] = fi.last_price
-                        data['high52'] = fi.year_high
-                        data['low52'] = fi.year_low
-                        currency = getattr(fi, 'currency', None)
-                    except:
-                        currency = None
-
-                    # 2. Fallbacks for Price
-                    if not data.get('price'):
-                        hist = await loop.run_in_executor(None, lambda: t.history(period="1d"))
-                        if not hist.empty:
-                            data['price'] = hist['Close'].iloc[-1]
-                    
-                    # 3. Metadata (Name, Country)
-                    # Skip slow t.info for options and forex
-                    if is_option:
-                        data['name'] = orig # Keep original string for options
-                        data['country'] = "N/A"
-                    elif is_forex:
-                        data['name'] = f"Currency Pair {orig}"
-                        data['country'] = "N/A"
-                    else:
-                        # OPTIMIZATION: Use local metadata instead of slow t.info
-                        # Try to get Name/Country from our metadata.json first
-                        # Note: we use 'orig' symbol for lookup as key in metadata usually matches that
-                        meta_entry = self.metadata.get(orig, {})
-                        
-                        data['name'] = meta_entry.get('name') or meta_entry.get('longName') 
-                        data['country'] = meta_entry.get('country')
-                        
-                        # Fallback if missing
-                        if not data['name']:
-                             # Try t.fast_info currency as a hint? No, just use symbol
-                             data['name'] = orig
-                             
-                        if not data['country']:
-                             data['country'] = "Unknown"
-
-                        if not currency: 
-                            currency = getattr(fi, 'currency', 'USD') # Default to USD if unknown
-
-                    # Normalization
-                    if currency == 'GBp' and data.get('price'):
-                        for key in ['price', 'high52', 'low52']:
-                            if data.get(key): data[key] /= 100.0
-
-                    if data.get('price') and not (isinstance(data['price'], float) and (math.isnan(data['price']) or math.isinf(data['price']))):
-                        return orig, data
-                    else:
-                        # Mark as failed to avoid retrying every request
-                        self.failed_symbols[orig] = time.time() + 3600
-                        return None
-                except Exception as e:
-                    # print(f"Error processing {orig}: {e}")
-                    self.failed_symbols[orig] = time.time() + 3600
-                    return None
-
-            # Run all ticker processing in parallel
-            tasks = [process_ticker(orig, san) for orig, san in sanitized_map.items()]
-            processed_results = await asyncio.gather(*tasks)
-
-            for item in processed_results:
-                if item:
-                    orig, data = item
-                    results[orig] = data
-                    self.cache[orig] = {
-                        'data': data,
-                        'timestamp': now.isoformat()
-                    }
-
-            self._save_cache()
             self.last_request_time = time.time()
-            
-        except Exception as e:
-            print(f"Batch fetch error: {e}")
 
+    def _revalidate(self, symbols: List[str]):
+        """Schedules a background refetch for stale symbols (deduplicated against in-flight ones)."""
+        pending = [s for s in symbols if s not in self._revalidating]
+        if not pending:
+            return
+        self._revalidating.update(pending)
+
+        async def run():
+            try:
+                await self._fetch_live_prices(pending)
+            except Exception as e:
+                print(f"Revalidation error: {e}")
+            finally:
+                self._revalidating.difference_update(pending)
+
+        task = asyncio.create_task(run())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _fetch_live_prices(self, to_fetch: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetches quotes from yfinance and stores them in the cache. Returns only the fetched quotes."""
+        results = {}
+        now = datetime.now()
+
+        # Fetch from yfinance in bulk (one download per chunk instead of per-ticker fast_info calls)
+        loop = asyncio.get_event_loop()
+        sanitized_map = {s: self._sanitize_symbol(s) for s in to_fetch}
+        sanitized_list = list(dict.fromkeys(sanitized_map.values()))
+
+        quotes = {}
+        batch_errors = {}  # {sanitized: error} for symbols whose whole batch failed
+        for i in range(0, len(sanitized_list), self.BATCH_SIZE):
+            chunk = sanitized_list[i:i + self.BATCH_SIZE]
+            try:
+                await self._throttle()
+                batch = await loop.run_in_executor(None, self._fetch_quotes_batch, chunk)
+                quotes.update(batch)
+                if not batch:
+                    batch_errors.update(dict.fromkeys(chunk, "empty batch"))
+            except Exception as e:
+                print(f"Batch fetch error: {e}")
+                batch_errors.update(dict.fromkeys(chunk, str(e)))
+            finally:
+                self.last_request_time = time.time()
+
+        for orig, san in sanitized_map.items():
+            data = quotes.get(san)
+            if not data:
+                # Back off: a failed/empty batch looks transient, a hole in a good batch looks like a bad symbol.
+                # Option contracts always take the long backoff: the engine marks them with a model meanwhile
+                if san in batch_errors and not self.OPTION_PATTERN.match(orig.strip()):
+                    self.failures.record(orig, "network", batch_errors[san])
+                else:
+                    self.failures.record(orig, "not_found", "no data returned")
+                continue
+            self.failures.clear(orig)
+
+            data = {**data, **self._describe(orig, san)}
+            results[orig] = {**data, 'age_seconds': 0.0, 'stale': False, 'as_of': now.isoformat()}
+            self.cache[orig] = {
+                'data': data,
+                'timestamp': now.isoformat()
+            }
+
+        if results:
+            # Wake up live portfolio streams
+            self.generation += 1
+            async with self._updated:
+                self._updated.notify_all()
         return results
 
-    async def get_ohlcv(self, symbol: str, range_period: str) -> Dict[str, Any]:
+    async def wait_for_update(self, generation: int, timeout: float) -> int:
         """
-        Fetches OHLCV data for detailed charts.
+        Waits until the quote cache generation moves past `generation` (or timeout).
+        Returns the current generation.
+        """
+        async with self._updated:
+            try:
+                await asyncio.wait_for(self._updated.wait_for(lambda: self.generation > generation), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return self.generation
+
+    def _fetch_quotes_batch(self, sanitized: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Downloads the last few daily bars for all symbols in a single yf.download call and
+        derives last price and previous close. The 52-week range comes from the quote reference
+        (one 1y download per symbol per day) and the currency is the one Yahoo reports.
+        Blocking - run in an executor.
+        """
+        self._refresh_quote_reference(sanitized)
+        hist = yf.download(sanitized, period=self.QUOTE_PERIOD, interval="1d", group_by="ticker",
+                           auto_adjust=False, progress=False, threads=True)
+        if hist is None or hist.empty:
+            return {}
+
+        quotes = {}
+        for san in sanitized:
+            try:
+                frame = self._ticker_frame(hist, san)
+                if frame is None: continue
+
+                closes = frame['Close'].dropna()
+                if closes.empty: continue
+
+                price = float(closes.iloc[-1])
+                if math.isnan(price) or math.isinf(price) or price <= 0: continue
+
+                reference = self.quote_reference.get(san) or {}
+                data = {
+                    'price': price,
+                    'prev_close': float(closes.iloc[-2]) if len(closes) > 1 else price,
+                    # Stored range plus the latest sessions (today's bar may set a new high/low)
+                    'high52': float(np.nanmax([reference.get('high52') or np.nan, frame['High'].max()])),
+                    'low52': float(np.nanmin([reference.get('low52') or np.nan, frame['Low'].min()])),
+                }
+                currency = self._quote_currency(san)
+
+                # Normalization (LSE quotes in pence)
+                if currency == 'GBp':
+                    for key in ['price', 'prev_close', 'high52', 'low52']:
+                        if data.get(key): data[key] /= 100.0
+                    currency = 'GBP'
+
+                data['currency'] = currency
+                quotes[san] = data
+            except Exception as e:
+                print(f"Error processing {san}: {e}")
+        return quotes
+
+    def _ticker_frame(self, hist: pd.DataFrame, san: str) -> Optional[pd.DataFrame]:
+        """One symbol's bars from a (possibly multi-ticker) yf.download frame."""
+        if isinstance(hist.columns, pd.MultiIndex):
+            return hist[san] if san in hist.columns.get_level_values(0) else None
+        return hist
+
+    def _refresh_quote_reference(self, sanitized: List[str]):
+        """
+        Fills the quote reference for a chunk: the 52-week range once per day (one bulk 1y download
+        for the symbols not refreshed today) and the reported currency once per symbol. Blocking.
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+        stale = [san for san in sanitized if (self.quote_reference.get(san) or {}).get('day') != today]
+        if stale:
+            try:
+                year = yf.download(stale, period="1y", interval="1d", group_by="ticker",
+                                   auto_adjust=False, progress=False, threads=True)
+            except Exception as e:
+                print(f"52-week range fetch error: {e}")
+                year = None
+            for san in stale:
+                frame = self._ticker_frame(year, san) if year is not None and not year.empty else None
+                if frame is None or frame['Close'].dropna().empty:
+                    continue
+                self.quote_reference[san] = {**(self.quote_reference.get(san) or {}), 'day': today,
+                                             'high52': float(frame['High'].max()), 'low52': float(frame['Low'].min())}
+
+        for san in sanitized:
+            if self.instruments.get(san).get('currency') or (self.quote_reference.get(san) or {}).get('currency'):
+                continue
+            try:
+                currency = yf.Ticker(san).fast_info['currency']
+            except Exception as e:
+                print(f"Currency lookup error {san}: {e}")
+                continue
+            if currency:
+                self.quote_reference[san] = {**(self.quote_reference.get(san) or {}), 'currency': currency}
+
+    def _quote_currency(self, sanitized: str) -> str:
+        """
+        Quote currency as Yahoo reports it (instrument table, else the quote reference); inferred
+        from the symbol (FX pair, exchange suffix) only while neither has it.
         """
-        now = time.time()
-        cache_key = f"ohlcv_{symbol}_{range_period}"
-        ttl = 60 if range_period in ['1d', '1w'] else 3600
-
-        # Check Cache
-        entry = self.cache.get(cache_key)
-        if entry and now - entry.get('timestamp_unix', 0) < ttl:
-            return entry['data']
-
-        # Map range to yf params
-        yf_params = {
-            "1d": {"period": "1d", "interval": "5m"},
-            "1w": {"period": "5d", "interval": "15m"},
-            "1m": {"period": "1mo", "interval": "1d"},
-            "3m": {"period": "3mo", "interval": "1d"},
-            "6m": {"period": "6mo", "interval": "1d"},
-            "1y": {"period": "1y", "interval": "1d"},
-            "5y": {"period": "5y", "interval": "1wk"},
-            "max": {"period": "max", "interval": "1wk"},
+        currency = self.instruments.get(sanitized).get('currency') or \
+            (self.quote_reference.get(sanitized) or {}).get('currency')
+        if currency:
+            return currency
+        if sanitized.endswith('=X'):
+            # EURCZK=X is quoted in CZK; EUR=X is USD/EUR, quoted in EUR
+            return sanitized[3:6] if len(sanitized) >= 8 else sanitized[:3]
+        if '.' in sanitized:
+            return self.SUFFIX_CURRENCY.get('.' + sanitized.rsplit('.', 1)[1], 'USD')
+        return 'USD'
+
+    def _describe(self, orig: str, san: str) -> Dict[str, Any]:
+        """Name, Country, Sector & Industry for a quote. Local lookups only (metadata, then instrument table)."""
+        is_option = len(san) > 15 and any(c in san for c in ['C', 'P'])
+        is_forex = san.endswith('=X')
+
+        if is_option:
+            return {'name': orig, 'country': "N/A"} # Keep original string for options
+        if is_forex:
+            return {'name': f"Currency Pair {orig}", 'country': "N/A"}
+
+        # OPTIMIZATION: Use local metadata / instrument table instead of slow t.info
+        # Note: we use 'orig' symbol for lookup as key in metadata usually matches that
+        meta_entry = self.metadata.get(orig, {})
+        instrument = self.instruments.get(san)
+        return {
+            'name': meta_entry.get('name') or meta_entry.get('longName') or instrument.get('name') or orig,
+            'country': meta_entry.get('country') or instrument.get('country') or "Unknown",
+            'sector': instrument.get('sector'),
+            'industry': instrument.get('industry'),
         }
-        params = yf_params.get(range_period, {"period": "1y", "interval": "1d"})
 
-        # Throttle
-        elapsed = now - self.last_request_time
-        if elapsed < self.MIN_DELAY:
-            await asyncio.sleep(self.MIN_DELAY - elapsed)
+    async def enrich_instruments(self, symbols: List[str]) -> int:
+        """
+        Resolves static data for symbols not yet in the instrument table (options and FX pairs skipped)
+        and refreshes the description of their cached quotes. Returns the number of symbols resolved.
+        """
+        sanitized_map = {s: self._sanitize_symbol(s) for s in symbols}
+        candidates = [san for san in sanitized_map.values() if not san.endswith('=X') and len(san) <= 15]
+        missing = self.instruments.missing(candidates)
+        if not missing:
+            return 0
+
+        loop = asyncio.get_event_loop()
+        resolved = 0
+        for san in missing:
+            await self._throttle()
+            try:
+                entry = await loop.run_in_executor(None, self.instruments.resolve, san)
+            finally:
+                self.last_request_time = time.time()
+            resolved += 'error' not in entry
+
+        for orig, san in sanitized_map.items():
+            entry = self.cache.get(orig)
+            if san in missing and entry and 'data' in entry:
+                self.cache[orig] = {**entry, 'data': {**entry['data'], **self._describe(orig, san)}}
+        return resolved
+
+    # Canonical series per symbol: every chart/watchlist range is sliced or resampled from these
+    DAILY = ("1d", "max", 3600)      # (interval, history period, ttl seconds)
+    INTRADAY = ("5m", "5d", 60)
+
+    # Chart range -> (canonical series, resample)
+    OHLCV_RANGES = {
+        "1d": ("intraday", None),
+        "1w": ("intraday", "15m"),
+        "1m": ("daily", None),
+        "3m": ("daily", None),
+        "6m": ("daily", None),
+        "1y": ("daily", None),
+        "5y": ("daily", "1wk"),
+        "max": ("daily", "1wk"),
+    }
+
+    async def get_ohlcv(self, symbol: str, range_period: str, format: str = "rows") -> Dict[str, Any]:
+        """
+        Fetches OHLCV data for detailed charts.
+        Every range is sliced (and, for 1w/5y/max, resampled) from the symbol's
+        canonical daily or intraday series in the OHLCVStore.
+        format="rows": candles/volume lists of per-bar dicts (volume bars carry a color).
+        format="columnar": parallel arrays time/open/high/low/close/volume.
+        """
+        is_intraday = self.OHLCV_RANGES.get(range_period, ("daily", None))[0] == "intraday"
 
         try:
-            loop = asyncio.get_event_loop()
-            sanitized = self._sanitize_symbol(symbol)
-            ticker = await loop.run_in_executor(None, yf.Ticker, sanitized)
-            
-            fetch_func = functools.partial(ticker.history, **params)
-            hist = await loop.run_in_executor(None, fetch_func)
-            
-            if hist.empty:
+            bars = await self._range_bars(symbol, range_period)
+            if bars is None or len(bars['time']) == 0:
                 return {"error": "No data found"}
-            
-            is_intraday = range_period in ['1d', '1w']
-            candles = []
-            volumes = []
-            
-            for date, row in hist.iterrows():
-                time_val = int(date.timestamp()) if is_intraday else date.strftime('%Y-%m-%d')
-                candles.append({
-                    "time": time_val,
-                    "open": row['Open'], "high": row['High'],
-                    "low": row['Low'], "close": row['Close']
-                })
-                is_up = row['Close'] >= row['Open']
-                color = 'rgba(34, 197, 94, 0.56)' if is_up else 'rgba(239, 68, 68, 0.56)'
-                volumes.append({"time": time_val, "value": row['Volume'], "color": color})
-
-            result = {"symbol": symbol, "candles": candles, "volume": volumes}
-            
-            self.cache[cache_key] = {
-                "timestamp_unix": time.time(),
-                "data": result
-            }
-            self._save_cache()
-            self.last_request_time = time.time()
-            return result
-            
+
+            times = bars['time'].tolist() if is_intraday else self._format_dates(bars['time'])
+            if format == "columnar":
+                return {
+                    "symbol": symbol, "format": "columnar", "time": times,
+                    **{col: bars[col].tolist() for col in self.ohlcv.COLUMNS if col != 'time'}
+                }
+
+            opens, highs, lows, closes = (bars[c].tolist() for c in ('open', 'high', 'low', 'close'))
+            colors = np.where(bars['close'] >= bars['open'], 'rgba(34, 197, 94, 0.56)', 'rgba(239, 68, 68, 0.56)').tolist()
+            candles = [{"time": t, "open": o, "high": h, "low": l, "close": c}
+                       for t, o, h, l, c in zip(times, opens, highs, lows, closes)]
+            volumes = [{"time": t, "value": v, "color": color}
+                       for t, v, color in zip(times, bars['volume'].tolist(), colors)]
+
+            return {"symbol": symbol, "candles": candles, "volume": volumes}
+
         except Exception as e:
             print(f"Error fetching OHLCV {symbol}: {e}")
             return {"error": str(e)}
 
-    async def get_watchlist_data(self, symbol: str, range_period: str = "1m") -> Dict[str, Any]:
+    def _format_dates(self, times: np.ndarray) -> List[str]:
+        """Unix seconds -> 'YYYY-MM-DD' strings (vectorized)."""
+        return np.datetime_as_string(times.astype('datetime64[s]'), unit='D').tolist()
+
+    async def get_daily_closes(self, symbol: str) -> Optional[Dict[str, np.ndarray]]:
         """
-        Fetches lightweight data for watchlist (Price + %Change + Sparkline).
-        range_period: 1d, 1w, 1m, 3m, 1y
+        Full daily close history of a symbol from the OHLCVStore, refreshed if older than its TTL:
+        {'time': unix seconds at UTC midnight of the exchange date, 'close', 'currency'} (LSE pence -> GBP).
+        None if Yahoo has no bars for it.
+        """
+        try:
+            series = await self._get_series(symbol, "daily")
+        except Exception as e:
+            print(f"Error fetching daily closes {symbol}: {e}")
+            return None
+        if series is None or len(series['time']) == 0:
+            return None
+        closes, currency = series['close'], self._quote_currency(self._sanitize_symbol(symbol))
+        if currency == 'GBp':
+            closes, currency = closes / 100.0, 'GBP'
+        return {'time': series['time'], 'close': closes, 'currency': currency}
+
+    async def _get_series(self, symbol: str, kind: str, throttle: bool = True) -> Optional[Dict]:
+        """Canonical 'daily' or 'intraday' series for a symbol (refreshed when older than its TTL)."""
+        interval, period, ttl = self.DAILY if kind == "daily" else self.INTRADAY
+        return await self._refresh_series(symbol, interval, period, ttl, throttle)
+
+    def has_fresh_series(self, symbol: str, range_period: str) -> bool:
+        """True if the watchlist/chart data for a range can be served from the store without network."""
+        kinds = {"daily", self.OHLCV_RANGES.get(range_period, ("daily", None))[0]}
+        for kind in kinds:
+            interval, period, ttl = self.DAILY if kind == "daily" else self.INTRADAY
+            series = self.ohlcv.get(symbol, interval)
+            if series is None or not self.ohlcv.covers(symbol, interval, period) \
+                    or time.time() >= self.hours.expires_at(self._sanitize_symbol(symbol), series['fetched_at'], ttl):
+                return False
+        return True
+
+    async def _range_bars(self, symbol: str, range_period: str, throttle: bool = True) -> Optional[Dict]:
+        """Bars for a chart range, derived from the canonical series."""
+        kind, resample = self.OHLCV_RANGES.get(range_period, ("daily", None))
+        series = await self._get_series(symbol, kind, throttle)
+        if series is None:
+            return None
+
+        interval = self.DAILY[0] if kind == "daily" else self.INTRADAY[0]
+        start = self._range_start(series['time'], range_period, kind == "intraday")
+        bars = self.ohlcv.slice(symbol, interval, start)
+        if resample == "1wk":
+            bars = self.ohlcv.resample(bars, weekly=True)
+        elif resample == "15m":
+            bars = self.ohlcv.resample(bars, seconds=900)
+        return bars
+
+    async def _refresh_series(self, symbol: str, interval: str, period: str, ttl: float,
+                              throttle: bool = True) -> Optional[Dict]:
+        """
+        Returns the stored series for (symbol, interval), updating it first if it is older than ttl.
+        A missing series (or one fetched with a shorter period) is fetched in full,
+        otherwise only bars from the last completed stored bar onwards are requested; if that
+        overlap shows the history was re-adjusted (split, dividend), the series is refetched in full.
         """
+        series = self.ohlcv.get(symbol, interval)
+        if series is not None and self.ohlcv.covers(symbol, interval, period) \
+                and time.time() < self.hours.expires_at(self._sanitize_symbol(symbol), series['fetched_at'], ttl):
+            return series
+        if self.failures.is_suppressed(symbol):
+            return series  # In backoff: serve what we have (possibly nothing)
+
+        last_time = self.ohlcv.last_time(symbol, interval)
+        full = series is None or last_time is None or not self.ohlcv.covers(symbol, interval, period)
+        # Yahoo only serves ~60 days of intraday bars
+        if interval in self.ohlcv.INTRADAY and last_time and time.time() - last_time > 50 * 86400:
+            full = True
+
+        if full:
+            params = {"period": period, "interval": interval}
+        else:
+            # From the bar before the last: the last one may still be forming, this one overlaps completed
+            overlap = int(series['time'][-2]) if len(series['time']) > 1 else last_time
+            start = datetime.fromtimestamp(overlap, tz=timezone.utc).strftime('%Y-%m-%d')
+            params = {"start": start, "interval": interval}
+            # An incremental fetch always covers what the stored series was fetched with
+            period = series['period']
+
+        hist = await self._fetch_history(symbol, params, throttle)
+        if hist is None:
+            if series is None: raise RuntimeError(f"No bars for {symbol}")
+            return series  # Serve what we have
+
+        if hist.empty and series is None:
+            self.failures.record(symbol, "not_found", "no bars returned")
+            return None
+        self.failures.clear(symbol)
+        merged = self.ohlcv.merge(symbol, interval, hist, period=period if full else None)
+        if merged is None:
+            # Stored bars were adjusted before a split/dividend: replace them with a full fetch
+            hist = await self._fetch_history(symbol, {"period": period, "interval": interval}, throttle)
+            if hist is None or hist.empty:
+                return series
+            merged = self.ohlcv.merge(symbol, interval, hist, period=period)
+        return merged
+
+    async def _fetch_history(self, symbol: str, params: Dict[str, str], throttle: bool) -> Optional[pd.DataFrame]:
+        """ticker.history(**params) off the event loop; None (failure recorded) if the request failed."""
+        if throttle:
+            await self._throttle()
         try:
             loop = asyncio.get_event_loop()
             sanitized = self._sanitize_symbol(symbol)
-            
-            # Map Range
-            # 1d=5m, 1w=15m, 1m=1d, 3m=1d, 1y=1d
-            period = "1mo"
-            interval = "1d"
-            
-            if range_period == "1d":
-                period = "1d"
-                interval = "5m"
-            elif range_period == "1w":
-                period = "5d"
-                interval = "15m"
-            elif range_period == "3m":
-                period = "3mo"
-                interval = "1d"
-            elif range_period == "1y":
-                period = "1y"
-                interval = "1d"
-            # Default "1m" is "1mo"
-            
-            # Fetch history
             ticker = await loop.run_in_executor(None, yf.Ticker, sanitized)
-            hist = await loop.run_in_executor(None, lambda: ticker.history(period=period, interval=interval))
-            
-            if hist.empty:
+            return await loop.run_in_executor(None, functools.partial(ticker.history, **params))
+        except Exception as e:
+            self.failures.record(symbol, "network", str(e))
+            print(f"Error refreshing OHLCV {symbol}: {e}")
+            return None
+        finally:
+            self.last_request_time = time.time()
+
+    def _range_start(self, times, range_period: str, is_intraday: bool) -> int:
+        """First bar time (unix seconds) belonging to a chart range."""
+        if len(times) == 0 or range_period == "max":
+            return 0
+        if is_intraday:
+            # Last N trading sessions (1d = last session, 1w = 5 sessions)
+            sessions = 1 if range_period == "1d" else 5
+            days = sorted(set((int(t) // 86400) for t in times[-sessions * 400:]))
+            return days[-sessions:][0] * 86400 if days else 0
+        offsets = {"1m": pd.DateOffset(months=1), "3m": pd.DateOffset(months=3), "6m": pd.DateOffset(months=6),
+                   "1y": pd.DateOffset(years=1), "5y": pd.DateOffset(years=5)}
+        start = pd.Timestamp(datetime.now().date()) - offsets.get(range_period, pd.DateOffset(years=1))
+        return int(start.timestamp())
+
+    async def get_watchlist_data(self, symbol: str, range_period: str = "1m") -> Dict[str, Any]:
+        """
+        Fetches lightweight data for watchlist (Price + %Change + Sparkline).
+        range_period: 1d, 1w, 1m, 3m, 1y
+        Served from the same canonical series as the charts, so switching ranges
+        doesn't hit the network while the series are fresh.
+        """
+        try:
+            # Watchlist fetches run in parallel without the chart throttle (as before)
+            daily = await self._get_series(symbol, "daily", throttle=False)
+            bars = await self._range_bars(symbol, range_period, throttle=False)
+
+            if daily is None or bars is None or len(bars['time']) == 0 or len(daily['time']) == 0:
                 return {"symbol": symbol, "error": "No data"}
-                
-            # Current Price & Stats
-            current_price = hist['Close'].iloc[-1]
+
+            # Current Price & Stats (day change from the daily series)
+            current_price = float(bars['close'][-1])
             if math.isnan(current_price) or math.isinf(current_price):
                 current_price = 0.0
-                
-            prev_close = hist['Close'].iloc[-2] if len(hist) > 1 else current_price
+
+            daily_closes = daily['close']
+            prev_close = float(daily_closes[-2]) if len(daily_closes) > 1 else current_price
             if math.isnan(prev_close) or math.isinf(prev_close):
                 prev_close = current_price
-            
+
             change_percent = 0.0
             if prev_close > 0:
                 change_percent = ((current_price - prev_close) / prev_close) * 100
-                
+
+            # 52-Week Range
+            year = self.ohlcv.slice(symbol, self.DAILY[0], self._range_start(daily['time'], "1y", False))
+
             # Sparkline Data
-            sparkline = []
-            for date, row in hist.iterrows():
-                val = float(row['Close'])
-                if math.isnan(val) or math.isinf(val):
-                    val = current_price # Fallback to current
-                sparkline.append({
-                    "date": date.strftime('%Y-%m-%d'),
-                    "close": val
-                })
-                
+            closes = np.where(np.isfinite(bars['close']), bars['close'], current_price) # Fallback to current
+            sparkline = [{"date": d, "close": c} for d, c in zip(self._format_dates(bars['time']), closes.tolist())]
+
+            currency = self._quote_currency(self._sanitize_symbol(symbol))
             return {
                 "symbol": symbol,
-                "price": float(current_price),
-                "currency": "USD", 
+                "price": current_price,
+                "currency": currency,
                 "change_percent": float(change_percent),
+                "high52": float(np.nanmax(year['high'])) if len(year['high']) else None,
+                "low52": float(np.nanmin(year['low'])) if len(year['low']) else None,
                 "history": sparkline
             }
-            
+
         except Exception as e:
             print(f"Error fetching watchlist data {symbol}: {e}")
             return {"symbol": symbol, "error": str(e)}
@@ -394,8 +722,7 @@ class MarketDataService:
         unique_curs = set([c.upper() for c in currencies if c.upper() != target])
         
         for cur in unique_curs:
-            symbol = f"{cur}{target}=X"
-            ticker_map[cur] = symbol
+            ticker_map[cur] = self.fx_symbol(cur, target)
             
         yahoo_symbols = list(ticker_map.values())
         if not yahoo_symbols: return {target: 1.0}
@@ -414,3 +741,7 @@ class MarketDataService:
                 rates[cur] = float(entry['price'])
         
         return rates
+
+    def fx_symbol(self, currency: str, target: str = "CZK") -> str:
+        """Yahoo ticker for an FX pair (e.g. USDCZK=X)."""
+        return f"{currency.upper()}{target.upper()}=X"
@@ -0,0 +1,125 @@
+from datetime import datetime, date, time as dtime, timedelta
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+class MarketHours:
+    """
+    Exchange trading-session calendar keyed by Yahoo symbol suffix.
+    Used to cache quotes and bars until the next open while a venue is closed.
+
+    Sessions are regular hours plus a short grace period for closing auctions.
+    Holidays cover the fixed-date closures only; a floating holiday just costs
+    one extra fetch that returns the unchanged close.
+    """
+
+    # Exchange -> (timezone, open, close)
+    EXCHANGES: Dict[str, Tuple[str, dtime, dtime]] = {
+        "US": ("America/New_York", dtime(9, 30), dtime(16, 0)),
+        "XETRA": ("Europe/Berlin", dtime(9, 0), dtime(17, 30)),
+        "LSE": ("Europe/London", dtime(8, 0), dtime(16, 30)),
+        "EURONEXT": ("Europe/Paris", dtime(9, 0), dtime(17, 30)),
+        "MIL": ("Europe/Rome", dtime(9, 0), dtime(17, 30)),
+        "BME": ("Europe/Madrid", dtime(9, 0), dtime(17, 30)),
+        "SIX": ("Europe/Zurich", dtime(9, 0), dtime(17, 30)),
+        "NORDIC": ("Europe/Stockholm", dtime(9, 0), dtime(17, 30)),
+        "OSLO": ("Europe/Oslo", dtime(9, 0), dtime(16, 20)),
+        "PSE": ("Europe/Prague", dtime(9, 0), dtime(16, 30)),
+        "WSE": ("Europe/Warsaw", dtime(9, 0), dtime(17, 0)),
+        "HKEX": ("Asia/Hong_Kong", dtime(9, 30), dtime(16, 0)),
+        "TSE": ("Asia/Tokyo", dtime(9, 0), dtime(15, 30)),
+        "KRX": ("Asia/Seoul", dtime(9, 0), dtime(15, 30)),
+        "SSE": ("Asia/Shanghai", dtime(9, 30), dtime(15, 0)),
+        "ASX": ("Australia/Sydney", dtime(10, 0), dtime(16, 0)),
+        "TSX": ("America/Toronto", dtime(9, 30), dtime(16, 0)),
+    }
+
+    SUFFIX_EXCHANGE = {
+        ".DE": "XETRA", ".F": "XETRA", ".MU": "XETRA", ".BE": "XETRA", ".HA": "XETRA", ".DU": "XETRA",
+        ".L": "LSE", ".PA": "EURONEXT", ".AS": "EURONEXT", ".BR": "EURONEXT",
+        ".MI": "MIL", ".MC": "BME", ".SW": "SIX",
+        ".ST": "NORDIC", ".HE": "NORDIC", ".CO": "NORDIC", ".OL": "OSLO",
+        ".PR": "PSE", ".WA": "WSE",
+        ".HK": "HKEX", ".T": "TSE", ".KS": "KRX", ".SS": "SSE", ".SZ": "SSE",
+        ".AX": "ASX", ".TO": "TSX",
+    }
+
+    # Fixed-date closures (month, day)
+    HOLIDAYS = {
+        "US": {(1, 1), (6, 19), (7, 4), (12, 25)},
+        "XETRA": {(1, 1), (5, 1), (12, 24), (12, 25), (12, 26), (12, 31)},
+        "LSE": {(1, 1), (12, 25), (12, 26)},
+        "EURONEXT": {(1, 1), (5, 1), (12, 25), (12, 26)},
+        "NORDIC": {(1, 1), (1, 6), (5, 1), (6, 6), (12, 24), (12, 25), (12, 26), (12, 31)},
+        "PSE": {(1, 1), (5, 1), (5, 8), (7, 5), (7, 6), (9, 28), (10, 28), (11, 17), (12, 24), (12, 25), (12, 26)},
+    }
+
+    CLOSE_GRACE = timedelta(minutes=15)  # Closing auction / late prints
+
+    # FX trades 24/5: Sunday 17:00 to Friday 17:00 New York time
+    FX_TZ = "America/New_York"
+    FX_ROLL = dtime(17, 0)
+
+    def exchange_for(self, symbol: str) -> Optional[str]:
+        """Exchange for a Yahoo symbol, 'FX' for currency pairs, None if unknown (treated as always open)."""
+        if symbol.endswith('=X'):
+            return "FX"
+        if '.' in symbol:
+            return self.SUFFIX_EXCHANGE.get('.' + symbol.rsplit('.', 1)[1])
+        return "US"  # No suffix: US listing (incl. OCC option symbols)
+
+    def _is_trading_day(self, exchange: str, day: date) -> bool:
+        return day.weekday() < 5 and (day.month, day.day) not in self.HOLIDAYS.get(exchange, ())
+
+    def is_open(self, symbol: str, at: Optional[float] = None) -> bool:
+        exchange = self.exchange_for(symbol)
+        if exchange is None:
+            return True
+        now = datetime.fromtimestamp(at) if at is not None else datetime.now()
+
+        if exchange == "FX":
+            local = now.astimezone(ZoneInfo(self.FX_TZ))
+            weekday, t = local.weekday(), local.time()
+            return not (weekday == 5 or (weekday == 4 and t >= self.FX_ROLL) or (weekday == 6 and t < self.FX_ROLL))
+
+        tz_name, open_t, close_t = self.EXCHANGES[exchange]
+        local = now.astimezone(ZoneInfo(tz_name))
+        if not self._is_trading_day(exchange, local.date()):
+            return False
+        session_open = datetime.combine(local.date(), open_t, tzinfo=local.tzinfo)
+        session_close = datetime.combine(local.date(), close_t, tzinfo=local.tzinfo) + self.CLOSE_GRACE
+        return session_open <= local < session_close
+
+    def next_open(self, symbol: str, at: Optional[float] = None) -> float:
+        """Unix time of the next session open after `at` (now if omitted)."""
+        exchange = self.exchange_for(symbol)
+        now = datetime.fromtimestamp(at) if at is not None else datetime.now()
+        if exchange is None:
+            return now.timestamp()
+
+        if exchange == "FX":
+            local = now.astimezone(ZoneInfo(self.FX_TZ))
+            days_to_sunday = (6 - local.weekday()) % 7
+            sunday = datetime.combine(local.date() + timedelta(days=days_to_sunday), self.FX_ROLL, tzinfo=local.tzinfo)
+            if sunday <= local:
+                sunday += timedelta(days=7)
+            return sunday.timestamp()
+
+        tz_name, open_t, _ = self.EXCHANGES[exchange]
+        local = now.astimezone(ZoneInfo(tz_name))
+        for offset in range(0, 15):
+            day = local.date() + timedelta(days=offset)
+            if not self._is_trading_day(exchange, day):
+                continue
+            session_open = datetime.combine(day, open_t, tzinfo=local.tzinfo)
+            if session_open > local:
+                return session_open.timestamp()
+        return (now + timedelta(days=1)).timestamp()
+
+    def expires_at(self, symbol: str, fetched_at: float, open_ttl: float) -> float:
+        """
+        Unix time until which data fetched at `fetched_at` stays valid:
+        open_ttl while the venue was open, otherwise until the next open.
+        """
+        if self.is_open(symbol, fetched_at):
+            return fetched_at + open_ttl
+        return max(fetched_at + open_ttl, self.next_open(symbol, fetched_at))
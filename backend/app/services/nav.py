@@ -0,0 +1,361 @@
+import asyncio
+import os
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+class NAVHistory:
+    """
+    Daily net asset value of the account in CZK and USD, from the first statement day to today.
+
+    Holdings are rolled back from the statements' closing state (Open Positions, Forex Balances):
+    the quantity of a symbol, or the cash in a currency, on day d is the closing amount minus
+    everything booked after d (trades, FX conversions, deposits, dividends, taxes, fees, interest).
+    Anchoring at the end keeps today's holdings exact even when the statements don't reach back
+    to the account opening or miss corporate actions.
+
+    Valuation is one vectorized pass over (days x symbols) matrices: daily closes from the
+    OHLCVStore, else the last trade / statement price (e.g. options), times ČNB rates from the
+    yearly tables. The series is persisted in `directory` (nav.npz) and, while the statements
+    are unchanged, only extended from the last stored day.
+    """
+
+    COLUMNS = ('time', 'nav_czk', 'nav_usd', 'positions_czk', 'cash_czk', 'flows_czk')
+    # Statement sections booked straight to cash: (section, counts as external flow)
+    CASH_SECTIONS = (('Deposits & Withdrawals', True), ('Dividends', False), ('Withholding Tax', False),
+                     ('Interest', False), ('Fees', False))
+    REFRESH_SECONDS = 3600  # The latest day is revalued at most this often
+
+    def __init__(self, engine, directory: str):
+        # Statement parsing helpers and the shared market/FX layer come from the engine
+        self.engine = engine
+        self.market = engine.market_data
+        self.forex = engine.forex
+        self.directory = directory
+        self.path = os.path.join(directory, "nav.npz")
+        self._series: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+
+    # --- Public ---
+    async def history(self, merged_data: Dict[str, pd.DataFrame], files_hash: str) -> Dict[str, Any]:
+        """
+        {time (unix seconds, UTC midnight of each business day), nav_czk, nav_usd, positions_czk,
+        cash_czk, flows_czk (net deposits), files_hash, updated_at}.
+        """
+        async with self._lock:
+            stored = self._load()
+            today = self._day(datetime.now().strftime("%Y-%m-%d"))
+            incremental = stored is not None and files_hash and stored['files_hash'] == files_hash \
+                and len(stored['time']) > 0
+            if incremental and stored['time'][-1] >= today \
+                    and time.time() - stored['updated_at'] < self.REFRESH_SECONDS:
+                return stored
+
+            loop = asyncio.get_event_loop()
+            ledger = await loop.run_in_executor(None, self._ledger, merged_data)
+            if ledger is None:
+                return self._empty(files_hash)
+
+            if incremental:
+                # Revalue from the last stored day (its close may still have been forming)
+                keep = stored['time'] < stored['time'][-1]
+                since = stored['time'][keep][-1] if keep.any() else None
+                start = stored['time'][-1]
+            else:
+                keep, since, start = None, None, ledger['start']
+            end = max(today, ledger['report_day'])
+            days = self._business_days(start, end)
+
+            values = await self._value(ledger, days, since)
+            if incremental:
+                values = {c: np.concatenate([stored[c][keep], values[c]]) for c in self.COLUMNS}
+            series = {**values, 'files_hash': files_hash, 'updated_at': time.time()}
+            self._save(series)
+            return series
+
+    # Chart ranges in days ('ytd' and 'max' are handled in window())
+    RANGES = {'1m': 30, '3m': 91, '6m': 182, '1y': 365, '3y': 1096, '5y': 1826}
+
+    def window(self, series: Dict[str, Any], range_period: str = "max") -> Dict[str, Any]:
+        """The series' columns from the start of the range, with 'YYYY-MM-DD' dates."""
+        times = series['time']
+        if range_period == 'ytd':
+            start = self._day(f"{datetime.now().year}-01-01")
+        elif range_period in self.RANGES and len(times):
+            start = int(times[-1]) - self.RANGES[range_period] * 86400
+        else:
+            start = None
+        i = int(np.searchsorted(times, start, side='left')) if start is not None else 0
+        return {
+            'dates': np.datetime_as_string(times[i:].astype('datetime64[s]'), unit='D').tolist(),
+            **{c: series[c][i:] for c in self.COLUMNS if c != 'time'},
+            'updated_at': series['updated_at'],
+        }
+
+    # --- Ledger ---
+    def _ledger(self, merged_data: Dict[str, pd.DataFrame]) -> Optional[Dict[str, Any]]:
+        """Closing holdings plus every dated quantity and cash movement, as column arrays."""
+        engine = self.engine
+        symbol_map = engine.reconstructor.symbol_map(merged_data.get('Financial Instrument Information'))
+        canonical = lambda s: symbol_map.get(s, s)
+
+        # 1. Closing positions (same row filter as the engine)
+        df_pos = merged_data.get('Open Positions', pd.DataFrame())
+        if not df_pos.empty:
+            df_pos = df_pos[df_pos['Symbol'].notna() & (df_pos['Symbol'].astype(str) != '')]
+            pos_qty = self._number(df_pos, 'Quantity')
+            df_pos, pos_qty = df_pos[pos_qty != 0], pos_qty[pos_qty != 0]
+        pos_symbols = df_pos['Symbol'].astype(str).str.strip().map(canonical).tolist() if not df_pos.empty else []
+
+        # 2. Trades: instrument quantities, plus cash legs (FX conversions move two currencies)
+        df_trades = merged_data.get('Trades', pd.DataFrame())
+        if not df_trades.empty and 'DataDiscriminator' in df_trades:
+            df_trades = df_trades[df_trades['DataDiscriminator'] == 'Order']
+        trade_days = self._days(engine._text_column(df_trades, 'Date/Time', ''))
+        df_trades = df_trades[trade_days >= 0]
+        trade_days = trade_days[trade_days >= 0]
+
+        category = engine._text_column(df_trades, 'Asset Category', '')
+        is_fx = category.str.contains('Forex', regex=False).to_numpy()
+        trade_symbols = engine._text_column(df_trades, 'Symbol', '').str.strip()
+        trade_currency = engine._text_column(df_trades, 'Currency', 'USD').str.strip().to_numpy(dtype=object)
+        trade_qty = self._number(df_trades, 'Quantity')
+        trade_price = self._number(df_trades, 'T. Price')
+        proceeds = self._number(df_trades, 'Proceeds')
+        commission = self._number(df_trades, 'Comm/Fee')
+
+        instrument = ~is_fx & (trade_symbols != '').to_numpy() & (trade_qty != 0)
+        ev_symbols = trade_symbols[instrument].map(canonical).tolist()
+
+        # 3. Symbol universe and static attributes (closing statement wins over trades)
+        symbols = list(dict.fromkeys(pos_symbols + ev_symbols))
+        column = {s: i for i, s in enumerate(symbols)}
+        currency = np.array(['USD'] * len(symbols), dtype=object)
+        is_option = np.zeros(len(symbols), dtype=bool)
+        mult = np.full(len(symbols), np.nan)
+        end_qty = np.zeros(len(symbols))
+        report_price = np.full(len(symbols), np.nan)
+
+        trade_cols = np.array([column[s] for s in ev_symbols], dtype=np.int64)
+        currency[trade_cols] = trade_currency[instrument]
+        is_option[trade_cols] = category[instrument].str.contains('Option', regex=False).to_numpy()
+        if 'Mult' in df_trades:
+            mult[trade_cols] = self._number(df_trades, 'Mult', np.nan)[instrument]
+        if pos_symbols:
+            pos_cols = np.array([column[s] for s in pos_symbols], dtype=np.int64)
+            currency[pos_cols] = engine._text_column(df_pos, 'Currency', 'USD').str.strip().to_numpy(dtype=object)
+            is_option[pos_cols] = engine._text_column(df_pos, 'Asset Category', '').str.contains('Option', regex=False).to_numpy()
+            mult[pos_cols] = self._number(df_pos, 'Mult', np.nan)
+            np.add.at(end_qty, pos_cols, pos_qty)
+            close_price = self._number(df_pos, 'Close Price', np.nan)
+            report_price[pos_cols] = np.where(close_price > 0, close_price, np.nan)
+        mult = np.where(np.isfinite(mult) & (mult > 0), mult, np.where(is_option, 100.0, 1.0))
+
+        # 4. Cash movements: [(day, currency, amount)] and external flows
+        cash_days, cash_cur, cash_amt = [trade_days[~is_fx]], [trade_currency[~is_fx]], [(proceeds + commission)[~is_fx]]
+        if is_fx.any():
+            base = trade_symbols[is_fx].str.split('.').str[0].to_numpy(dtype=object)
+            cash_days += [trade_days[is_fx]] * 3
+            cash_cur += [base, trade_currency[is_fx], np.full(is_fx.sum(), 'USD', dtype=object)]
+            cash_amt += [trade_qty[is_fx], proceeds[is_fx], self._number(df_trades, 'Comm in USD')[is_fx]]
+        flow_days, flow_cur, flow_amt = [], [], []
+        for section, is_flow in self.CASH_SECTIONS:
+            df = merged_data.get(section, pd.DataFrame())
+            date_col = next((c for c in df.columns if 'Date' in c), None)
+            if df.empty or date_col is None:
+                continue
+            cur = engine._text_column(df, 'Currency', '').str.strip()
+            days = self._days(engine._text_column(df, date_col, ''))
+            amount = self._number(df, 'Amount')
+            valid = (days >= 0) & (cur != '').to_numpy() & ~cur.str.startswith('Total').to_numpy() & (amount != 0)
+            cash_days.append(days[valid]); cash_cur.append(cur[valid].to_numpy(dtype=object)); cash_amt.append(amount[valid])
+            if is_flow:
+                flow_days.append(days[valid]); flow_cur.append(cur[valid].to_numpy(dtype=object)); flow_amt.append(amount[valid])
+
+        closing_cash = engine._cash_frame(merged_data.get('Forex Balances', pd.DataFrame()))
+        cash_days, cash_cur, cash_amt = (np.concatenate(a) for a in (cash_days, cash_cur, cash_amt))
+        currencies = list(dict.fromkeys(['USD'] + closing_cash['currency'].tolist() + cash_cur.tolist() + currency.tolist()))
+        cur_column = {c: i for i, c in enumerate(currencies)}
+        end_cash = np.zeros(len(currencies))
+        np.add.at(end_cash, np.array([cur_column[c] for c in closing_cash['currency']], dtype=np.int64),
+                  closing_cash['amount'])
+        if not symbols and not len(cash_days) and not end_cash.any():
+            return None
+
+        # 5. Day range: statement period (or first booking) to the report date
+        report_day = self._day(engine._get_report_date(merged_data.get('Statement', pd.DataFrame())))
+        first = [d.min() for d in (trade_days, cash_days) if len(d)]
+        start = self._statement_start(merged_data.get('Statement', pd.DataFrame()))
+        start = min([report_day] + first + ([start] if start is not None else []))
+
+        concat = lambda parts, dtype: np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+        return {
+            'symbols': symbols, 'currency': currency, 'mult': mult, 'is_option': is_option,
+            'end_qty': end_qty, 'report_price': report_price,
+            'trades': {'day': trade_days[instrument], 'col': trade_cols,
+                       'qty': trade_qty[instrument], 'price': trade_price[instrument]},
+            'currencies': currencies, 'end_cash': end_cash,
+            'cash': {'day': cash_days, 'col': np.array([cur_column[c] for c in cash_cur], dtype=np.int64), 'amount': cash_amt},
+            'flows': {'day': concat(flow_days, np.int64),
+                      'col': np.array([cur_column[c] for c in concat(flow_cur, object)], dtype=np.int64),
+                      'amount': concat(flow_amt, np.float64)},
+            'start': int(start), 'report_day': int(report_day),
+        }
+
+    # --- Valuation ---
+    async def _value(self, ledger: Dict[str, Any], days: np.ndarray, since: Optional[int]) -> Dict[str, np.ndarray]:
+        """Values the ledger on `days`; flows are counted for bookings after `since` (the last kept day)."""
+        loop = asyncio.get_event_loop()
+        symbols, currencies = ledger['symbols'], ledger['currencies']
+
+        # Holdings (days x symbols / currencies)
+        trades, cash = ledger['trades'], ledger['cash']
+        qty = self._holdings(days, ledger['end_qty'], trades['day'], trades['col'], trades['qty'])
+        balances = self._holdings(days, ledger['end_cash'], cash['day'], cash['col'], cash['amount'])
+
+        # Prices: daily closes for instruments held in the range, forward-filled onto the day axis
+        held = np.flatnonzero(np.any(qty != 0, axis=0))
+        quoted = [j for j in held if not ledger['is_option'][j]]
+        closes = await asyncio.gather(*(self.market.get_daily_closes(symbols[j]) for j in quoted))
+        price = np.full(qty.shape, np.nan)
+        for j, series in zip(quoted, closes):
+            if series is not None:
+                price[:, j] = self._as_of(series['time'], series['close'], days)
+        fallback = self._fallback_prices(ledger, days, held)
+        price = np.where(np.isfinite(price), price, fallback)
+
+        # FX: CZK per unit on each day
+        start, end = (np.datetime_as_string(np.datetime64(int(d), 's'), unit='D') for d in (days[0], days[-1]))
+        table = await loop.run_in_executor(None, self.forex.get_rate_history, currencies, str(start), str(end))
+        fx = np.ones((len(days), len(currencies)))
+        for k, cur in enumerate(currencies):
+            if cur == 'CZK':
+                continue
+            if cur in table.columns and table[cur].notna().any():
+                rates = table[cur].dropna()
+                times = rates.index.values.astype('datetime64[s]').astype(np.int64)
+                fx[:, k] = self._as_of(times, rates.to_numpy(dtype=np.float64), days, backfill=True)
+            else:
+                print(f"Warning: no ČNB history for {cur}, using the {end} rate")
+                fx[:, k] = await self.forex.get_rate_async(cur, str(end), 'CZK')
+
+        # NAV
+        cur_column = {c: i for i, c in enumerate(currencies)}
+        sym_fx = fx[:, [cur_column[c] for c in ledger['currency']]] if symbols else np.zeros((len(days), 0))
+        with np.errstate(invalid='ignore'):
+            position_values = np.where(qty != 0, qty * ledger['mult'] * price * sym_fx, 0.0)
+        positions_czk = np.nansum(position_values, axis=1)
+        cash_czk = (balances * fx).sum(axis=1)
+        nav_czk = positions_czk + cash_czk
+
+        flows = ledger['flows']
+        flows_czk = np.zeros(len(days))
+        counted = flows['day'] > (since if since is not None else -np.inf)
+        idx = np.searchsorted(days, flows['day'][counted], side='left')
+        inside = idx < len(days)
+        np.add.at(flows_czk, idx[inside], flows['amount'][counted][inside] * fx[idx[inside], flows['col'][counted][inside]])
+
+        return {
+            'time': days, 'nav_czk': nav_czk, 'nav_usd': nav_czk / fx[:, cur_column['USD']],
+            'positions_czk': positions_czk, 'cash_czk': cash_czk, 'flows_czk': flows_czk,
+        }
+
+    @staticmethod
+    def _holdings(days: np.ndarray, closing: np.ndarray, event_days: np.ndarray,
+                  event_cols: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+        """Amount held at the end of each day: closing amount - everything booked after that day."""
+        width = len(closing)
+        idx = np.searchsorted(days, event_days, side='left')  # First day on/after the booking
+        booked = np.zeros((len(days) + 1, width))
+        np.add.at(booked, (idx, event_cols), amounts)
+        total = np.bincount(event_cols, weights=amounts, minlength=width) if len(event_cols) else np.zeros(width)
+        return closing - total + np.cumsum(booked[:-1], axis=0)
+
+    @staticmethod
+    def _as_of(times: np.ndarray, values: np.ndarray, days: np.ndarray, backfill: bool = False) -> np.ndarray:
+        """Last value at or before each day (NaN before the first one, or the first value with backfill)."""
+        i = np.searchsorted(times, days, side='right') - 1
+        result = values[np.maximum(i, 0)]
+        return result if backfill else np.where(i >= 0, result, np.nan)
+
+    def _fallback_prices(self, ledger: Dict[str, Any], days: np.ndarray, held: np.ndarray) -> np.ndarray:
+        """Last trade price (or the statement close from the report day on) per symbol, back-filled before the first."""
+        trades = ledger['trades']
+        fallback = np.full((len(days), len(ledger['symbols'])), np.nan)
+        priced = trades['price'] > 0
+        order = np.lexsort((trades['day'][priced], trades['col'][priced]))
+        cols, event_days, prices = (trades[k][priced][order] for k in ('col', 'day', 'price'))
+        bounds = np.searchsorted(cols, np.arange(len(ledger['symbols']) + 1))
+        for j in held:
+            t, p = event_days[bounds[j]:bounds[j + 1]], prices[bounds[j]:bounds[j + 1]]
+            if np.isfinite(ledger['report_price'][j]):
+                t, p = np.append(t, ledger['report_day']), np.append(p, ledger['report_price'][j])
+            if len(t):
+                fallback[:, j] = self._as_of(t, p, days, backfill=True)
+        return fallback
+
+    # --- Helpers ---
+    def _number(self, df: pd.DataFrame, name: str, missing: float = 0.0) -> np.ndarray:
+        """Numeric column (engine parsing); blanks and missing columns -> `missing`."""
+        values = self.engine._float_column(df, name, 'nan')
+        return np.where(np.isnan(values), missing, values)
+
+    @staticmethod
+    def _days(text: pd.Series) -> np.ndarray:
+        """'YYYY-MM-DD[, HH:MM:SS]' -> unix seconds at UTC midnight of the date (-1 if unparseable)."""
+        dates = pd.to_datetime(text.str[:10], format="%Y-%m-%d", errors='coerce')
+        seconds = dates.to_numpy(dtype='datetime64[s]').astype(np.int64)
+        return np.where(dates.isna().to_numpy(), -1, seconds)
+
+    @staticmethod
+    def _day(date_str: str) -> int:
+        return int(np.datetime64(date_str, 's').astype(np.int64))
+
+    @staticmethod
+    def _business_days(start: int, end: int) -> np.ndarray:
+        days = pd.bdate_range(pd.Timestamp(start, unit='s'), pd.Timestamp(end, unit='s'))
+        if len(days) == 0:  # Range within a weekend: value on its first day
+            days = pd.DatetimeIndex([pd.Timestamp(start, unit='s')])
+        return days.values.astype('datetime64[s]').astype(np.int64)
+
+    def _statement_start(self, df_stmt: pd.DataFrame) -> Optional[int]:
+        """Start of the statement period ("January 1, 2025 - September 30, 2026")."""
+        for _, row in df_stmt.iterrows():
+            for val in row.values:
+                val_str = str(val)
+                if ' - ' in val_str and ',' in val_str:
+                    try:
+                        return self._day(datetime.strptime(val_str.split(' - ')[0].strip(), "%B %d, %Y").strftime("%Y-%m-%d"))
+                    except ValueError:
+                        pass
+        return None
+
+    def _empty(self, files_hash: str) -> Dict[str, Any]:
+        return {**{c: np.zeros(0, dtype=np.int64 if c == 'time' else np.float64) for c in self.COLUMNS},
+                'files_hash': files_hash, 'updated_at': time.time()}
+
+    # --- Persistence ---
+    def _load(self) -> Optional[Dict[str, Any]]:
+        if self._series is None and os.path.exists(self.path):
+            try:
+                with np.load(self.path, allow_pickle=False) as npz:
+                    self._series = {c: npz[c] for c in self.COLUMNS}
+                    self._series['files_hash'] = str(npz['files_hash'])
+                    self._series['updated_at'] = float(npz['updated_at'])
+            except Exception as e:
+                print(f"Error loading NAV history: {e}")
+        return self._series
+
+    def _save(self, series: Dict[str, Any]):
+        self._series = series
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, files_hash=np.str_(series['files_hash']), updated_at=np.float64(series['updated_at']),
+                         **{c: series[c] for c in self.COLUMNS})
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Warning: Could not save NAV history: {e}")
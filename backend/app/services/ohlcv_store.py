@@ -0,0 +1,290 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+class OHLCVStore:
+    """
+    On-disk OHLCV bars per (symbol, interval), kept as column arrays
+    (time, open, high, low, close, volume) in one .npz file per series.
+
+    time is unix seconds. Intraday bars keep their real timestamp; daily and
+    coarser bars are stamped at UTC midnight of the exchange-local date, so
+    slicing and date formatting don't depend on the exchange timezone.
+
+    Bounded by two LRU budgets: loaded series are dropped from memory beyond
+    max_memory_bytes, and the least recently used files are deleted beyond max_disk_bytes.
+    """
+    COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume')
+    INTRADAY = ('1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h')
+
+    # Yahoo history periods, shortest to longest
+    PERIODS = ['1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'max']
+    # Calendar days per period beyond a few sessions (intraday trimming; 'Nd' periods count sessions)
+    PERIOD_DAYS = {'1mo': 31, '3mo': 92, '6mo': 183, '1y': 366, '2y': 731, '5y': 1827, '10y': 3653}
+    # Relative close difference on overlapping bars that means the history was re-adjusted
+    ADJUST_TOLERANCE = 1e-3
+
+    def __init__(self, directory="backend/data/ohlcv", max_memory_bytes: int = 64 * 2**20,
+                 max_disk_bytes: int = 512 * 2**20):
+        # Go to Project Root (4 levels up from backend/app/services/ohlcv_store.py)
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        if os.path.isabs(directory):
+            self.directory = directory
+        else:
+            self.directory = os.path.join(base_dir, directory)
+
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.evictions = {'memory': 0, 'disk': 0}
+
+        # In-memory copy of loaded series, least recently used first:
+        # {(symbol, interval): {column: array, 'fetched_at': float, 'period': str}}
+        self._series: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._memory_bytes = 0
+
+        # Files on disk, least recently used first: {path: size}. Seeded by mtime (last refresh).
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        if os.path.isdir(self.directory):
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith('.npz')]
+            for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+                self._files[entry.path] = entry.stat().st_size
+        self._disk_bytes = sum(self._files.values())
+        self._enforce_disk()
+
+    def _path(self, symbol: str, interval: str) -> str:
+        # The short hash keeps symbols that sanitize alike ('SPY 30JUN27 660 P' / 'SPY_30JUN27_660_P') apart
+        safe = re.sub(r'[^A-Za-z0-9_\-\.=]', '_', symbol)
+        digest = hashlib.sha1(symbol.encode()).hexdigest()[:8]
+        return os.path.join(self.directory, f"{safe}-{digest}_{interval}.npz")
+
+    def _adopt_legacy(self, symbol: str, interval: str, path: str):
+        """Renames a series saved under the pre-hash name, if that name could only belong to this symbol."""
+        if re.search(r'[^A-Za-z0-9_\-\.=]', symbol) or '_' in symbol:
+            return  # Ambiguous: another symbol may have been saved under the same sanitized name
+        legacy = os.path.join(self.directory, f"{symbol}_{interval}.npz")
+        if not os.path.exists(legacy):
+            return
+        try:
+            os.replace(legacy, path)
+        except OSError:
+            return
+        self._files[path] = self._files.pop(legacy, os.path.getsize(path))
+
+    def get(self, symbol: str, interval: str) -> Optional[Dict]:
+        key = (symbol, interval)
+        path = self._path(symbol, interval)
+        if path in self._files:
+            self._files.move_to_end(path)
+        if key in self._series:
+            self._series.move_to_end(key)
+            return self._series[key]
+
+        if not os.path.exists(path):
+            self._adopt_legacy(symbol, interval, path)
+            if not os.path.exists(path):
+                return None
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                series = {c: npz[c] for c in self.COLUMNS}
+                series['fetched_at'] = float(npz['fetched_at'])
+                series['period'] = str(npz['period'])
+        except Exception as e:
+            print(f"Error loading OHLCV {symbol} {interval}: {e}")
+            return None
+        self._remember(key, series)
+        return series
+
+    # --- Budgets ---
+    @staticmethod
+    def _nbytes(series: Dict) -> int:
+        return sum(series[c].nbytes for c in OHLCVStore.COLUMNS)
+
+    def _remember(self, key: Tuple[str, str], series: Dict):
+        """Keeps a series in memory as most recently used, evicting the oldest beyond the memory budget."""
+        previous = self._series.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= self._nbytes(previous)
+        self._series[key] = series
+        self._memory_bytes += self._nbytes(series)
+        while self._memory_bytes > self.max_memory_bytes and len(self._series) > 1:
+            _, evicted = self._series.popitem(last=False)
+            self._memory_bytes -= self._nbytes(evicted)
+            self.evictions['memory'] += 1
+
+    def _enforce_disk(self):
+        """Deletes least recently used series files beyond the disk budget (never the newest one)."""
+        while self._disk_bytes > self.max_disk_bytes and len(self._files) > 1:
+            path, size = self._files.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions['disk'] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            for key in [k for k in self._series if self._path(*k) == path]:
+                self._memory_bytes -= self._nbytes(self._series.pop(key))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'memory_series': len(self._series),
+            'memory_bytes': self._memory_bytes,
+            'max_memory_bytes': self.max_memory_bytes,
+            'disk_series': len(self._files),
+            'disk_bytes': self._disk_bytes,
+            'max_disk_bytes': self.max_disk_bytes,
+            'evictions': dict(self.evictions),
+        }
+
+    def last_time(self, symbol: str, interval: str) -> Optional[int]:
+        series = self.get(symbol, interval)
+        if series is None or len(series['time']) == 0:
+            return None
+        return int(series['time'][-1])
+
+    def covers(self, symbol: str, interval: str, period: str) -> bool:
+        """True if the stored series was fetched with at least the given history period."""
+        series = self.get(symbol, interval)
+        if series is None:
+            return False
+        return self._period_rank(series['period']) >= self._period_rank(period)
+
+    def _period_rank(self, period: str) -> int:
+        return self.PERIODS.index(period) if period in self.PERIODS else 0
+
+    def to_columns(self, hist: pd.DataFrame, interval: str) -> Dict[str, np.ndarray]:
+        """Converts a yfinance history frame to column arrays (rows without a close are dropped)."""
+        hist = hist[hist['Close'].notna()]
+        index = hist.index
+        if interval in self.INTRADAY:
+            utc = index.tz_convert('UTC').tz_localize(None) if index.tz is not None else index
+        else:
+            # Exchange-local date at UTC midnight
+            utc = (index.tz_localize(None) if index.tz is not None else index).normalize()
+        times = (utc - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+        return {
+            'time': np.asarray(times, dtype=np.int64),
+            'open': hist['Open'].to_numpy(dtype=np.float64),
+            'high': hist['High'].to_numpy(dtype=np.float64),
+            'low': hist['Low'].to_numpy(dtype=np.float64),
+            'close': hist['Close'].to_numpy(dtype=np.float64),
+            'volume': hist['Volume'].fillna(0).to_numpy(dtype=np.float64),
+        }
+
+    def merge(self, symbol: str, interval: str, hist: pd.DataFrame, period: Optional[str] = None) -> Optional[Dict]:
+        """
+        Appends newly fetched bars. Stored bars at or after the first new bar are replaced
+        (the last stored bar is usually still forming). period is set on a full (re)fetch.
+        Intraday series are then trimmed to their period window.
+
+        Yahoo bars are split/dividend adjusted as of the fetch, so an append is refused (None,
+        nothing stored) when the completed bars both sides have disagree: the stored history was
+        adjusted differently and needs a full refetch.
+        """
+        new = self.to_columns(hist, interval)
+        existing = self.get(symbol, interval)
+
+        if existing is not None and period is None and self._readjusted(existing, new):
+            return None
+        if existing is not None and period is None and len(new['time']):
+            keep = existing['time'] < new['time'][0]
+            cols = {c: np.concatenate([existing[c][keep], new[c]]) for c in self.COLUMNS}
+        elif existing is not None and period is None:
+            cols = {c: existing[c] for c in self.COLUMNS}
+        else:
+            cols = new
+
+        period = period or (existing['period'] if existing is not None else self.PERIODS[0])
+        if interval in self.INTRADAY:
+            cols = self._trim(cols, period)  # Appends would otherwise grow past the period forever
+        series = {**cols, 'fetched_at': time.time(), 'period': period}
+        self._remember((symbol, interval), series)
+        self._save(symbol, interval, series)
+        return series
+
+    def _trim(self, cols: Dict[str, np.ndarray], period: str) -> Dict[str, np.ndarray]:
+        """Drops bars older than the period window: the last N sessions (UTC days with bars) for 'Nd'."""
+        times = cols['time']
+        if not len(times) or period == 'max':
+            return cols
+        if period.endswith('d'):
+            days = np.unique(times // 86400)
+            sessions = int(period[:-1])
+            if len(days) <= sessions:
+                return cols
+            keep = times >= days[-sessions] * 86400
+        elif period in self.PERIOD_DAYS:
+            keep = times > times[-1] - self.PERIOD_DAYS[period] * 86400
+        else:
+            return cols
+        return {c: cols[c][keep] for c in self.COLUMNS}
+
+    def _readjusted(self, existing: Dict, new: Dict) -> bool:
+        """True if a stored completed bar (all but the last) has a different close in the new fetch."""
+        completed = existing['time'][:-1]
+        common, i, j = np.intersect1d(completed, new['time'], assume_unique=True, return_indices=True)
+        if not len(common):
+            return False
+        stored, fetched = existing['close'][i], new['close'][j]
+        return not np.allclose(fetched, stored, rtol=self.ADJUST_TOLERANCE, atol=0.0, equal_nan=True)
+
+    def _save(self, symbol: str, interval: str, series: Dict):
+        path = self._path(symbol, interval)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Unique tmp file: concurrent saves of one series (executor threads) never share it
+            tmp = tempfile.NamedTemporaryFile('wb', dir=self.directory, suffix='.tmp', delete=False)
+            try:
+                with tmp:
+                    np.savez(tmp, fetched_at=np.float64(series['fetched_at']), period=np.str_(series['period']),
+                             **{c: series[c] for c in self.COLUMNS})
+                os.replace(tmp.name, path)
+            except Exception:
+                if os.path.exists(tmp.name): os.remove(tmp.name)
+                raise
+        except Exception as e:
+            print(f"Warning: Could not save OHLCV {symbol} {interval}: {e}")
+            return
+        size = os.path.getsize(path)
+        self._disk_bytes += size - self._files.pop(path, 0)
+        self._files[path] = size
+        self._enforce_disk()
+
+    def slice(self, symbol: str, interval: str, start_time: int = 0) -> Optional[Dict[str, np.ndarray]]:
+        """Bars with time >= start_time."""
+        series = self.get(symbol, interval)
+        if series is None:
+            return None
+        i = int(np.searchsorted(series['time'], start_time, side='left'))
+        return {c: series[c][i:] for c in self.COLUMNS}
+
+    def resample(self, bars: Dict[str, np.ndarray], seconds: Optional[int] = None, weekly: bool = False) -> Dict[str, np.ndarray]:
+        """
+        Aggregates bars into coarser buckets: fixed `seconds` (e.g. 900 for 15m)
+        or calendar weeks starting Monday (weekly=True).
+        """
+        times = bars['time']
+        if len(times) == 0:
+            return bars
+        if weekly:
+            days = times // 86400
+            weekday = (days + 3) % 7  # 1970-01-01 was a Thursday
+            buckets = (days - weekday) * 86400
+        else:
+            buckets = times // seconds * seconds
+
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(times)] - 1
+        return {
+            'time': buckets[starts],
+            'open': bars['open'][starts],
+            'high': np.maximum.reduceat(bars['high'], starts),
+            'low': np.minimum.reduceat(bars['low'], starts),
+            'close': bars['close'][ends],
+            'volume': np.add.reduceat(bars['volume'], starts),
+        }
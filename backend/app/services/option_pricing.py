@@ -0,0 +1,155 @@
+import re
+import time
+import numpy as np
+from datetime import datetime, time as dtime
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from .persistence import WriteBehindCache
+
+class OptionPricer:
+    """
+    Local Black-Scholes marks for option positions Yahoo has no quote for.
+
+    Prices all options in one vectorized pass from the underlying price, time to
+    expiry and an implied vol. The vol is backed out from the last live quote of
+    the option (persisted in `directory`) or falls back to default_vol.
+    """
+
+    MONTHS = {'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+              'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12}
+    IBKR_PATTERN = re.compile(r'^(\w+)\s+(\d{2})([A-Z]{3})(\d{2})\s+([\d\.]+)\s+([CP])$')
+    OCC_PATTERN = re.compile(r'^([A-Z\.]+)(\d{2})(\d{2})(\d{2})([CP])(\d{8})$')
+
+    EXPIRY_TZ = ZoneInfo("America/New_York")
+    EXPIRY_TIME = dtime(16, 0)
+    YEAR_SECONDS = 365.0 * 86400
+
+    def __init__(self, directory: str, default_vol: float = 0.35, risk_free_rate: float = 0.04):
+        self.default_vol = default_vol
+        self.risk_free_rate = risk_free_rate
+        # {option symbol: {'iv': float, 'timestamp': unix, 'inputs': [option price, underlying price]}}
+        self.implied_vols = WriteBehindCache(directory, lambda key: "implied_vols")
+
+    def parse(self, symbol: str) -> Optional[Tuple[str, float, float, bool]]:
+        """(underlying, expiry unix time, strike, is_call) for IBKR ('SOFI 20FEB26 26 P') or OCC symbols."""
+        symbol = symbol.strip()
+        match = self.IBKR_PATTERN.match(symbol)
+        if match:
+            underlying, day, mon, year, strike, otype = match.groups()
+            month = self.MONTHS.get(mon.upper())
+            if month is None:
+                return None
+            expiry = (2000 + int(year), month, int(day))
+            strike_val = float(strike)
+        else:
+            match = self.OCC_PATTERN.match(symbol.replace(' ', ''))
+            if not match:
+                return None
+            underlying, year, month, day, otype, strike = match.groups()
+            expiry = (2000 + int(year), int(month), int(day))
+            strike_val = int(strike) / 1000.0
+        try:
+            expiry_at = datetime(*expiry, self.EXPIRY_TIME.hour, self.EXPIRY_TIME.minute, tzinfo=self.EXPIRY_TZ)
+        except ValueError:
+            return None
+        return underlying, expiry_at.timestamp(), strike_val, otype == 'C'
+
+    # --- Model ---
+    @staticmethod
+    def _norm_cdf(x: np.ndarray) -> np.ndarray:
+        """Standard normal CDF via the Abramowitz-Stegun 7.1.26 erf approximation (|error| < 1.5e-7)."""
+        z = np.abs(x) / np.sqrt(2.0)
+        t = 1.0 / (1.0 + 0.3275911 * z)
+        poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+        erf = 1.0 - poly * np.exp(-z * z)
+        return 0.5 * (1.0 + np.sign(x) * erf)
+
+    def black_scholes(self, spot: np.ndarray, strike: np.ndarray, years: np.ndarray,
+                      vol: np.ndarray, is_call: np.ndarray) -> np.ndarray:
+        """European option values (vectorized). Expired or zero-vol options are worth intrinsic value."""
+        spot, strike, years, vol = (np.asarray(a, dtype=np.float64) for a in (spot, strike, years, vol))
+        is_call = np.asarray(is_call, dtype=bool)
+        r = self.risk_free_rate
+        discount = np.exp(-r * years)
+
+        sqrt_t = np.sqrt(np.maximum(years, 0.0))
+        live = (years > 0) & (vol > 0) & (spot > 0) & (strike > 0)
+        vol_t = np.where(live, vol * sqrt_t, 1.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d1 = (np.log(np.where(live, spot / strike, 1.0)) + (r + 0.5 * vol ** 2) * years) / vol_t
+        d2 = d1 - vol_t
+
+        call = spot * self._norm_cdf(d1) - strike * discount * self._norm_cdf(d2)
+        put = strike * discount * self._norm_cdf(-d2) - spot * self._norm_cdf(-d1)
+        value = np.where(is_call, call, put)
+
+        intrinsic = np.where(is_call, np.maximum(spot - strike, 0.0), np.maximum(strike - spot, 0.0))
+        return np.where(live, np.maximum(value, 0.0), intrinsic)
+
+    def implied_vol(self, price: np.ndarray, spot: np.ndarray, strike: np.ndarray, years: np.ndarray,
+                    is_call: np.ndarray, iterations: int = 60) -> np.ndarray:
+        """Implied vols by vectorized bisection on [1%, 500%]. NaN where the price has no time value to fit."""
+        price = np.asarray(price, dtype=np.float64)
+        low = np.full(price.shape, 0.01)
+        high = np.full(price.shape, 5.0)
+        for _ in range(iterations):
+            mid = 0.5 * (low + high)
+            too_high = self.black_scholes(spot, strike, years, mid, is_call) > price
+            high = np.where(too_high, mid, high)
+            low = np.where(too_high, low, mid)
+        vol = 0.5 * (low + high)
+
+        bounds_low = self.black_scholes(spot, strike, years, np.full(price.shape, 0.01), is_call)
+        bounds_high = self.black_scholes(spot, strike, years, np.full(price.shape, 5.0), is_call)
+        solvable = (np.asarray(years) > 0) & (price > bounds_low) & (price < bounds_high)
+        return np.where(solvable, vol, np.nan)
+
+    # --- Portfolio ---
+    def record_quotes(self, quotes: List[Tuple[str, float, float]]):
+        """Backs out and stores implied vols from live option quotes: [(symbol, option price, underlying price)]."""
+        # Skip quotes the stored vol was already backed out from
+        quotes = [(sym, price, spot) for sym, price, spot in quotes
+                  if (self.implied_vols.get(sym) or {}).get('inputs') != [price, spot]]
+        parsed = [(sym, price, spot, self.parse(sym)) for sym, price, spot in quotes]
+        parsed = [(sym, price, spot, p) for sym, price, spot, p in parsed if p and price > 0 and spot > 0]
+        if not parsed:
+            return
+        now = time.time()
+        vols = self.implied_vol(
+            np.array([p[1] for p in parsed]),
+            np.array([p[2] for p in parsed]),
+            np.array([p[3][2] for p in parsed]),
+            np.array([(p[3][1] - now) / self.YEAR_SECONDS for p in parsed]),
+            np.array([p[3][3] for p in parsed]),
+        )
+        for (sym, price, spot, _), vol in zip(parsed, vols):
+            # Unsolvable quotes are remembered too (iv None -> default vol), so they aren't retried every refresh
+            self.implied_vols[sym] = {'iv': float(vol) if np.isfinite(vol) else None, 'timestamp': now,
+                                      'inputs': [price, spot]}
+
+    def price(self, options: List[Tuple[str, float]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Model marks for [(option symbol, underlying price)] in one pass.
+        Returns {symbol: {'price', 'implied_vol', 'vol_source'}}; unparseable symbols are skipped.
+        """
+        parsed = [(sym, spot, self.parse(sym)) for sym, spot in options]
+        parsed = [(sym, spot, p) for sym, spot, p in parsed if p and spot > 0]
+        if not parsed:
+            return {}
+        now = time.time()
+        cached = [(self.implied_vols.get(sym) or {}).get('iv') for sym, _, _ in parsed]
+        vols = np.array([self.default_vol if c is None else c for c in cached])
+        values = self.black_scholes(
+            np.array([spot for _, spot, _ in parsed]),
+            np.array([p[2] for _, _, p in parsed]),
+            np.array([(p[1] - now) / self.YEAR_SECONDS for _, _, p in parsed]),
+            vols,
+            np.array([p[3] for _, _, p in parsed]),
+        )
+        return {
+            sym: {'price': float(value), 'implied_vol': float(vol), 'vol_source': "default" if c is None else "quote"}
+            for (sym, _, _), value, vol, c in zip(parsed, values, vols, cached)
+        }
+
+    def close(self):
+        self.implied_vols.close()
@@ -14,8 +14,14 @@ class OptionsService:
         else:
             self.db_path = os.path.join(base_dir or os.getcwd(), db_path)
             
+        self._saves = 0
         self.trades = self._load()
 
+    @property
+    def version(self) -> int:
+        """Changes whenever the trade journal is saved."""
+        return self._saves
+
     def _load(self) -> List[Dict[str, Any]]:
         if os.path.exists(self.db_path):
             try:
@@ -32,6 +38,7 @@ class OptionsService:
                 json.dump(self.trades, f, indent=2)
         except Exception as e:
             print(f"Error saving options: {e}")
+        self._saves += 1
 
     def get_all_trades(self) -> List[Dict[str, Any]]:
         return sorted(self.trades, key=lambda x: x.get('date_opened', ''), reverse=True)
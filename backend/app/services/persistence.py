@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import atexit
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+class WriteBehindCache(MutableMapping):
+    """
+    Dict-like cache with write-behind persistence.
+
+    Entries are grouped into segments (segment_of(key)), each stored as one compact
+    JSON file in `directory`. Writes only mark the segment dirty; a background thread
+    flushes dirty segments every `flush_interval` seconds and on flush()/exit.
+    Each segment file is written atomically (unique tmp file + os.replace) and named
+    after the segment plus a short hash of it, so segments that sanitize alike stay apart.
+
+    Optionally bounded: at most `max_entries` entries (least recently used evicted first),
+    and entries for which `is_expired(value)` is true are dropped on load and on each flush cycle.
+    """
+
+    def __init__(self, directory: str, segment_of: Callable[[str], str],
+                 flush_interval: float = 5.0, legacy_file: Optional[str] = None,
+                 max_entries: Optional[int] = None, is_expired: Optional[Callable[[Any], bool]] = None):
+        self.directory = directory
+        self.segment_of = segment_of
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self.is_expired = is_expired
+        self.evictions = 0
+        self.expirations = 0
+
+        self._data: "OrderedDict[str, Any]" = OrderedDict()  # Least recently used first
+        self._segment_keys: Dict[str, Set[str]] = {}
+        self._dirty: Set[str] = set()
+        self._lock = threading.RLock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._legacy_files: Set[str] = set()  # Segment files under a pre-hash name, removed after rewrite
+
+        self._load(legacy_file)
+        atexit.register(self.flush)
+
+    # --- Mapping interface ---
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            value = self._data[key]
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            segment = self.segment_of(key)
+            self._segment_keys.setdefault(segment, set()).add(key)
+            self._dirty.add(segment)
+            if self.max_entries is not None:
+                while len(self._data) > self.max_entries:
+                    self._remove(next(iter(self._data)))
+                    self.evictions += 1
+        self._ensure_flusher()
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            if key not in self._data:
+                raise KeyError(key)
+            self._remove(key)
+        self._ensure_flusher()
+
+    def __contains__(self, key) -> bool:
+        return key in self._data  # Membership doesn't count as use
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _remove(self, key: str):
+        """Drops a key and marks its segment dirty. Caller holds the lock."""
+        del self._data[key]
+        segment = self.segment_of(key)
+        self._segment_keys.get(segment, set()).discard(key)
+        self._dirty.add(segment)
+
+    def expire(self) -> int:
+        """Drops expired entries. Returns the number removed."""
+        if self.is_expired is None:
+            return 0
+        with self._lock:
+            expired = [k for k, v in self._data.items() if self.is_expired(v)]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        """Occupancy: entries, segments and bytes on disk, evictions."""
+        disk_bytes = 0
+        if os.path.isdir(self.directory):
+            disk_bytes = sum(e.stat().st_size for e in os.scandir(self.directory) if e.name.endswith('.json'))
+        return {
+            'entries': len(self._data),
+            'max_entries': self.max_entries,
+            'segments': sum(1 for keys in self._segment_keys.values() if keys),
+            'disk_bytes': disk_bytes,
+            'dirty_segments': len(self._dirty),
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    # --- Persistence ---
+    def _segment_path(self, segment: str) -> str:
+        safe = re.sub(r'[^A-Za-z0-9_\-]', '_', segment)
+        digest = hashlib.sha1(segment.encode()).hexdigest()[:8]
+        return os.path.join(self.directory, f"{safe}-{digest}.json")
+
+    def _load(self, legacy_file: Optional[str]):
+        if os.path.isdir(self.directory):
+            for fname in os.listdir(self.directory):
+                if not fname.endswith('.json'): continue
+                try:
+                    with open(os.path.join(self.directory, fname), 'r') as f:
+                        entries = json.load(f)
+                except Exception as e:
+                    print(f"Error loading cache segment {fname}: {e}")
+                    continue
+                for key, value in entries.items():
+                    self._data[key] = value
+                    segment = self.segment_of(key)
+                    self._segment_keys.setdefault(segment, set()).add(key)
+                    if os.path.basename(self._segment_path(segment)) != fname:
+                        # Written under the old naming: rewrite under the new name, then drop the old file
+                        self._dirty.add(segment)
+                        self._legacy_files.add(fname)
+            self._trim_loaded()
+            if self._dirty:
+                self._ensure_flusher()
+            return
+
+        # One-off migration from the old single-file cache
+        if legacy_file and os.path.exists(legacy_file):
+            try:
+                with open(legacy_file, 'r') as f:
+                    entries = json.load(f)
+                for key, value in entries.items():
+                    self[key] = value
+            except Exception as e:
+                print(f"Error loading cache: {e}")
+        self._trim_loaded()
+
+    def _trim_loaded(self):
+        """Applies expiry and the entry budget to freshly loaded data (in load order)."""
+        if self.expire():
+            self._ensure_flusher()
+        if self.max_entries is not None and len(self._data) > self.max_entries:
+            with self._lock:
+                excess = len(self._data) - self.max_entries
+                for key in list(self._data)[:excess]:
+                    self._remove(key)
+                self.evictions += excess
+            self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="cache-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.expire()
+            self.flush()
+
+    def flush(self) -> int:
+        """Writes all dirty segments to disk. Returns the number of segments written."""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            snapshots = {seg: {k: self._data[k] for k in self._segment_keys.get(seg, ())} for seg in dirty}
+
+        written = 0
+        for segment, entries in snapshots.items():
+            path = self._segment_path(segment)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                if not entries:
+                    if os.path.exists(path): os.remove(path)
+                    continue
+                self._write(path, entries)
+                written += 1
+            except Exception as e:
+                print(f"Warning: Could not save cache segment {segment}: {e}")
+                with self._lock:
+                    self._dirty.add(segment)  # Retry on the next flush
+        self._remove_legacy_files()
+        return written
+
+    def _write(self, path: str, entries: Dict[str, Any]):
+        """Atomic write through a unique tmp file, so concurrent flushes (exit hook, flusher thread) never share one."""
+        tmp = tempfile.NamedTemporaryFile('w', dir=self.directory, suffix='.tmp', delete=False)
+        try:
+            with tmp:
+                json.dump(entries, tmp, separators=(',', ':'))
+            os.replace(tmp.name, path)
+        except Exception:
+            if os.path.exists(tmp.name): os.remove(tmp.name)
+            raise
+
+    def _remove_legacy_files(self):
+        """Deletes old-named segment files once every segment has been written under its new name."""
+        with self._lock:
+            if not self._legacy_files or self._dirty:
+                return
+            legacy, self._legacy_files = self._legacy_files, set()
+        for fname in legacy:
+            try:
+                os.remove(os.path.join(self.directory, fname))
+            except OSError:
+                pass
+
+    def close(self):
+        """Stops the background flusher and writes pending changes."""
+        self._stop.set()
+        self.flush()
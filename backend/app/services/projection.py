@@ -0,0 +1,141 @@
+import warnings
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+from .margin import MarginService
+from .risk import RiskService
+
+class LeverageProjection:
+    """
+    Monte Carlo projection of NAV and leverage (gross positions / NAV, as in the KPI).
+
+    Holdings are split into a long and a short book; daily book returns are drawn either by
+    bootstrapping whole historical days (keeps the cross-holding correlation and fat tails) or from
+    a bivariate normal fitted to the same history. Books are held at today's weights (constant mix),
+    which keeps each draw two-dimensional, so 10k paths x 250 days is a few vectorized array ops.
+    Negative cash balances accrue tiered margin interest via MarginService, day by calendar day.
+    Positions without a price history (options, new listings) are kept at today's value.
+    """
+
+    METHODS = ("bootstrap", "normal")
+    PERCENTILES = (5, 25, 50, 75, 95)
+    # Paths x trading days per run; every (paths, horizon) array is this many float64 cells (~40 MB)
+    MAX_CELLS = 5_000_000
+
+    def __init__(self, risk: RiskService, margin: MarginService):
+        self.risk = risk
+        self.margin = margin
+
+    async def simulate(self, portfolio: Dict[str, Any], horizon: int = 250, paths: int = 10_000,
+                       method: str = "bootstrap", period: str = "1y", thresholds: Sequence[float] = (1.5, 2.0),
+                       seed: Optional[int] = None) -> Dict[str, Any]:
+        """portfolio: the /api/portfolio response (kpi incl. cash_balances, positions)."""
+        horizon = int(max(horizon, 1))
+        paths = int(max(paths, 100))
+        if paths * horizon > self.MAX_CELLS:
+            return {'error': f"paths x horizon must be at most {self.MAX_CELLS:,}", 'excluded': []}
+        method = method if method in self.METHODS else "bootstrap"
+        kpi = portfolio['kpi']
+
+        positions = [p for p in portfolio['positions'] if not p.get('is_excluded')]
+        data = await self.risk.returns(positions, period)
+        if not data['positions']:
+            return {'error': "No holdings with price history", 'excluded': data['excluded']}
+
+        # 1. Long and short books (CZK) and their historical daily returns at today's weights
+        values = data['values']
+        long_value = float(values[values > 0].sum())
+        short_value = float(-values[values < 0].sum())
+        R = data['filled']
+        book_returns = np.column_stack([
+            R[:, values > 0] @ (values[values > 0] / long_value) if long_value else np.zeros(len(R)),
+            R[:, values < 0] @ (values[values < 0] / -short_value) if short_value else np.zeros(len(R)),
+        ])
+
+        # 2. Paths x days x books draws -> cumulative book values
+        rng = np.random.default_rng(seed)
+        if method == "bootstrap":
+            draws = book_returns[rng.integers(0, len(book_returns), size=(paths, horizon))]
+        else:
+            draws = rng.multivariate_normal(book_returns.mean(axis=0), np.cov(book_returns, rowvar=False),
+                                            size=(paths, horizon), method='eigh')
+        growth = np.cumprod(1.0 + np.maximum(draws, -1.0), axis=1)
+        long_path = long_value * growth[:, :, 0]
+        short_path = short_value * growth[:, :, 1]
+
+        # 3. Cash: margin interest on negative balances (same for every path)
+        dates = pd.bdate_range(datetime.now(), periods=horizon + 1)[1:]
+        interest = self._interest(kpi.get('cash_balances', []), dates)
+
+        # 4. NAV and leverage relative to today's KPI (unsimulated positions, cash and accruals stay put)
+        nav0 = float(kpi['net_liquidity_czk'])
+        gross0 = float(kpi.get('gross_position_czk', 0.0))
+        nav = nav0 + (long_path - long_value) - (short_path - short_value) - interest
+        gross = gross0 + (long_path - long_value) + (short_path - short_value)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            leverage = np.where(nav > 0, gross / nav, np.inf)
+
+        peak = leverage.max(axis=1)
+        # Percentiles are over the paths still solvent (NAV > 0); depleted paths are reported as shares
+        # alongside, while the probabilities below use the raw array (depleted = above every threshold)
+        solvent = np.isfinite(leverage)
+        solvent_leverage = np.where(solvent, leverage, np.nan)
+        solvent_peak = np.where(solvent.any(axis=1), np.where(solvent, leverage, -np.inf).max(axis=1), np.nan)
+        thresholds = sorted(float(t) for t in thresholds if t > 0)
+        return {
+            'as_of': datetime.now().strftime("%Y-%m-%d"),
+            'method': method,
+            'period': period if period in self.risk.PERIODS else '1y',
+            'paths': paths,
+            'horizon': horizon,
+            'seed': seed,
+            'observations': int(len(book_returns)),
+            'dates': dates.strftime("%Y-%m-%d").tolist(),
+            'start': {'nav_czk': nav0, 'gross_position_czk': gross0, 'leverage': gross0 / nav0 if nav0 > 0 else None,
+                      'long_czk': long_value, 'short_czk': short_value},
+            'interest_czk': interest,
+            'percentiles': list(self.PERCENTILES),
+            # Fan charts: percentile x day
+            'nav_czk': np.percentile(nav, self.PERCENTILES, axis=0),
+            'leverage': self._percentiles(solvent_leverage, axis=0),
+            'depleted': 1.0 - solvent.mean(axis=0),  # Share of paths with NAV <= 0 on each day
+            'final': {
+                'nav_czk': np.percentile(nav[:, -1], self.PERCENTILES),
+                'leverage': self._percentiles(solvent_leverage[:, -1]),
+                'max_leverage': self._percentiles(solvent_peak),  # Peak before depletion on depleted paths
+                'depleted': float(1.0 - solvent[:, -1].mean()),
+            },
+            'probabilities': {
+                'nav_depleted': float((nav.min(axis=1) <= 0).mean()),
+                'thresholds': [
+                    {'leverage': t, 'ever': float((peak >= t).mean()), 'at_horizon': float((leverage[:, -1] >= t).mean())}
+                    for t in thresholds
+                ],
+            },
+            'excluded': data['excluded'],
+        }
+
+    def _percentiles(self, values: np.ndarray, axis: Optional[int] = None) -> np.ndarray:
+        """PERCENTILES ignoring NaN (depleted paths); NaN only where every path is depleted."""
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # All-NaN slices
+            return np.nanpercentile(values, self.PERCENTILES, axis=axis)
+
+    def _interest(self, cash_balances: List[Dict[str, Any]], dates: pd.DatetimeIndex) -> np.ndarray:
+        """Cumulative margin interest (CZK) at each simulated date; accrues daily and compounds into the debt."""
+        calendar = np.diff(np.concatenate([[np.datetime64(datetime.now().date(), 'D')],
+                                           dates.values.astype('datetime64[D]')])).astype(np.int64)
+        total = np.zeros(len(dates))
+        for cb in cash_balances:
+            balance = float(cb['amount'])
+            if balance >= 0:
+                continue
+            fx_czk = cb['value_czk'] / balance if balance else 0.0
+            accrued = np.empty(len(dates))
+            for k, n in enumerate(calendar):
+                for _ in range(int(n)):
+                    balance -= self.margin.calculate_daily_cost(cb['currency'], balance)[1]
+                accrued[k] = float(cb['amount']) - balance
+            total += accrued * fx_czk
+        return total
@@ -1,11 +1,11 @@
 from typing import List, Dict, Any, Optional
 import pandas as pd
 from datetime import datetime
-from .forex import ForexService
+from .forex import ForexService, get_forex_service
 
 class PortfolioReconstructor:
-    def __init__(self):
-        self.forex = ForexService()
+    def __init__(self, forex: Optional[ForexService] = None):
+        self.forex = forex or get_forex_service()
 
     def _parse_float(self, val: Any) -> float:
         """Safely parses a float from string, handling commas."""
@@ -19,6 +19,30 @@ class PortfolioReconstructor:
                 return 0.0
         return 0.0
 
+    def symbol_map(self, fin_info_df: Optional[pd.DataFrame]) -> Dict[str, str]:
+        """Trade symbol aliases -> canonical Open Positions symbol (e.g. 'EVOs' -> 'EVO')."""
+        symbol_map = {}
+        if fin_info_df is not None and not fin_info_df.empty:
+            # Find 'Symbol' column (it might be named 'Symbol' or similar)
+            symbol_col = next((c for c in fin_info_df.columns if 'Symbol' in c), None)
+            
+            if symbol_col:
+                for _, row in fin_info_df.iterrows():
+                    val = str(row[symbol_col])
+                    if ',' in val:
+                        parts = [p.strip() for p in val.split(',')]
+                        # Map all parts to the LAST part (Canonical)
+                        # e.g. "EVOs, EVO" -> canonical="EVO"
+                        canonical = parts[-1]
+                        for p in parts:
+                            symbol_map[p] = canonical
+            
+            # Manual Overrides for specific issues
+            if 'ZALd' in symbol_map or 'ZAL' in symbol_map:
+                 symbol_map['ZALd'] = 'ZAL'
+                 symbol_map['ZAL'] = 'ZAL'
+        return symbol_map
+
     def reconstruct(self, trades_df: pd.DataFrame, fin_info_df: Optional[pd.DataFrame] = None) -> Dict[str, Dict[str, Any]]:
         """
         Replays trades to calculate the current portfolio state with precise Cost Basis in CZK.
@@ -41,26 +65,7 @@ class PortfolioReconstructor:
         # "EVOs, EVO",EVOLUTION AB,366244347,...
         # The first column seems to contain aliases? Or is it "Symbol" and "Local Symbol"?
         
-        symbol_map = {}
-        if fin_info_df is not None and not fin_info_df.empty:
-            # Find 'Symbol' column (it might be named 'Symbol' or similar)
-            symbol_col = next((c for c in fin_info_df.columns if 'Symbol' in c), None)
-            
-            if symbol_col:
-                for _, row in fin_info_df.iterrows():
-                    val = str(row[symbol_col])
-                    if ',' in val:
-                        parts = [p.strip() for p in val.split(',')]
-                        # Map all parts to the LAST part (Canonical)
-                        # e.g. "EVOs, EVO" -> canonical="EVO"
-                        canonical = parts[-1]
-                        for p in parts:
-                            symbol_map[p] = canonical
-            
-            # Manual Overrides for specific issues
-            if 'ZALd' in symbol_map or 'ZAL' in symbol_map:
-                 symbol_map['ZALd'] = 'ZAL'
-                 symbol_map['ZAL'] = 'ZAL'
+        symbol_map = self.symbol_map(fin_info_df)
         
         # 2. Sort Trades
         if 'Date/Time' not in trades_df.columns:
@@ -0,0 +1,69 @@
+import asyncio
+import random
+from typing import Callable, List, Optional
+from .market import MarketDataService
+
+class PriceRefresher:
+    """
+    In-process background task that keeps MarketDataService.cache warm.
+    Refreshes the tracked symbols (Open Positions, watchlist, FX pairs) on a schedule
+    slightly shorter than the quote TTL, so request handlers almost always hit cache.
+    Symbols whose quote stays valid past the next cycle (closed venues) are skipped.
+    Each cycle also enriches static instrument data for symbols seen for the first time.
+    """
+
+    def __init__(self, market: MarketDataService, symbol_source: Callable[[], List[str]],
+                 lead: float = 0.8, jitter: float = 0.1, max_concurrency: int = 2, chunk_size: int = 25):
+        self.market = market
+        self.symbol_source = symbol_source  # Returns the symbols to keep warm (called in an executor)
+        self.lead = lead                    # Refresh at 80% of TTL
+        self.jitter = jitter                # +/- 10% so we don't hit Yahoo on a fixed beat
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_once()
+            except Exception as e:
+                print(f"Price refresher error: {e}")
+            await asyncio.sleep(self._next_delay())
+
+    def _next_delay(self) -> float:
+        base = self.market.cache_expiry_minutes * 60 * self.lead
+        return base * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def refresh_once(self) -> int:
+        """Refetches tracked symbols expiring before the next cycle. Returns the number of symbols requested."""
+        # The source may parse statements (blocking CSV work) - keep it off the event loop
+        source = await asyncio.get_running_loop().run_in_executor(None, self.symbol_source)
+        tracked = list(dict.fromkeys(s for s in source if s))
+        symbols = self.market.expiring(tracked, within=self.market.cache_expiry_minutes * 60)
+        if not symbols:
+            await self.market.enrich_instruments(tracked)
+            return 0
+
+        chunks = [symbols[i:i + self.chunk_size] for i in range(0, len(symbols), self.chunk_size)]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def refresh_chunk(chunk: List[str]):
+            async with semaphore:
+                await self.market.get_live_prices(chunk, force=True)
+
+        await asyncio.gather(*(refresh_chunk(c) for c in chunks))
+        await self.market.enrich_instruments(tracked)
+        return len(symbols)
@@ -0,0 +1,239 @@
+import asyncio
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Tuple
+from .market import MarketDataService
+from .forex import ForexService
+
+class RiskService:
+    """
+    Portfolio risk from daily CZK returns of the current holdings.
+
+    Builds one aligned (days x holdings) return matrix from the cached daily closes and ČNB rates,
+    then derives everything with batched numpy: volatilities, covariance/correlation, beta to a
+    benchmark, historical and parametric VaR/CVaR (1 day), and marginal risk contributions.
+    Holdings with a shorter history than the lookback are measured over the days they have prices
+    (pairwise-complete), not diluted with zero returns.
+    Statistics are cached per day for the same statements, benchmark and lookback; CZK amounts
+    are recomputed from the current market values on every call.
+    """
+
+    PERIODS = {'6m': 182, '1y': 365, '3y': 1096, '5y': 1826}
+    CONFIDENCE = (0.95, 0.99)
+    TRADING_DAYS = 252
+    MIN_OBSERVATIONS = 20  # Holdings with fewer daily returns are left out
+    BENCHMARK = "SPY"
+
+    def __init__(self, market: MarketDataService, forex: ForexService):
+        self.market = market
+        self.forex = forex
+        self._cache: Dict[Tuple, Dict[str, Any]] = {}
+
+    async def analyze(self, positions: List[Dict[str, Any]], files_hash: str = "",
+                      benchmark: str = "SPY", period: str = "1y") -> Dict[str, Any]:
+        """positions: rows of the portfolio response (symbol, currency, market_value_czk, region)."""
+        today = datetime.now().strftime("%Y-%m-%d")
+        key = (today, files_hash, benchmark, period)
+        if files_hash and key in self._cache:
+            result = self._cache[key]
+        else:
+            result = await self._analyze(positions, benchmark, period, today)
+            if files_hash:
+                # One trading day's results only
+                self._cache = {k: v for k, v in self._cache.items() if k[0] == today}
+                self._cache[key] = result
+        # Statistics come from the day's history; CZK amounts follow the current market values
+        return self._in_czk(result, positions)
+
+    async def returns(self, positions: List[Dict[str, Any]], period: str = "1y",
+                      benchmark: str = BENCHMARK) -> Dict[str, Any]:
+        """
+        Aligned daily CZK returns of the holdings with enough price history (days x holdings) and
+        of the benchmark. 'returns' is NaN where a holding has no price (not listed yet, gaps);
+        'filled' replaces those days with beta x the benchmark's return, for whole-book series.
+        """
+        lookback = self.PERIODS.get(period, self.PERIODS['1y'])
+        today = datetime.now().strftime("%Y-%m-%d")
+        start = (datetime.now() - timedelta(days=lookback)).strftime("%Y-%m-%d")
+        days = pd.bdate_range(start, today).values.astype('datetime64[s]').astype(np.int64)
+
+        # 1. Holdings with a price history (derivatives are valued from their underlying elsewhere)
+        excluded = [{'symbol': p['symbol'], 'reason': "derivative"} for p in positions if p.get('region') == "Derivatives"]
+        valued = [p for p in positions if p.get('region') != "Derivatives"]
+        # Unpriced lines (NaN value) would turn every weighted figure into NaN
+        excluded += [{'symbol': p['symbol'], 'reason': "no market value"} for p in valued
+                     if not np.isfinite(self._value(p))]
+        holdings = [p for p in valued if np.isfinite(self._value(p)) and self._value(p) != 0]
+        symbols = [p['symbol'] for p in holdings] + [benchmark]
+        closes = await asyncio.gather(*(self.market.get_daily_closes(s) for s in symbols))
+        # Closes are converted from their quote currency
+        currencies = [series['currency'] if series else 'CZK' for series in closes]
+        fx = await self._fx_matrix(currencies, days, start, today)
+
+        # 2. Aligned CZK prices -> daily returns (NaN before the first close)
+        prices = np.full((len(days), len(symbols)), np.nan)
+        for j, series in enumerate(closes):
+            if series is not None:
+                i = np.searchsorted(series['time'], days, side='right') - 1
+                prices[:, j] = np.where(i >= 0, series['close'][np.maximum(i, 0)], np.nan)
+        prices *= fx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = prices[1:] / prices[:-1] - 1.0
+        returns[~np.isfinite(returns)] = np.nan
+        observations = np.isfinite(returns).sum(axis=0)
+
+        n = len(holdings)
+        usable = observations[:n] >= self.MIN_OBSERVATIONS
+        excluded += [{'symbol': p['symbol'], 'reason': "no price history"} for p, ok in zip(holdings, usable) if not ok]
+        cols = np.flatnonzero(usable)
+        R, bench = returns[:, cols], returns[:, -1]
+
+        # 3. Pairwise-complete statistics: each pair only over the days both have a price
+        cov = self._pairwise_cov(np.column_stack([R, bench]))
+        betas = self._betas(R, bench, cov[:-1, -1])
+        filled = np.where(np.isfinite(R), R, betas * np.nan_to_num(bench)[:, None])
+        return {
+            'days': days[1:],
+            'positions': [holdings[j] for j in cols],
+            'values': np.array([holdings[j]['market_value_czk'] for j in cols], dtype=np.float64),
+            'returns': R,
+            'filled': filled,
+            'observations': observations[cols],
+            'covariance': cov[:-1, :-1],
+            'betas': betas,
+            'benchmark': np.nan_to_num(bench),
+            'benchmark_observations': int(observations[-1]),
+            'excluded': excluded,
+        }
+
+    def _pairwise_cov(self, X: np.ndarray) -> np.ndarray:
+        """Daily covariance of the columns of X, each pair over the rows where both are finite."""
+        observed = np.isfinite(X).astype(np.float64)
+        values = np.where(observed > 0, X, 0.0)
+        count = observed.T @ observed
+        sums = values.T @ observed  # sums[i, j]: sum of column i over the rows where j is observed too
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (values.T @ values - sums * sums.T / count) / (count - 1)
+        return np.where(count > 1, cov, 0.0)
+
+    def _betas(self, R: np.ndarray, bench: np.ndarray, cov_bench: np.ndarray) -> np.ndarray:
+        """Beta of each column of R: covariance with the benchmark over benchmark variance, both on the shared days."""
+        both = (np.isfinite(R) & np.isfinite(bench)[:, None]).astype(np.float64)
+        b = np.nan_to_num(bench)
+        count = both.sum(axis=0)
+        total, squares = b @ both, (b * b) @ both
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bench_var = (squares - total * total / count) / (count - 1)
+            return np.where(bench_var > 0, cov_bench / bench_var, 0.0)
+
+    async def _analyze(self, positions: List[Dict[str, Any]], benchmark: str, period: str, today: str) -> Dict[str, Any]:
+        data = await self.returns(positions, period, benchmark)
+        excluded = data['excluded']
+        if data['benchmark_observations'] < self.MIN_OBSERVATIONS:
+            return {'error': f"No price history for benchmark {benchmark}", 'excluded': excluded}
+        if not data['positions']:
+            return {'error': "No holdings with price history", 'excluded': excluded}
+
+        symbols = [p['symbol'] for p in data['positions']]
+        values = data['values']
+        weights = values / values.sum()
+        n = len(symbols)
+
+        # 4. Covariance (pairwise-complete, clipped to the nearest PSD matrix), volatility, correlation (annualized)
+        cov = data['covariance']
+        eigenvalues, eigenvectors = np.linalg.eigh(cov)
+        if eigenvalues.min() < 0:
+            cov = (eigenvectors * np.maximum(eigenvalues, 0.0)) @ eigenvectors.T
+        cov = cov * self.TRADING_DAYS
+        vol = np.sqrt(np.maximum(np.diag(cov), 0.0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.where(np.outer(vol, vol) > 0, cov / np.outer(vol, vol), 0.0)
+        np.fill_diagonal(corr, 1.0)
+
+        # Whole-book daily series: missing days carry the holding's beta x benchmark return
+        portfolio_returns = data['filled'] @ weights
+        portfolio_vol = float(np.sqrt(max(weights @ cov @ weights, 0.0)))
+        betas = data['betas']
+
+        # 5. Marginal and component risk contributions
+        with np.errstate(divide='ignore', invalid='ignore'):
+            marginal = cov @ weights / portfolio_vol if portfolio_vol > 0 else np.zeros(n)
+        contribution = weights * marginal
+
+        result = {
+            'as_of': today,
+            'benchmark': benchmark,
+            'period': period if period in self.PERIODS else '1y',
+            'observations': int(len(portfolio_returns)),
+            'portfolio': {
+                'volatility': portfolio_vol,
+                'beta': float(weights @ betas),
+                **self._value_at_risk(portfolio_returns),
+            },
+            'positions': [
+                {'symbol': s, 'weight': w, 'volatility': v, 'beta': b, 'marginal_risk': m,
+                 'risk_contribution': c, 'risk_contribution_pct': c / portfolio_vol * 100 if portfolio_vol > 0 else 0.0,
+                 'observations': n}
+                for s, w, v, b, m, c, n in zip(symbols, weights.tolist(), vol.tolist(), betas.tolist(),
+                                               marginal.tolist(), contribution.tolist(), data['observations'].tolist())
+            ],
+            'correlation': {'symbols': symbols, 'matrix': corr},
+            'excluded': excluded,
+        }
+        return result
+
+    def _value_at_risk(self, returns: np.ndarray) -> Dict[str, Any]:
+        """1-day historical and parametric (normal) VaR / CVaR as loss fractions."""
+        mu, sigma = float(returns.mean()), float(returns.std(ddof=1))
+        var, cvar = {}, {}
+        for level in self.CONFIDENCE:
+            # Historical: empirical loss quantile and mean loss beyond it
+            cutoff = float(np.quantile(returns, 1 - level))
+            tail = returns[returns <= cutoff]
+            # Parametric: normal with the sample mean/std
+            z = NormalDist().inv_cdf(level)
+
+            label = f"{level:.2f}"
+            var[label] = {'historical': -cutoff, 'parametric': sigma * z - mu}
+            cvar[label] = {'historical': -float(tail.mean()), 'parametric': sigma * NormalDist().pdf(z) / (1 - level) - mu}
+        return {'var': var, 'cvar': cvar}
+
+    @staticmethod
+    def _value(position: Dict[str, Any]) -> float:
+        """market_value_czk as a float (NaN when missing)."""
+        value = position.get('market_value_czk')
+        return float(value) if value is not None else np.nan
+
+    def _in_czk(self, result: Dict[str, Any], positions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Copy of a (cached) result with value_czk and VaR/CVaR CZK amounts at the holdings' current values."""
+        if 'portfolio' not in result:
+            return result
+        current = {p['symbol']: self._value(p) if np.isfinite(self._value(p)) else 0.0 for p in positions}
+        value = float(sum(current.get(p['symbol'], 0.0) for p in result['positions']))
+        portfolio = dict(result['portfolio'])
+        for measure in ('var', 'cvar'):
+            portfolio[measure] = {
+                label: {**levels, 'historical_czk': levels['historical'] * value, 'parametric_czk': levels['parametric'] * value}
+                for label, levels in result['portfolio'][measure].items()
+            }
+        return {**result, 'value_czk': value, 'portfolio': portfolio}
+
+    async def _fx_matrix(self, currencies: List[str], days: np.ndarray, start: str, end: str) -> np.ndarray:
+        """CZK per unit of each column's currency on each day (forward-filled ČNB rates)."""
+        distinct = list(dict.fromkeys(currencies))
+        loop = asyncio.get_event_loop()
+        table = await loop.run_in_executor(None, self.forex.get_rate_history, distinct, start, end)
+        fx = np.ones((len(days), len(distinct)))
+        for k, cur in enumerate(distinct):
+            if cur == 'CZK':
+                continue
+            if cur in table.columns and table[cur].notna().any():
+                rates = table[cur].dropna()
+                times = rates.index.values.astype('datetime64[s]').astype(np.int64)
+                i = np.searchsorted(times, days, side='right') - 1
+                fx[:, k] = rates.to_numpy(dtype=np.float64)[np.maximum(i, 0)]
+            else:
+                fx[:, k] = await self.forex.get_rate_async(cur, end, 'CZK')
+        return fx[:, [distinct.index(c) for c in currencies]]
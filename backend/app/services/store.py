@@ -11,9 +11,23 @@ class StoreService:
         else:
             self.db_path = os.path.join(base_dir or os.getcwd(), db_path)
             
+        self._saves = 0
+        self._loaded_mtime = None
         self.data = self._load()
 
+    @property
+    def version(self) -> str:
+        """Changes whenever the metadata changes (saved here or edited on disk)."""
+        return f"{self._saves}:{self._loaded_mtime}"
+
+    def _mtime(self):
+        try:
+            return os.stat(self.db_path).st_mtime_ns
+        except OSError:
+            return None
+
     def _load(self) -> Dict[str, Any]:
+        self._loaded_mtime = self._mtime()
         if os.path.exists(self.db_path):
             try:
                 with open(self.db_path, 'r') as f:
@@ -23,7 +37,9 @@ class StoreService:
         return {}
 
     def load(self) -> Dict[str, Any]:
-        self.data = self._load()
+        """Current metadata; the file is only re-read when it changed on disk."""
+        if self._mtime() != self._loaded_mtime:
+            self.data = self._load()
         return self.data
 
     def _save(self):
@@ -33,8 +49,10 @@ class StoreService:
             with open(tmp_path, 'w') as f:
                 json.dump(self.data, f, indent=2)
             os.replace(tmp_path, self.db_path)
+            self._loaded_mtime = self._mtime()
         except Exception as e:
             print(f"Error saving metadata: {e}")
+        self._saves += 1
 
     def get_metadata(self, symbol: str) -> Dict[str, Any]:
         return self.data.get(symbol, {})
@@ -0,0 +1,216 @@
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from .engine import PortfolioEngine
+from .market import MarketDataService
+from .forex import ForexService
+
+class StressTester:
+    """
+    Stress scenarios over the current book: price shocks by symbol/country/region/currency,
+    FX shocks against CZK, and historical replays of a date window from cached daily closes.
+
+    Every scenario becomes one row of a (scenarios x instruments) price-shock matrix and a
+    (scenarios x currencies) FX-shock matrix; post-shock values for the whole book are then a
+    broadcast product. Options are repriced (Black-Scholes, same implied vol) on their shocked underlying.
+    """
+
+    # Shock rules: match fields (symbol, region, country, currency; all given must match, none = whole book)
+    # with 'shock' (price return) and/or 'fx' (currency vs CZK). Later rules override earlier ones.
+    PRESETS = {
+        "Global equities -20%": [{'shock': -0.20}],
+        "North America -20%": [{'region': "North America", 'shock': -0.20}],
+        "Europe -20%": [{'region': "Europe", 'shock': -0.20}],
+        "Asia -25%": [{'region': "Asia", 'shock': -0.25}],
+        "China ADRs -30%": [{'country': "CN", 'currency': "USD", 'shock': -0.30}],
+        "USD/CZK -10%": [{'currency': "USD", 'fx': -0.10}],
+        "EUR/CZK -10%": [{'currency': "EUR", 'fx': -0.10}],
+        "CZK +10% vs all": [{'fx': -0.10}],
+        "Global -20%, USD/CZK -10%": [{'shock': -0.20}, {'currency': "USD", 'fx': -0.10}],
+    }
+    HISTORICAL = {
+        "Q4 2018 selloff": ("2018-09-20", "2018-12-24"),
+        "COVID crash 2020": ("2020-02-19", "2020-03-23"),
+        "Rate shock 2022": ("2022-01-03", "2022-10-12"),
+        "Carry unwind Aug 2024": ("2024-07-16", "2024-08-05"),
+    }
+    BENCHMARK = "SPY"  # Replay proxy for holdings without history (when their region has none either)
+    MAX_GAP_DAYS = 7   # A close older than this before the window start doesn't count as covering it
+    WORST = 5
+
+    def __init__(self, engine: PortfolioEngine, market: MarketDataService, forex: ForexService):
+        self.engine = engine
+        self.market = market
+        self.forex = forex
+
+    def presets(self) -> List[Dict[str, Any]]:
+        """Predefined shock vectors and historical replays as scenario dicts."""
+        return [{'name': name, 'shocks': shocks} for name, shocks in self.PRESETS.items()] + \
+               [{'name': name, 'shocks': [], 'start': start, 'end': end} for name, (start, end) in self.HISTORICAL.items()]
+
+    async def run(self, portfolio: Dict[str, Any], scenarios: List[Dict[str, Any]], max_leverage: float = 1.5) -> Dict[str, Any]:
+        """portfolio: the /api/portfolio response. scenarios: [{name, shocks, start?, end?}]."""
+        kpi = portfolio['kpi']
+        positions = portfolio['positions']
+        cash_balances = kpi.get('cash_balances', [])
+
+        # 1. Book: positions -> price drivers (options -> underlying), currencies
+        pricer = self.engine.option_pricer
+        contracts = [pricer.parse(p['symbol']) if p.get('region') == "Derivatives" else None for p in positions]
+        tags = {p['symbol']: p for p in positions if p.get('region') != "Derivatives"}
+        drivers = list(dict.fromkeys(c[0] if c else p['symbol'] for p, c in zip(positions, contracts)))
+        driver_of = np.array([drivers.index(c[0] if c else p['symbol']) for p, c in zip(positions, contracts)], dtype=np.int64)
+        # Underlyings that aren't held take the option's currency and no location
+        option_currency = {c[0]: p.get('currency') for p, c in zip(positions, contracts) if c}
+        driver_tags = {
+            field: np.array([str((tags.get(d) or {}).get(field) or (option_currency.get(d) if field == 'currency' else "") or "")
+                             for d in drivers], dtype=object)
+            for field in ('region', 'country', 'currency')
+        }
+        driver_tags['symbol'] = np.array(drivers, dtype=object)
+
+        currencies = list(dict.fromkeys([p.get('currency') or "USD" for p in positions] + [cb['currency'] for cb in cash_balances]))
+        currency_of = np.array([currencies.index(p.get('currency') or "USD") for p in positions], dtype=np.int64)
+        cash_of = np.array([currencies.index(cb['currency']) for cb in cash_balances], dtype=np.int64)
+        cash_czk = np.array([cb['value_czk'] for cb in cash_balances], dtype=np.float64)
+
+        # 2. Shock matrices: price returns per driver, FX returns per currency
+        n = len(scenarios)
+        price_shock = np.zeros((n, len(drivers)))
+        fx_shock = np.zeros((n, len(currencies)))
+        coverage = np.full(n, np.nan)
+        replays = [(i, s) for i, s in enumerate(scenarios) if s.get('start') and s.get('end')]
+        if replays:
+            await self._replay(replays, drivers, driver_tags, currencies, price_shock, fx_shock, coverage)
+        for i, scenario in enumerate(scenarios):
+            self._apply_rules(scenario.get('shocks') or [], driver_tags, currencies, price_shock[i], fx_shock[i])
+
+        # 3. Post-shock values: stocks scale with their driver, options are repriced; then FX
+        value = np.array([p['market_value_czk'] for p in positions], dtype=np.float64)
+        active = ~np.array([bool(p.get('is_excluded')) for p in positions], dtype=bool)
+        growth = 1.0 + price_shock[:, driver_of]
+        shocked = value * growth
+        options = np.flatnonzero([c is not None for c in contracts])
+        if len(options):
+            shocked[:, options] = await self._reprice(positions, contracts, options, drivers, driver_of, value, growth)
+        shocked *= 1.0 + fx_shock[:, currency_of]
+        shocked_cash = cash_czk * (1.0 + fx_shock[:, cash_of])
+
+        # 4. NAV, gross exposure, leverage and the cash needed to get back under max_leverage
+        pnl_positions = (shocked - value) * active
+        nav0 = float(kpi.get('net_liquidity_czk', 0.0))
+        nav = nav0 + pnl_positions.sum(axis=1) + (shocked_cash - cash_czk).sum(axis=1)
+        gross = float(kpi.get('gross_position_czk', 0.0)) + (np.abs(shocked) - np.abs(value)).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            leverage = np.where(nav > 0, gross / nav, np.inf)
+        requirement = np.maximum(gross / max_leverage - nav, 0.0) if max_leverage > 0 else np.zeros(n)
+
+        worst = np.argsort(pnl_positions, axis=1)[:, :self.WORST]
+        symbols = [p['symbol'] for p in positions]
+        return {
+            'as_of': datetime.now().strftime("%Y-%m-%d"),
+            'max_leverage': max_leverage,
+            'current': {'net_liquidity_czk': nav0, 'gross_position_czk': kpi.get('gross_position_czk', 0.0),
+                        'leverage': kpi.get('leverage', 0.0)},
+            'scenarios': [{'name': s.get('name') or f"Scenario {i + 1}",
+                           'kind': "historical" if s.get('start') and s.get('end') else "shock"}
+                          for i, s in enumerate(scenarios)],
+            # Columnar: one value per scenario
+            'net_liquidity_czk': nav,
+            'pnl_czk': nav - nav0,
+            'pnl_pct': (nav - nav0) / nav0 * 100 if nav0 else np.zeros(n),
+            'gross_position_czk': gross,
+            'leverage': leverage,
+            'cash_czk': shocked_cash.sum(axis=1),
+            'cash_requirement_czk': requirement,
+            'margin_call': (leverage > max_leverage) if max_leverage > 0 else np.zeros(n, dtype=bool),
+            'history_coverage': coverage,
+            'worst': [[{'symbol': symbols[j], 'pnl_czk': float(pnl_positions[i, j])} for j in row if pnl_positions[i, j] < 0]
+                      for i, row in enumerate(worst)],
+        }
+
+    def _apply_rules(self, rules: List[Dict[str, Any]], driver_tags: Dict[str, np.ndarray], currencies: List[str],
+                     price_row: np.ndarray, fx_row: np.ndarray):
+        """Writes one scenario's shock rules into its rows of the shock matrices (in place)."""
+        currency_names = np.array(currencies, dtype=object)
+        for rule in rules:
+            if rule.get('shock') is not None:
+                mask = np.ones(len(price_row), dtype=bool)
+                for field in ('symbol', 'region', 'country', 'currency'):
+                    if rule.get(field):
+                        mask &= driver_tags[field] == (rule[field].upper() if field in ('symbol', 'currency') else rule[field])
+                price_row[mask] = max(float(rule['shock']), -1.0)
+            if rule.get('fx') is not None:
+                mask = currency_names != "CZK"
+                if rule.get('currency'):
+                    mask &= currency_names == rule['currency'].upper()
+                fx_row[mask] = max(float(rule['fx']), -1.0)
+
+    async def _replay(self, replays: List, drivers: List[str], driver_tags: Dict[str, np.ndarray], currencies: List[str],
+                      price_shock: np.ndarray, fx_shock: np.ndarray, coverage: np.ndarray):
+        """Historical windows: local-currency returns of each driver and CNB rate changes, start close -> end close."""
+        closes = await asyncio.gather(*(self.market.get_daily_closes(d) for d in drivers + [self.BENCHMARK]))
+        loop = asyncio.get_event_loop()
+        first = min(s['start'] for _, s in replays)
+        last = max(s['end'] for _, s in replays)
+        rates = await loop.run_in_executor(None, self.forex.get_rate_history, currencies, first, last)
+
+        regions = driver_tags['region']
+        for i, scenario in replays:
+            start, end = self._day(scenario['start']), self._day(scenario['end'])
+            returns = np.array([self._window_return(c, start, end) for c in closes])
+            bench, returns = returns[-1], returns[:-1]
+            covered = np.isfinite(returns)
+            coverage[i] = covered.mean() if len(returns) else np.nan
+            # Proxies: the median of covered holdings in the same region, else the benchmark
+            for region in pd.unique(regions[~covered]):
+                peers = returns[covered & (regions == region)]
+                proxy = float(np.median(peers)) if len(peers) else (bench if np.isfinite(bench) else 0.0)
+                returns[~covered & (regions == region)] = proxy
+            price_shock[i] = returns
+
+            for k, cur in enumerate(currencies):
+                if cur != "CZK" and cur in rates.columns:
+                    series = rates[cur].dropna()
+                    times = series.index.values.astype('datetime64[s]').astype(np.int64)
+                    fx_shock[i, k] = self._window_return({'time': times, 'close': series.to_numpy(dtype=np.float64)},
+                                                         start, end, gap=self.MAX_GAP_DAYS * 86400)
+            fx_shock[i] = np.where(np.isfinite(fx_shock[i]), fx_shock[i], 0.0)
+
+    def _window_return(self, series: Optional[Dict[str, np.ndarray]], start: int, end: int, gap: Optional[int] = None) -> float:
+        """Close at/before end over close at/before start, minus 1; NaN if the series doesn't cover start."""
+        if series is None or len(series['time']) == 0:
+            return np.nan
+        gap = self.MAX_GAP_DAYS * 86400 if gap is None else gap
+        a, b = np.searchsorted(series['time'], [start, end], side='right') - 1
+        if a < 0 or start - series['time'][a] > gap or series['close'][a] <= 0:
+            return np.nan
+        return float(series['close'][b] / series['close'][a] - 1.0)
+
+    async def _reprice(self, positions: List[Dict[str, Any]], contracts: List, options: np.ndarray, drivers: List[str],
+                       driver_of: np.ndarray, value: np.ndarray, growth: np.ndarray) -> np.ndarray:
+        """Post-shock CZK values of option positions (scenarios x options) from the model value change."""
+        pricer = self.engine.option_pricer
+        underlyings = [drivers[driver_of[j]] for j in options]
+        quotes = await self.market.get_live_prices(list(dict.fromkeys(underlyings)))
+        spot = np.array([(quotes.get(u) or {}).get('price') or np.nan for u in underlyings], dtype=np.float64)
+        strike = np.array([contracts[j][2] for j in options], dtype=np.float64)
+        years = np.array([(contracts[j][1] - time.time()) / pricer.YEAR_SECONDS for j in options], dtype=np.float64)
+        is_call = np.array([contracts[j][3] for j in options], dtype=bool)
+        vol = np.array([(pricer.implied_vols.get(positions[j]['symbol']) or {}).get('iv') or pricer.default_vol
+                        for j in options], dtype=np.float64)
+
+        before = pricer.black_scholes(spot, strike, years, vol, is_call)
+        after = pricer.black_scholes(spot * growth[:, options], strike, years, vol, is_call)
+        # CZK value per unit of option price (carries quantity, multiplier and the position's sign)
+        price = np.array([positions[j].get('current_price') or 0.0 for j in options], dtype=np.float64)
+        units = np.divide(value[options], price, out=np.zeros(len(options)), where=price > 0)
+        shocked = value[options] + units * (after - before)
+        return np.where(np.isfinite(shocked), shocked, value[options])
+
+    def _day(self, date: str) -> int:
+        """Unix seconds at UTC midnight of a YYYY-MM-DD date (the daily closes' time base)."""
+        return int(pd.Timestamp(date).normalize().value // 10**9)
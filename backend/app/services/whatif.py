@@ -0,0 +1,133 @@
+import numpy as np
+from datetime import datetime
+from typing import Any, Dict, List
+from .engine import PortfolioEngine
+from .market import MarketDataService
+
+class WhatIfSimulator:
+    """
+    Batch what-if trades against the current portfolio.
+
+    Every scenario is a set of trades. All scenarios are laid out as one (scenarios x instruments)
+    quantity matrix, priced with a single batch quote call and the engine's live FX map. Leverage,
+    NAV, cash per currency, position weights and tiered margin interest then come out of a few
+    matrix operations for all scenarios at once.
+    """
+
+    MAX_SCENARIOS = 10_000
+
+    def __init__(self, engine: PortfolioEngine, market: MarketDataService):
+        self.engine = engine
+        self.market = market
+
+    async def evaluate(self, portfolio: Dict[str, Any], base: List[Dict[str, Any]],
+                       scenarios: List[List[Dict[str, Any]]], grid: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        portfolio: the /api/portfolio response. base trades apply to every scenario; each grid
+        entry adds one scenario per quantity. Trades: {symbol, quantity, price?, multiplier}.
+        """
+        scenarios = [list(s) for s in scenarios] + [
+            [{'symbol': g['symbol'], 'quantity': q, 'price': g.get('price'), 'multiplier': g.get('multiplier', 1.0)}]
+            for g in grid for q in g['quantities']
+        ]
+        if not scenarios:
+            scenarios = [[]]
+        if len(scenarios) > self.MAX_SCENARIOS:
+            return {'error': f"At most {self.MAX_SCENARIOS} scenarios per request"}
+        trades = [(i, {**t, 'symbol': t['symbol'].upper()}) for i, s in enumerate(scenarios) for t in base + s]
+
+        # 1. One quote batch and one FX map for every instrument involved
+        kpi = portfolio['kpi']
+        cash_balances = kpi.get('cash_balances', [])
+        symbols = list(dict.fromkeys(t['symbol'] for _, t in trades))
+        quotes = await self.market.get_live_prices(symbols) if symbols else {}
+        held = {p['symbol']: p for p in portfolio['positions']}
+
+        marks = np.array([self._mark(s, quotes, held) for s in symbols], dtype=np.float64)
+        currencies = [(quotes.get(s) or {}).get('currency') or (held.get(s) or {}).get('currency') or "USD"
+                      for s in symbols]
+        cash_currencies = list(dict.fromkeys([cb['currency'] for cb in cash_balances] + currencies))
+        fx_map = await self.engine.live_fx_map(cash_currencies)
+        today = datetime.now().strftime("%Y-%m-%d")
+        to_czk = np.array([1.0 if c == 'CZK' else fx_map.get((c, today, 'CZK'), 1.0) for c in cash_currencies])
+        to_usd = np.array([1.0 if c == 'USD' else fx_map.get((c, today, 'USD'), 1.0) for c in cash_currencies])
+        # Instrument -> its cash currency column
+        column = np.array([cash_currencies.index(c) for c in currencies], dtype=np.int64)
+
+        # 2. Scenario x instrument quantities and traded notional (native, incl. multiplier)
+        n, m = len(scenarios), len(symbols)
+        index = {s: j for j, s in enumerate(symbols)}
+        rows = np.array([i for i, _ in trades], dtype=np.int64)
+        cols = np.array([index[t['symbol']] for _, t in trades], dtype=np.int64)
+        units = np.array([t['quantity'] * (t.get('multiplier') or 1.0) for _, t in trades], dtype=np.float64)
+        fills = np.array([t['price'] if t.get('price') else np.nan for _, t in trades], dtype=np.float64)
+        fills = np.where(np.isnan(fills), marks[cols], fills)
+        priced = np.isfinite(fills) & (fills > 0)
+        missing = sorted({symbols[j] for j in cols[~priced]})
+
+        quantity = np.zeros((n, m))
+        notional = np.zeros((n, m))
+        np.add.at(quantity, (rows[priced], cols[priced]), units[priced])
+        np.add.at(notional, (rows[priced], cols[priced]), (units * fills)[priced])
+        marks = np.where(np.isfinite(marks), marks, 0.0)
+
+        # 3. Cash per currency: buys debit (sells credit) the instrument's currency
+        onehot = np.zeros((m, len(cash_currencies)))
+        onehot[np.arange(m), column] = 1.0
+        cash0 = np.zeros(len(cash_currencies))
+        for cb in cash_balances:
+            cash0[cash_currencies.index(cb['currency'])] += cb['amount']
+        cash = cash0 - notional @ onehot
+
+        # 4. Market values, gross exposure, NAV and leverage (USD like the KPI, CZK alongside)
+        delta_native = quantity * marks
+        result_ccy = {}
+        for ccy, rate, held_key in (('usd', to_usd, 'market_value_usd'), ('czk', to_czk, 'market_value_czk')):
+            existing = np.array([(held.get(s) or {}).get(held_key, 0.0) for s in symbols], dtype=np.float64)
+            inst_rate = rate[column]
+            value = existing + delta_native * inst_rate
+            gross = kpi.get(f'gross_position_{ccy}', 0.0) + (np.abs(value) - np.abs(existing)).sum(axis=1)
+            # Trading at a fill other than the mark moves NAV by the difference
+            nav = kpi.get(f'net_liquidity_{ccy}', 0.0) + ((delta_native - notional) * inst_rate).sum(axis=1)
+            result_ccy[ccy] = {'value': value, 'gross': gross, 'nav': nav}
+
+        nav_usd, nav_czk = result_ccy['usd']['nav'], result_ccy['czk']['nav']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            leverage = np.where(nav_usd != 0, result_ccy['usd']['gross'] / nav_usd, 0.0)
+            weights = np.where(nav_czk[:, None] > 0, result_ccy['czk']['value'] / nav_czk[:, None] * 100, 0.0)
+
+        # 5. Tiered margin interest on every negative balance
+        daily_native = np.zeros(cash.shape)
+        for k, c in enumerate(cash_currencies):
+            daily_native[:, k] = self.engine.margin.calculate_daily_costs(c, cash[:, k])
+        daily_czk = daily_native @ to_czk
+
+        return {
+            'as_of': today,
+            'scenarios': n,
+            'trades': scenarios,
+            'quotes': {s: {'price': float(p), 'currency': c, 'found': s in quotes,
+                           'stale': (quotes.get(s) or {}).get('stale', False)}
+                       for s, p, c in zip(symbols, marks, currencies)},
+            'missing': missing,
+            'current': {'leverage': kpi.get('leverage', 0.0), 'net_liquidity_czk': kpi.get('net_liquidity_czk', 0.0),
+                        'daily_interest_czk': float(sum(cb.get('daily_interest_czk', 0) for cb in cash_balances))},
+            # Columnar: one value per scenario
+            'leverage': leverage,
+            'net_liquidity_usd': nav_usd,
+            'net_liquidity_czk': nav_czk,
+            'gross_position_usd': result_ccy['usd']['gross'],
+            'gross_position_czk': result_ccy['czk']['gross'],
+            'cost_czk': (notional * to_czk[column]).sum(axis=1),
+            'cash': {c: cash[:, k] for k, c in enumerate(cash_currencies)},
+            'cash_usd': cash @ to_usd,
+            'cash_czk': cash @ to_czk,
+            'weights': {s: weights[:, j] for j, s in enumerate(symbols)},
+            'daily_interest_czk': daily_czk,
+            'interest': {c: daily_native[:, k] for k, c in enumerate(cash_currencies)},
+        }
+
+    def _mark(self, symbol: str, quotes: Dict[str, Dict[str, Any]], held: Dict[str, Dict[str, Any]]) -> float:
+        """Live price, else the held position's current price; NaN when neither is known."""
+        price = (quotes.get(symbol) or {}).get('price') or (held.get(symbol) or {}).get('current_price')
+        return float(price) if price else np.nan
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the backend as the `app` package (same as `uvicorn app.main:app` from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
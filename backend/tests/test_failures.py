@@ -0,0 +1,35 @@
+import time
+from app.services.failures import FailureRegistry
+
+
+def test_network_failures_keep_network_backoff(tmp_path):
+    registry = FailureRegistry(str(tmp_path))
+    for _ in range(6):
+        before = time.time()
+        entry = registry.record("AAPL", "network", "timeout")
+
+    # 60 s doubling: 60 * 2**5 = 1920 s, well under the 1 h network cap - never the 7 day not_found backoff
+    assert entry['kind'] == "network"
+    assert entry['count'] == 6
+    assert before + 1920 <= entry['retry_at'] <= time.time() + 1920
+    registry.close()
+
+
+def test_network_backoff_is_capped(tmp_path):
+    registry = FailureRegistry(str(tmp_path))
+    for _ in range(20):
+        entry = registry.record("AAPL", "network")
+    assert entry['retry_at'] - entry['last_failed'] == FailureRegistry.BACKOFF["network"][1]
+    registry.close()
+
+
+def test_kind_change_restarts_backoff(tmp_path):
+    registry = FailureRegistry(str(tmp_path))
+    for _ in range(5):
+        registry.record("XYZ", "network")
+    entry = registry.record("XYZ", "not_found", "no data returned")
+
+    assert entry['kind'] == "not_found"
+    assert entry['count'] == 1
+    assert entry['retry_at'] - entry['last_failed'] == FailureRegistry.BACKOFF["not_found"][0]
+    registry.close()
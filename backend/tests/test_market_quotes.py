@@ -0,0 +1,74 @@
+import asyncio
+import numpy as np
+import pandas as pd
+from app.services import market as market_module
+from app.services.market import MarketDataService
+
+
+def _download(calls):
+    def download(symbols, period, **kwargs):
+        calls.append(period)
+        days = 250 if period == "1y" else 5
+        index = pd.bdate_range("2024-01-01", periods=days)
+        closes = np.linspace(100.0, 120.0, days)
+        frames = {s: pd.DataFrame({'Open': closes, 'High': closes + 1, 'Low': closes - 1, 'Close': closes,
+                                   'Volume': 1.0}, index=index) for s in symbols}
+        return pd.concat(frames, axis=1)
+    return download
+
+
+class FakeTicker:
+    def __init__(self, symbol):
+        self.fast_info = {'currency': 'USD' if symbol.endswith('.L') else 'GBp'}
+
+
+def _market(tmp_path, monkeypatch, calls):
+    monkeypatch.setattr(market_module.yf, "download", _download(calls))
+    monkeypatch.setattr(market_module.yf, "Ticker", FakeTicker)
+    return MarketDataService(cache_file=str(tmp_path / "market_cache.json"))
+
+
+def _close(market):
+    for cache in (market.cache, market.failures, market.instruments, market.quote_reference):
+        cache.close()
+
+
+def test_52_week_range_downloaded_once_per_day(tmp_path, monkeypatch):
+    calls = []
+    market = _market(tmp_path, monkeypatch, calls)
+    first = market._fetch_quotes_batch(["AAA.L"])
+    second = market._fetch_quotes_batch(["AAA.L"])
+
+    assert calls == ["1y", "5d", "5d"]
+    assert first == second
+    assert first["AAA.L"]['high52'] == 121.0 and first["AAA.L"]['low52'] == 99.0
+    _close(market)
+
+
+def test_quote_currency_as_reported(tmp_path, monkeypatch):
+    market = _market(tmp_path, monkeypatch, [])
+    quotes = market._fetch_quotes_batch(["USDX.L", "PENCE"])
+
+    # A USD line on the LSE is not divided by 100; a pence quote is
+    assert quotes["USDX.L"]['currency'] == 'USD' and quotes["USDX.L"]['price'] == 120.0
+    assert quotes["PENCE"]['currency'] == 'GBP' and quotes["PENCE"]['price'] == 1.2
+    _close(market)
+
+
+def test_fx_pair_currency_without_lookup(tmp_path, monkeypatch):
+    market = _market(tmp_path, monkeypatch, [])
+    assert market._quote_currency("EURCZK=X") == 'CZK'
+    assert market._quote_currency("EUR=X") == 'EUR'
+    _close(market)
+
+
+def test_failing_options_take_the_long_backoff(tmp_path, monkeypatch):
+    market = _market(tmp_path, monkeypatch, [])
+    monkeypatch.setattr(market_module.yf, "download", lambda *args, **kwargs: pd.DataFrame())
+    market.MIN_DELAY = 0
+    asyncio.run(market._fetch_live_prices(["SOFI 20FEB27 26 C", "AAPL"]))
+
+    # The whole batch came back empty: transient for a stock, but the option is model-marked meanwhile
+    assert market.failures.entries["SOFI 20FEB27 26 C"]['kind'] == 'not_found'
+    assert market.failures.entries["AAPL"]['kind'] == 'network'
+    _close(market)
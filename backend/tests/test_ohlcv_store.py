@@ -0,0 +1,80 @@
+import asyncio
+import numpy as np
+import pandas as pd
+from app.services import market as market_module
+from app.services.market import MarketDataService
+from app.services.ohlcv_store import OHLCVStore
+
+
+def _bars(start, closes):
+    index = pd.bdate_range(start, periods=len(closes))
+    closes = np.asarray(closes, dtype=np.float64)
+    return pd.DataFrame({'Open': closes, 'High': closes, 'Low': closes, 'Close': closes, 'Volume': 1.0}, index=index)
+
+
+def test_append_extends_consistent_history(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    store.merge("AAA", "1d", _bars("2024-01-01", [10, 11, 12, 13]), period="max")
+    # Overlap from the second-to-last bar; the last (forming) bar may have moved
+    series = store.merge("AAA", "1d", _bars("2024-01-03", [12, 13.5, 14]))
+    np.testing.assert_array_equal(series['close'], [10, 11, 12, 13.5, 14])
+
+
+def test_append_refused_after_split(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    store.merge("AAA", "1d", _bars("2024-01-01", [10, 11, 12, 13]), period="max")
+    # 2:1 split: Yahoo now reports every past close halved
+    assert store.merge("AAA", "1d", _bars("2024-01-03", [6, 6.5, 7])) is None
+    np.testing.assert_array_equal(store.get("AAA", "1d")['close'], [10, 11, 12, 13])
+
+
+class FakeTicker:
+    """Full history is split-adjusted 2:1 from the second fetch on."""
+    calls = []
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def history(self, **params):
+        FakeTicker.calls.append(params)
+        closes = np.array([10, 11, 12, 13, 14], dtype=np.float64)
+        if len(FakeTicker.calls) > 1:
+            closes = closes / 2
+        full = _bars("2024-01-01", closes)
+        return full[full.index >= params['start']] if 'start' in params else full
+
+
+def test_refresh_refetches_readjusted_series(tmp_path, monkeypatch):
+    monkeypatch.setattr(market_module.yf, "Ticker", FakeTicker)
+    FakeTicker.calls = []
+    market = MarketDataService(cache_file=str(tmp_path / "market_cache.json"))
+    market.MIN_DELAY = 0
+    monkeypatch.setattr(market.hours, "expires_at", lambda *args: 0)
+
+    first = asyncio.run(market._refresh_series("AAA", "1d", "max", 3600))
+    np.testing.assert_array_equal(first['close'], [10, 11, 12, 13, 14])
+    second = asyncio.run(market._refresh_series("AAA", "1d", "max", 3600))
+
+    assert 'start' in FakeTicker.calls[1] and FakeTicker.calls[2] == {"period": "max", "interval": "1d"}
+    np.testing.assert_array_equal(second['close'], [5, 5.5, 6, 6.5, 7])
+    market.cache.close()
+    market.failures.close()
+
+
+def _sessions(start, days):
+    """5m bars, 14:30-15:00 UTC, on `days` consecutive business days."""
+    index = pd.DatetimeIndex([t for day in pd.bdate_range(start, periods=days, tz="UTC")
+                              for t in pd.date_range(day + pd.Timedelta("14:30:00"), periods=7, freq="5min")])
+    closes = np.arange(len(index), dtype=np.float64) + 10
+    return pd.DataFrame({'Open': closes, 'High': closes, 'Low': closes, 'Close': closes, 'Volume': 1.0}, index=index)
+
+
+def test_intraday_appends_keep_the_period_window(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    full = _sessions("2024-01-01", 6)
+    store.merge("AAA", "5m", full.iloc[:35], period="5d")
+    series = store.merge("AAA", "5m", full.iloc[34:])  # Overlapping append of a sixth session
+
+    days = np.unique(series['time'] // 86400)
+    assert len(days) == 5
+    assert series['close'][-1] == full['Close'].iloc[-1]
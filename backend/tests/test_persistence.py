@@ -0,0 +1,65 @@
+import json
+import os
+import numpy as np
+from app.services.market import MarketDataService
+from app.services.ohlcv_store import OHLCVStore
+from app.services.persistence import WriteBehindCache
+
+
+def _cache(directory):
+    return WriteBehindCache(str(directory), lambda key: key.split(":")[0], flush_interval=3600)
+
+
+def test_segments_that_sanitize_alike_stay_apart(tmp_path):
+    cache = _cache(tmp_path)
+    cache["BRK.B:1d"] = 1
+    cache["BRK_B:1d"] = 2
+    cache.close()
+
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(cache._segment_path(s)) for s in ("BRK.B", "BRK_B"))
+    reloaded = _cache(tmp_path)
+    assert reloaded["BRK.B:1d"] == 1 and reloaded["BRK_B:1d"] == 2
+    reloaded.close()
+
+
+def test_old_segment_files_are_rewritten_under_the_new_name(tmp_path):
+    with open(tmp_path / "BRK_B.json", "w") as f:
+        json.dump({"BRK.B:1d": 1}, f)
+
+    cache = _cache(tmp_path)
+    assert cache["BRK.B:1d"] == 1
+    cache.close()
+    assert os.listdir(tmp_path) == [os.path.basename(cache._segment_path("BRK.B"))]
+
+
+def test_ohlcv_symbols_that_sanitize_alike_stay_apart(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    for symbol, close in (("SPY 30JUN27 660 P", 1.0), ("SPY_30JUN27_660_P", 2.0)):
+        bars = {c: np.array([0.0 if c == 'time' else close]) for c in OHLCVStore.COLUMNS}
+        store._save(symbol, "1d", {**bars, 'fetched_at': 0.0, 'period': "max"})
+
+    fresh = OHLCVStore(str(tmp_path))
+    assert fresh.get("SPY 30JUN27 660 P", "1d")['close'][0] == 1.0
+    assert fresh.get("SPY_30JUN27_660_P", "1d")['close'][0] == 2.0
+    assert not [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]
+
+
+def test_ohlcv_adopts_unambiguous_old_files(tmp_path):
+    bars = {c: np.array([1.0]) for c in OHLCVStore.COLUMNS}
+    np.savez(tmp_path / "AAPL_1d.npz", fetched_at=np.float64(0), period=np.str_("max"), **bars)
+
+    store = OHLCVStore(str(tmp_path))
+    assert store.get("AAPL", "1d")['close'][0] == 1.0
+    assert os.listdir(tmp_path) == [os.path.basename(store._path("AAPL", "1d"))]
+    assert store.stats()['disk_series'] == 1
+
+
+def test_quote_updates_only_rewrite_their_bucket(tmp_path):
+    cache = WriteBehindCache(str(tmp_path), MarketDataService._cache_segment, flush_interval=3600)
+    for i in range(200):
+        cache[f"SYM{i}"] = {'data': {'price': float(i)}}
+    assert cache.flush() == 16
+
+    cache["SYM7"] = {'data': {'price': 8.0}}
+    assert cache.flush() == 1
+    cache.close()
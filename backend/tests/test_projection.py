@@ -0,0 +1,65 @@
+import asyncio
+import numpy as np
+from fastapi.testclient import TestClient
+import app.main as main
+from app.services.margin import MarginService
+from app.services.projection import LeverageProjection
+
+
+class FakeRisk:
+    """Returns matrix stub: one volatile long holding."""
+    PERIODS = {'1y': 365}
+
+    def __init__(self, returns):
+        self._returns = returns
+
+    async def returns(self, positions, period="1y", benchmark=None):
+        return {
+            'positions': positions,
+            'values': np.array([p['market_value_czk'] for p in positions]),
+            'filled': self._returns,
+            'excluded': [],
+        }
+
+
+def _portfolio(nav, gross):
+    return {
+        'kpi': {'net_liquidity_czk': nav, 'gross_position_czk': gross, 'cash_balances': []},
+        'positions': [{'symbol': "LEV", 'market_value_czk': gross, 'region': "North America"}],
+    }
+
+
+def test_depleting_book_keeps_leverage_distribution():
+    # 3x levered book on a stock with ~5% daily moves: most paths wipe out NAV within a year
+    rng = np.random.default_rng(0)
+    projection = LeverageProjection(FakeRisk(rng.normal(-0.002, 0.05, (250, 1))), MarginService())
+    result = asyncio.run(projection.simulate(_portfolio(1_000_000.0, 3_000_000.0), horizon=250, paths=2000,
+                                             thresholds=(5.0,), seed=1))
+
+    depleted = result['probabilities']['nav_depleted']
+    assert depleted > 0.3
+    # Probabilities stay on the raw paths: a depleted path has crossed every threshold
+    assert result['probabilities']['thresholds'][0]['ever'] >= depleted
+    # Distributions are over solvent paths and stay finite
+    assert np.isfinite(result['final']['max_leverage']).all()
+    assert np.isfinite(result['leverage'][:, :50]).all()
+    assert result['final']['depleted'] > 0
+    assert result['depleted'][0] == 0
+    assert result['depleted'].max() <= depleted
+
+
+def test_seeded_runs_are_reproducible():
+    rng = np.random.default_rng(0)
+    projection = LeverageProjection(FakeRisk(rng.normal(0, 0.01, (250, 1))), MarginService())
+    a = asyncio.run(projection.simulate(_portfolio(1_000_000.0, 1_500_000.0), paths=500, seed=7))
+    b = asyncio.run(projection.simulate(_portfolio(1_000_000.0, 1_500_000.0), paths=500, seed=7))
+    np.testing.assert_array_equal(a['nav_czk'], b['nav_czk'])
+
+
+def test_oversized_runs_are_refused():
+    projection = LeverageProjection(FakeRisk(np.zeros((250, 1))), MarginService())
+    result = asyncio.run(projection.simulate(_portfolio(1_000_000.0, 1_000_000.0), horizon=756, paths=50_000))
+    assert 'error' in result
+
+    response = TestClient(main.app).get("/api/projection", params={"paths": 50_000, "horizon": 756})
+    assert response.status_code == 400
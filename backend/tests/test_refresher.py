@@ -0,0 +1,26 @@
+import asyncio
+import threading
+from app.services.refresher import PriceRefresher
+
+
+class FakeMarket:
+    cache_expiry_minutes = 15
+
+    def expiring(self, symbols, within):
+        return []
+
+    async def enrich_instruments(self, symbols):
+        self.enriched = symbols
+
+
+def test_symbol_source_runs_off_the_event_loop():
+    threads = []
+
+    def source():
+        threads.append(threading.current_thread())
+        return ["AAPL", "AAPL", "", "EURCZK=X"]
+
+    market = FakeMarket()
+    assert asyncio.run(PriceRefresher(market, source).refresh_once()) == 0
+    assert threads and threads[0] is not threading.main_thread()
+    assert market.enriched == ["AAPL", "EURCZK=X"]
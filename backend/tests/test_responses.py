@@ -0,0 +1,10 @@
+import numpy as np
+import pandas as pd
+from app.responses import dumps
+
+
+def test_dumps_encodes_missing_values_as_null():
+    body = {'nav': np.array([1.5, np.nan, np.inf]), 'count': np.int64(3), 'price': float('nan'),
+            'as_of': pd.Timestamp("2024-01-02"), 'tags': {'a'}, 1: np.float32(0.5)}
+    assert dumps(body) == (b'{"nav":[1.5,null,null],"count":3,"price":null,'
+                           b'"as_of":"2024-01-02T00:00:00","tags":["a"],"1":0.5}')
@@ -0,0 +1,75 @@
+import asyncio
+import numpy as np
+import pandas as pd
+from app.services.risk import RiskService
+
+DAYS = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=1400)
+TIMES = DAYS.values.astype('datetime64[s]').astype(np.int64)
+
+
+class FakeMarket:
+    """Daily closes in CZK: benchmark random walk, OLD and NEW = 1.0 x benchmark + noise; NEW listed 60 days ago."""
+
+    def __init__(self):
+        rng = np.random.default_rng(3)
+        bench = rng.normal(0, 0.01, len(DAYS))
+        self.returns = {
+            'SPY': bench,
+            'OLD': bench + rng.normal(0, 0.015, len(DAYS)),
+            'NEW': bench + rng.normal(0, 0.015, len(DAYS)),
+        }
+        self.calls = 0
+
+    async def get_daily_closes(self, symbol):
+        self.calls += 1
+        close = 100 * np.cumprod(1 + self.returns[symbol])
+        listed = slice(-61, None) if symbol == 'NEW' else slice(None)
+        return {'time': TIMES[listed], 'close': close[listed], 'currency': 'CZK'}
+
+
+class FakeForex:
+    def get_rate_history(self, currencies, start, end):
+        return pd.DataFrame()
+
+
+def _positions(scale=1.0):
+    return [{'symbol': s, 'market_value_czk': 100_000.0 * scale, 'region': "Europe"} for s in ('OLD', 'NEW')]
+
+
+def test_short_history_is_not_diluted():
+    risk = RiskService(FakeMarket(), FakeForex())
+    result = asyncio.run(risk.analyze(_positions(), period="5y"))
+    stats = {p['symbol']: p for p in result['positions']}
+
+    true_vol = np.sqrt(0.01 ** 2 + 0.015 ** 2) * np.sqrt(252)
+    assert stats['NEW']['observations'] == 60
+    # Zero-filling the ~1200 unlisted days would shrink NEW's vol ~4.5x and its beta toward 0
+    assert abs(stats['NEW']['volatility'] / true_vol - 1) < 0.3
+    assert abs(stats['NEW']['beta'] - 1) < 0.4
+    assert abs(stats['OLD']['volatility'] / true_vol - 1) < 0.1
+
+
+def test_cached_czk_amounts_follow_current_value():
+    market = FakeMarket()
+    risk = RiskService(market, FakeForex())
+    first = asyncio.run(risk.analyze(_positions(), files_hash="h", period="1y"))
+    calls = market.calls
+    second = asyncio.run(risk.analyze(_positions(scale=2.0), files_hash="h", period="1y"))
+
+    assert market.calls == calls  # Served from the cache
+    assert second['value_czk'] == 2 * first['value_czk']
+    for measure in ('var', 'cvar'):
+        for label, levels in first['portfolio'][measure].items():
+            assert second['portfolio'][measure][label]['historical'] == levels['historical']
+            assert np.isclose(second['portfolio'][measure][label]['historical_czk'], 2 * levels['historical_czk'])
+
+
+def test_unpriced_lines_are_excluded():
+    positions = _positions() + [{'symbol': 'SPY', 'market_value_czk': float('nan'), 'region': "North America"}]
+    result = asyncio.run(RiskService(FakeMarket(), FakeForex()).analyze(positions, period="1y"))
+
+    assert {'symbol': 'SPY', 'reason': "no market value"} in result['excluded']
+    assert [p['symbol'] for p in result['positions']] == ['OLD', 'NEW']
+    assert np.isfinite(result['value_czk'])
+    for levels in result['portfolio']['var'].values():
+        assert np.isfinite(levels['historical_czk']) and np.isfinite(levels['parametric_czk'])
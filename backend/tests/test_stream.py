@@ -0,0 +1,106 @@
+import asyncio
+import json
+import numpy as np
+import app.main as main
+
+
+def _portfolio(prices):
+    return {"kpi": {"net_liquidity_czk": sum(prices)}, "fx_rates": {},
+            "positions": [{"symbol": "AAA", "row": i, "current_price": p} for i, p in enumerate(prices)]}
+
+
+def test_diff_keeps_duplicate_symbol_rows_apart():
+    delta = main.engine.diff(_portfolio([10.0, 20.0]), _portfolio([10.0, 21.0]))
+    assert delta["positions"] == {"1": {"current_price": 21.0}}
+    assert delta["order"] is None
+    assert main.engine.diff(_portfolio([10.0, 20.0]), _portfolio([10.0])) is None
+
+
+def test_diff_reorders_instead_of_resending_when_ranks_swap():
+    previous = _portfolio([30.0, 20.0])
+    current = _portfolio([30.0, 35.0])
+    current["positions"].reverse()  # Sorted by value: row 1 now ranks first
+
+    delta = main.engine.diff(previous, current)
+    assert delta["positions"] == {"1": {"current_price": 35.0}}
+    assert delta["order"] == [1, 0]
+
+
+def test_stream_computes_once_per_generation_and_pushes_uploads(monkeypatch):
+    computed = []
+
+    async def compute():
+        computed.append(main.market.generation)
+        return _portfolio([10.0 + main.market.generation, 20.0 + main._stream["uploads"]])
+
+    monkeypatch.setattr(main, "_compute_portfolio", compute)
+
+    async def notify(condition):
+        async with condition:
+            condition.notify_all()
+
+    async def run():
+        clients = [(await main.stream_portfolio()).body_iterator for _ in range(3)]
+        snapshots = [await c.__anext__() for c in clients]
+        assert all(s.startswith("event: snapshot") for s in snapshots)
+
+        pending = [asyncio.ensure_future(c.__anext__()) for c in clients]
+        await asyncio.sleep(0)
+        main.market.generation += 1
+        await notify(main.market._updated)
+        deltas = await asyncio.gather(*pending)
+        assert len(set(deltas)) == 1 and deltas[0].startswith("event: delta")
+        assert json.loads(deltas[0].split("data: ", 1)[1])["positions"] == {"0": {"current_price": 11.0}}
+
+        pending = [asyncio.ensure_future(c.__anext__()) for c in clients]
+        await asyncio.sleep(0)
+        main._stream["uploads"] += 1
+        await notify(main._uploaded)
+        pushed = await asyncio.gather(*pending)
+        assert json.loads(pushed[0].split("data: ", 1)[1])["positions"] == {"1": {"current_price": 21.0}}
+
+        for c in clients:
+            await c.aclose()
+
+    asyncio.run(run())
+    assert len(computed) == 3  # Initial snapshot, quote update, upload - shared by all clients
+
+
+def test_portfolio_etag_follows_only_valuation_inputs(monkeypatch):
+    monkeypatch.setattr(main.market, "cache", {"AAA": {"data": {"price": 10.0}, "timestamp": "2024-01-02T10:00:00"}})
+    monkeypatch.setattr(main.forex, "cache", {})
+    monkeypatch.setattr(main.engine, "valuation_symbols", ["AAA", "HKDCZK=X"])
+    monkeypatch.setattr(main.engine, "valuation_fx_missing", ["HKD_CZK_2024-01-02"])
+    etag = main._portfolio_validators()["ETag"]
+
+    # FX fetched for other requests, a watchlist quote
+    main.forex.cache["EUR_CZK_2023-05-05"] = 24.5
+    main.market.cache["WATCH"] = {"data": {"price": 1.0}, "timestamp": "2024-01-02T10:05:00"}
+    assert main._portfolio_validators()["ETag"] == etag
+
+    # A refetch at the same price moves price_as_of, so the body changes too
+    main.market.cache["AAA"] = {"data": {"price": 10.0}, "timestamp": "2024-01-02T10:05:00"}
+    refetched = main._portfolio_validators()["ETag"]
+    assert refetched != etag
+    main.market.cache["AAA"] = {"data": {"price": 10.5}, "timestamp": "2024-01-02T10:10:00"}
+    moved = main._portfolio_validators()["ETag"]
+    assert moved != refetched
+    main.forex.cache["HKD_CZK_2024-01-02"] = 2.9  # A rate the valuation lacked has arrived
+    assert main._portfolio_validators()["ETag"] != moved
+
+
+def test_watchlist_stream_encodes_numpy_values(monkeypatch):
+    async def watchlist_data(symbol, range_period):
+        return {"symbol": symbol, "price": np.float64(12.5), "change_pct": float("nan"), "volume": np.int64(7)}
+
+    monkeypatch.setattr(main.store, "get_watchlist", lambda: ["AAA"])
+    monkeypatch.setattr(main.market, "has_fresh_series", lambda symbol, range_period: True)
+    monkeypatch.setattr(main.market, "get_watchlist_data", watchlist_data)
+
+    async def run():
+        events = [event async for event in (await main.stream_watchlist()).body_iterator]
+        assert json.loads(events[0].split("data: ", 1)[1]) == {"symbol": "AAA", "price": 12.5, "change_pct": None,
+                                                               "volume": 7}
+        assert events[-1].startswith("event: DONE")
+
+    asyncio.run(run())
@@ -45,6 +45,7 @@ export interface KPI {
 
 export interface Position {
     symbol: string;
+    row?: number;  // Statement row: identifies the position across live updates
     currency: string;
     quantity: number;
     current_price?: number;
@@ -83,12 +84,17 @@ export interface Position {
     is_simulated?: boolean;
     recon_match?: boolean;
     price_source?: string;
+    price_as_of?: string | null;  // When the live quote was fetched (ISO, stale-while-revalidate)
 
     meta?: MetaData; // Deprecated but kept for compatibility if needed
 
     // Geographical
     region?: string;
     country?: string;
+
+    // Classification (instrument table)
+    sector?: string | null;
+    industry?: string | null;
 }
 
 export interface PortfolioData {
@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect } from "react";
+import { useState, useEffect, useMemo } from "react";
 import useSWR from "swr";
 import { DetailChart, Measurement } from "./DetailChart";
 import { LucideX, LucideLoader2, LucideRuler } from "lucide-react";
@@ -13,6 +13,20 @@ interface ChartModalProps {
 
 const fetcher = (url: string) => fetch(url).then((res) => res.json());
 
+// Columnar OHLCV payload (parallel arrays) -> candle & volume series for the chart
+const fromColumnar = (data: any) => {
+    if (!data || data.error || data.format !== "columnar") return data;
+    const candles = data.time.map((time: any, i: number) => ({
+        time, open: data.open[i], high: data.high[i], low: data.low[i], close: data.close[i], volume: data.volume[i]
+    }));
+    const volume = data.time.map((time: any, i: number) => ({
+        time,
+        value: data.volume[i],
+        color: data.close[i] >= data.open[i] ? 'rgba(34, 197, 94, 0.56)' : 'rgba(239, 68, 68, 0.56)'
+    }));
+    return { symbol: data.symbol, candles, volume };
+};
+
 const RANGES = ["1d", "1w", "1m", "3m", "6m", "1y", "5y", "max"];
 
 import axios from "axios";
@@ -25,10 +39,11 @@ export function ChartModal({ symbol, onClose }: ChartModalProps) {
     const [selectedId, setSelectedId] = useState<string | null>(null);
     const [dataLoaded, setDataLoaded] = useState(false);
 
-    const { data, isLoading } = useSWR(
-        `http://localhost:8000/api/market-data/${symbol}/ohlcv?range=${range}`,
+    const { data: rawData, isLoading } = useSWR(
+        `http://localhost:8000/api/market-data/${symbol}/ohlcv?range=${range}&format=columnar`,
         fetcher
     );
+    const data = useMemo(() => fromColumnar(rawData), [rawData]);
 
     const { data: metadata } = useSWR(
         `http://localhost:8000/api/metadata/${symbol}`,
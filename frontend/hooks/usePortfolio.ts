@@ -1,21 +1,73 @@
 "use client";
 
-import { useState, useMemo } from "react";
+import { useState, useMemo, useEffect } from "react";
 import useSWR from "swr";
 import { PortfolioData, Position } from "../app/types";
 import { Simulation } from "../components/dashboard/SimulationPanel";
 
 const fetcher = (url: string) => fetch(url).then((res) => res.json());
+const postFetcher = ([url, body]: [string, string]) =>
+    fetch(url, { method: "POST", headers: { "Content-Type": "application/json" }, body }).then((res) => res.json());
+
+// Columnar /api/whatif response (one entry per scenario; the simulator sends a single one)
+interface WhatIfResponse {
+    leverage: number[];
+    net_liquidity_usd: number[];
+    net_liquidity_czk: number[];
+    cash_usd: number[];
+}
+
+type PortfolioResponse = PortfolioData & { status?: string };
+
+interface PortfolioDelta {
+    kpi: Partial<PortfolioData["kpi"]>;
+    positions: Record<string, Partial<Position>>;  // Keyed by index in the previous snapshot
+    fx_rates: Record<string, number>;
+    order: number[] | null;  // Previous index of each row in the new order (null: unchanged)
+}
+
+// Merge a price-driven delta from /api/portfolio/stream into the current snapshot
+const applyDelta = (prev: PortfolioResponse | undefined, delta: PortfolioDelta): PortfolioResponse | undefined => {
+    if (!prev) return prev;
+    const positions = prev.positions.map((p, i) => delta.positions[i] ? { ...p, ...delta.positions[i] } : p);
+    return {
+        ...prev,
+        kpi: { ...prev.kpi, ...delta.kpi },
+        fx_rates: { ...prev.fx_rates, ...delta.fx_rates },
+        positions: delta.order ? delta.order.map(i => positions[i]) : positions,
+    };
+};
 
 export function usePortfolio() {
-    const { data, error, isLoading, mutate } = useSWR<PortfolioData & { status?: string }>(
+    const { data, error, isLoading, mutate } = useSWR<PortfolioResponse>(
         "http://localhost:8000/api/portfolio",
-        fetcher,
-        { refreshInterval: 60000 }
+        fetcher
     );
 
+    // Live updates: full snapshot once, then per-position/KPI deltas when prices move
+    useEffect(() => {
+        const es = new EventSource("http://localhost:8000/api/portfolio/stream");
+        es.addEventListener("snapshot", (event) => {
+            mutate(JSON.parse((event as MessageEvent).data), { revalidate: false });
+        });
+        es.addEventListener("delta", (event) => {
+            const delta: PortfolioDelta = JSON.parse((event as MessageEvent).data);
+            mutate(prev => applyDelta(prev, delta), { revalidate: false });
+        });
+        return () => es.close();
+    }, [mutate]);
+
     const [simulations, setSimulations] = useState<Simulation[]>([]);
 
+    // Server-side what-if: live quotes and the engine's FX, tiered margin interest
+    const { data: whatIf } = useSWR<WhatIfResponse>(
+        simulations.length
+            ? ["http://localhost:8000/api/whatif",
+               JSON.stringify({ base: simulations.map(s => ({ symbol: s.symbol, quantity: s.quantity, price: s.price })) })]
+            : null,
+        postFetcher
+    );
+
     // 1. Base Stats
     const netLiqUsd = data?.kpi?.net_liquidity_usd || 1;
     const positions = data?.positions || [];
@@ -31,7 +83,7 @@ export function usePortfolio() {
 
     // Cash Impact
     const currentCashUsd = data?.kpi.cash_balance_usd || 0;
-    const projectedCashUsd = currentCashUsd - simCostUsd;
+    const projectedCashUsd = whatIf?.cash_usd?.[0] ?? (currentCashUsd - simCostUsd);
 
     // FX Rates (fx_rates has keys like "USD", "EUR", etc.)
     const usdCzkRate = data?.fx_rates?.["USD"] || 20.3;
@@ -39,18 +91,18 @@ export function usePortfolio() {
 
     // Net Liq - use backend CZK value directly for accuracy
     const netLiqCzk = data?.kpi?.net_liquidity_czk || (netLiqUsd * usdCzkRate);
-    const projectedNetLiqUsd = netLiqUsd;
+    const projectedNetLiqUsd = whatIf?.net_liquidity_usd?.[0] ?? netLiqUsd;
     // For simulations, we add/subtract in CZK
     const simMarketValCzk = simulations.reduce((acc, s) => {
         const rate = s.currency === "USD" ? usdCzkRate : (s.currency === "EUR" ? eurCzkRate : 1);
         return acc + (s.price * s.quantity * rate);
     }, 0);
-    const projectedNetLiqCzk = netLiqCzk; // Net Liq unchanged for pure purchase
+    const projectedNetLiqCzk = whatIf?.net_liquidity_czk?.[0] ?? netLiqCzk; // Unchanged for a purchase at market
 
     // Projected values for simulations
     // Simulations are assumed to be long positions, so they add to both net and gross
     const projectedGrossPositionUsd = grossPositionUsd + simMarketValUsd;
-    const projectedLeverage = projectedGrossPositionUsd / projectedNetLiqUsd;
+    const projectedLeverage = whatIf?.leverage?.[0] ?? (projectedGrossPositionUsd / projectedNetLiqUsd);
     const projectedPctInvested = ((currentMarketValUsd + simMarketValUsd) / projectedNetLiqUsd) * 100;
 
     // 3. Merged Positions Calculation